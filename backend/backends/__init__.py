@@ -0,0 +1,18 @@
+import importlib
+
+# Database backends. Each module provides:
+#   name            dialect name ("mssql" or "sqlite")
+#   connect()       open a read/write connection with the aioodbc interface
+#   connect_read()  open a read-only connection
+#   prepare()       create whatever the backend needs before the pool opens
+BACKENDS = {
+    "mssql": "backends.mssql",
+    "sqlite": "backends.sqlite",
+}
+
+
+def get_backend(name):
+    try:
+        return importlib.import_module(BACKENDS[name.lower()])
+    except KeyError:
+        raise ValueError(f"Unknown DB_BACKEND '{name}'. Expected one of: {', '.join(BACKENDS)}")
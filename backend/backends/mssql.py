@@ -0,0 +1,54 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+name = "mssql"
+
+# Get database configuration from environment variables
+server = os.getenv("DB_SERVER")
+database = os.getenv("DB_NAME")
+username = os.getenv("DB_USER")
+password = os.getenv("DB_PASSWORD")
+driver = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")  # Default to ODBC Driver 17
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 30))
+DB_READ_SERVER = os.getenv("DB_READ_SERVER") or server  # read scale-out uses the primary's server name
+
+
+def build_dsn(read_only=False):
+    dsn = (
+        f"DRIVER={{{driver}}};"
+        f"SERVER={DB_READ_SERVER if read_only else server};"
+        f"DATABASE={database};"
+        f"UID={username};"
+        f"PWD={password};"
+        f"Encrypt=yes;"
+        f"TrustServerCertificate=no;"
+    )
+    if read_only:
+        dsn += "ApplicationIntent=ReadOnly;"
+    return dsn
+
+
+async def prepare():
+    """The Azure database is provisioned separately; nothing to do."""
+
+
+# Open a new physical connection
+async def connect():
+    import aioodbc
+
+    # Transactions are explicit: handlers commit, the pool rolls back whatever is left on release
+    return await aioodbc.connect(dsn=build_dsn(), autocommit=False, timeout=DB_CONNECT_TIMEOUT)
+
+
+# Open a read-only connection to the replica
+async def connect_read():
+    import aioodbc
+
+    conn = await aioodbc.connect(dsn=build_dsn(read_only=True), autocommit=True, timeout=DB_CONNECT_TIMEOUT)
+    async with conn.cursor() as cursor:
+        # every statement reads a consistent snapshot and takes no shared locks
+        await cursor.execute("SET TRANSACTION ISOLATION LEVEL SNAPSHOT")
+    return conn
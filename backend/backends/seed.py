@@ -0,0 +1,173 @@
+"""Seed the local SQLite database with a realistic catalog and order book.
+
+Run from backend/:  python -m backends.seed --variants 100000 [--path vms_local.db] [--reset]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import string
+import time
+from datetime import datetime, timedelta
+
+import groups
+from backends import sqlite as sqlite_backend
+
+CATEGORIES = [
+    "Women's Leather Shoes",
+    "Men's Leather Shoes",
+    "Girl's Leather Shoes",
+    "Boy's Leather Shoes",
+]
+STYLES = ["Oxford", "Loafer", "Derby", "Brogue", "Monk Strap", "Chelsea Boot", "Mary Jane", "Ballet Flat", "Pump", "Moccasin"]
+FINISHES = ["Classic", "Heritage", "Urban", "Premium", "Everyday", "Weekend", "Office", "Suede", "Patent", "Vintage"]
+COLORS = ["Black", "Brown", "Tan", "Oxblood", "White", "Navy"]
+SIZES = [str(size) for size in range(35, 46)]
+ORDER_STATUSES = ["Pending", "Confirmed", "To Ship", "Delivered", "Received"]
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench123"
+
+
+def _code(rng, length):
+    return "".join(rng.choices(string.ascii_uppercase + string.digits, k=length))
+
+
+def seed(path=None, variants=10_000, units_per_size=20, orders=None, lines_per_order=3, rng_seed=42, reset=False):
+    """Create the schema and fill it; returns a dict of row counts."""
+    path = path or sqlite_backend.SQLITE_PATH
+    if reset and os.path.exists(path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    sqlite_backend.create_schema(path)
+
+    rng = random.Random(rng_seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    now = datetime.utcnow().replace(microsecond=0)
+    counts = {}
+    try:
+        # one product row per (style, size); each size carries units_per_size variants,
+        # each style is a product group (see groups.py)
+        product_rows = max(1, variants // units_per_size)
+        products = []
+        product_groups = {}
+        for index in range(product_rows):
+            group, size_index = divmod(index, len(SIZES))
+            category = CATEGORIES[group % len(CATEGORIES)]
+            name = f"{FINISHES[(group // len(STYLES)) % len(FINISHES)]} {STYLES[group % len(STYLES)]} {group}"
+            group_id = product_groups.setdefault((name, category), len(product_groups) + 1)
+            products.append((
+                name,
+                f"{name} in full-grain leather",
+                SIZES[size_index],
+                COLORS[group % len(COLORS)],
+                category,
+                float(rng.randrange(1499, 6999, 50)),
+                f"images_upload\\{_code(rng, 16)}.png",
+                units_per_size,
+                5,
+                100,
+                group_id,
+                groups.size_key(SIZES[size_index]),
+            ))
+        conn.executemany(
+            "INSERT INTO ProductGroups (productGroupID, groupKey, productName, category) VALUES (?, ?, ?, ?)",
+            [(group_id, groups.group_key(name, category), name, category)
+             for (name, category), group_id in product_groups.items()],
+        )
+        conn.executemany(
+            """INSERT INTO Products (productName, productDescription, size, color, category, unitPrice,
+                                     image_path, currentStock, minStockLevel, maxStockLevel,
+                                     productGroupID, sizeKey, isActive)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)""",
+            products,
+        )
+        first_product_id = conn.execute("SELECT MIN(productID) FROM Products").fetchone()[0]
+        counts["products"] = len(products)
+
+        def variant_rows():
+            serial = 0
+            for offset in range(len(products)):
+                for _ in range(units_per_size):
+                    serial += 1
+                    if serial > variants:
+                        return
+                    yield (f"{serial:013d}", f"{serial:08X}", first_product_id + offset)
+
+        conn.executemany("INSERT INTO ProductVariants (barcode, productCode, productID) VALUES (?, ?, ?)", variant_rows())
+        counts["variants"] = conn.execute("SELECT COUNT(*) FROM ProductVariants").fetchone()[0]
+        conn.execute(
+            """UPDATE Products SET availableQuantity = (SELECT COUNT(*) FROM ProductVariants AS pv
+                                                        WHERE pv.productID = Products.productID AND pv.isAvailable = 1)"""
+        )
+
+        customers = [(f"Customer {i}", f"Warehouse {i}", f"{i} Rizal Avenue, Quezon City") for i in range(1, 51)]
+        conn.executemany("INSERT INTO Customers (customerName, customerWarehouseName, customerAddress) VALUES (?, ?, ?)", customers)
+        vendors = [
+            (f"Vendor {i}", f"0917{i:07d}", f"vendor{i}@example.com", "Bldg 1", "Main St", "San Roque", "Marikina",
+             "Philippines", "1800", now, now, 1)
+            for i in range(1, 21)
+        ]
+        conn.executemany(
+            """INSERT INTO Vendors (VendorName, ContactNumber, ContactEmail, Building, Street, Barangay, City, Country,
+                                    Zipcode, CreatedAt, UpdatedAt, isActive)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            vendors,
+        )
+
+        order_count = orders if orders is not None else max(50, variants // 200)
+        details = []
+        for order_id in range(1, order_count + 1):
+            status = ORDER_STATUSES[order_id % len(ORDER_STATUSES)]
+            order_date = now - timedelta(days=rng.randrange(0, 90))
+            conn.execute(
+                "INSERT INTO purchaseOrders (orderID, orderDate, orderStatus, statusDate, customerID, vendorID) VALUES (?, ?, ?, ?, ?, ?)",
+                (order_id, order_date, status, order_date, rng.randrange(1, len(customers) + 1), rng.randrange(1, len(vendors) + 1)),
+            )
+            for _ in range(lines_per_order):
+                details.append((order_id, first_product_id + rng.randrange(len(products)), rng.randrange(1, 4),
+                                order_date + timedelta(days=7)))
+        conn.executemany(
+            "INSERT INTO purchaseOrderDetails (orderID, productID, orderQuantity, expectedDate) VALUES (?, ?, ?, ?)",
+            details,
+        )
+        counts["orders"] = order_count
+        counts["order_lines"] = len(details)
+
+        try:
+            from passlib.context import CryptContext
+
+            hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+            conn.execute(
+                """INSERT OR IGNORE INTO users (username, userPassword, userRole, isDisabled, firstName, lastName)
+                   VALUES (?, ?, 'admin', 0, 'Bench', 'User')""",
+                (BENCH_USERNAME, hashed),
+            )
+        except ImportError:
+            pass
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=sqlite_backend.SQLITE_PATH)
+    parser.add_argument("--variants", type=int, default=10_000)
+    parser.add_argument("--units-per-size", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=None)
+    parser.add_argument("--reset", action="store_true", help="delete the database file first")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = seed(args.path, args.variants, args.units_per_size, args.orders, reset=args.reset)
+    print(f"Seeded {args.path} in {time.perf_counter() - started:.1f}s: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import asyncio
+import functools
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+# Embedded SQLite stand-in for the Azure SQL database, for local profiling,
+# load tests and CI. Connections expose the subset of the aioodbc interface
+# the routers use, and the T-SQL the routers send is rewritten to SQLite.
+
+name = "sqlite"
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "vms_local.db")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # ms to wait on a locked database
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "sqlite_schema.sql")
+
+# Round trips the same calls would cost over ODBC: one per execute, one per
+# executemany row (pyodbc without fast_executemany), one per commit/rollback
+stats = {"statements": 0, "executemany_rows": 0, "commits": 0, "rollbacks": 0}
+
+
+def round_trips():
+    return stats["statements"] + stats["executemany_rows"] + stats["commits"] + stats["rollbacks"]
+
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()[:10]))
+
+
+# T-SQL -> SQLite rewriting
+
+_TOP = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s*(?:\(\s*(\?|\d+)\s*\)|(\d+))\s+", re.I)
+_OUTPUT = re.compile(r"\bOUTPUT\s+((?:inserted|deleted)\.\w+(?:\s*,\s*(?:inserted|deleted)\.\w+)*)\s*", re.I)
+_REWRITES = [
+    (re.compile(r"\bSELECT\s+(?:@@IDENTITY|SCOPE_IDENTITY\(\))", re.I), "SELECT last_insert_rowid()"),
+    (re.compile(r"\bAS\s+n?varchar\s*\(\s*max\s*\)", re.I), "AS TEXT"),
+    (re.compile(r"\b(?:getdate|getutcdate|sysutcdatetime|sysdatetime)\(\)", re.I), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bISNULL\(", re.I), "IFNULL("),
+    (re.compile(r"\bLEN\(", re.I), "LENGTH("),
+]
+
+
+@functools.lru_cache(maxsize=2048)
+def translate(sql):
+    """Rewrite one T-SQL statement; returns (sql, index of a TOP (?) parameter or None).
+
+    SQLite takes the row limit as a trailing LIMIT, so a parameterised TOP (?)
+    moves its parameter to the end of the parameter list.
+    """
+    top_param = None
+    match = _TOP.match(sql)
+    if match:
+        limit = match.group(2) or match.group(3)
+        if limit == "?":
+            top_param = sql[:match.start(2)].count("?")
+        sql = match.group(1) + sql[match.end():]
+        sql = sql.rstrip().rstrip(";") + f" LIMIT {limit}"
+
+    match = _OUTPUT.search(sql)
+    if match:
+        columns = [column.strip() for column in match.group(1).split(",")]
+        if any(column.lower().startswith("deleted.") for column in columns):
+            raise NotImplementedError("OUTPUT deleted.* has no SQLite equivalent")
+        sql = sql[:match.start()] + sql[match.end():]
+        sql = sql.rstrip().rstrip(";") + " RETURNING " + ", ".join(column.split(".", 1)[1] for column in columns)
+
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql, top_param
+
+
+def _params(params):
+    # pyodbc accepts execute(sql, a, b, c) as well as execute(sql, (a, b, c))
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        return list(params[0])
+    return list(params)
+
+
+def _move_top(params, top_param):
+    if top_param is None:
+        return params
+    return params[:top_param] + params[top_param + 1:] + [params[top_param]]
+
+
+class Cursor:
+    def __init__(self, conn, raw):
+        self._conn = conn
+        self._raw = raw
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    async def execute(self, sql, *params):
+        sql, top_param = translate(sql)
+        stats["statements"] += 1
+        await self._conn._run(self._raw.execute, sql, _move_top(_params(params), top_param))
+        return self
+
+    async def executemany(self, sql, seq_of_params):
+        sql, top_param = translate(sql)
+        rows = [_move_top(list(params), top_param) for params in seq_of_params]
+        stats["executemany_rows"] += len(rows)
+        await self._conn._run(self._raw.executemany, sql, rows)
+        return self
+
+    async def fetchone(self):
+        return await self._conn._run(self._raw.fetchone)
+
+    async def fetchall(self):
+        return await self._conn._run(self._raw.fetchall)
+
+    async def fetchmany(self, size=None):
+        return await self._conn._run(self._raw.fetchmany, size or self._raw.arraysize)
+
+    async def close(self):
+        await self._conn._run(self._raw.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class _CursorContext:
+    """Like aioodbc: conn.cursor() can be awaited or used with `async with`."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = None
+
+    async def _open(self):
+        raw = await self._conn._run(self._conn._raw.cursor)
+        self._cursor = Cursor(self._conn, raw)
+        return self._cursor
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self):
+        return await self._open()
+
+    async def __aexit__(self, *exc_info):
+        await self._cursor.close()
+
+
+class Connection:
+    def __init__(self, raw, executor):
+        self._raw = raw
+        self._executor = executor
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def _run(self, fn, *args):
+        # each connection owns one thread, as sqlite3 objects are not shared across threads
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def cursor(self):
+        return _CursorContext(self)
+
+    async def commit(self):
+        stats["commits"] += 1
+        await self._run(self._raw.commit)
+
+    async def rollback(self):
+        stats["rollbacks"] += 1
+        await self._run(self._raw.rollback)
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self._run(self._raw.close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+
+def _open_raw(path, read_only):
+    raw = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                          timeout=SQLITE_BUSY_TIMEOUT / 1000)
+    raw.execute("PRAGMA journal_mode=WAL")
+    raw.execute("PRAGMA synchronous=NORMAL")
+    if read_only:
+        raw.execute("PRAGMA query_only=ON")
+    return raw
+
+
+async def _connect(read_only=False):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+    loop = asyncio.get_running_loop()
+    raw = await loop.run_in_executor(executor, _open_raw, SQLITE_PATH, read_only)
+    return Connection(raw, executor)
+
+
+async def connect():
+    return await _connect()
+
+
+async def connect_read():
+    return await _connect(read_only=True)
+
+
+# columns added to tables after their first release: (table, column, definition, backfill statement)
+ADDED_COLUMNS = [
+    ("Products", "availableQuantity", "INTEGER NOT NULL DEFAULT 0",
+     """UPDATE Products SET availableQuantity = (SELECT COUNT(*) FROM ProductVariants AS pv
+                                                 WHERE pv.productID = Products.productID AND pv.isAvailable = 1)"""),
+    # SQLite cannot add a column with a CURRENT_TIMESTAMP default; the app sets updatedAt explicitly
+    ("Products", "updatedAt", "DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00'",
+     "UPDATE Products SET updatedAt = CURRENT_TIMESTAMP"),
+    ("ProductVariants", "updatedAt", "DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00'",
+     "UPDATE ProductVariants SET updatedAt = CURRENT_TIMESTAMP"),
+    # backfilled by groups.backfill() at startup; the keys are computed in Python
+    ("Products", "productGroupID", "INTEGER REFERENCES ProductGroups (productGroupID)", None),
+    ("Products", "sizeKey", "TEXT", None),
+]
+
+
+def _add_columns(raw):
+    for table, column, definition, backfill in ADDED_COLUMNS:
+        existing = {row[1] for row in raw.execute(f"PRAGMA table_info({table})")}
+        # tables that do not exist yet are created with the column by the schema script
+        if existing and column not in existing:
+            raw.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            if backfill:
+                raw.execute(backfill)
+
+
+def create_schema(path=None):
+    """Create any tables, columns and indexes of the bundled schema that are missing."""
+    raw = sqlite3.connect(path or SQLITE_PATH)
+    try:
+        _add_columns(raw)
+        with open(SCHEMA_PATH, encoding="utf-8") as file:
+            raw.executescript(file.read())
+        raw.commit()
+    finally:
+        raw.close()
+
+
+async def prepare():
+    await asyncio.to_thread(create_schema)
@@ -0,0 +1,139 @@
+-- Local SQLite stand-in for the VMS Azure SQL schema.
+-- Table and column names match the production database so the routers'
+-- queries run unchanged (SQLite identifiers are case-insensitive).
+-- Every statement is idempotent so existing local databases pick up new tables;
+-- the matching Azure SQL changes live in backend/migrations/.
+
+CREATE TABLE IF NOT EXISTS users (
+    userID INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    userPassword TEXT NOT NULL,
+    userRole TEXT,
+    isDisabled INTEGER NOT NULL DEFAULT 0,
+    firstName TEXT,
+    lastName TEXT
+);
+
+CREATE TABLE IF NOT EXISTS Vendors (
+    VendorID INTEGER PRIMARY KEY AUTOINCREMENT,
+    VendorName TEXT NOT NULL,
+    ContactNumber TEXT,
+    ContactEmail TEXT,
+    Building TEXT,
+    Street TEXT,
+    Barangay TEXT,
+    City TEXT,
+    Country TEXT,
+    Zipcode TEXT,
+    CreatedAt DATETIME,
+    UpdatedAt DATETIME,
+    isActive INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS Customers (
+    customerID INTEGER PRIMARY KEY AUTOINCREMENT,
+    customerName TEXT,
+    customerWarehouseName TEXT,
+    customerAddress TEXT
+);
+
+CREATE TABLE IF NOT EXISTS ProductGroups (
+    productGroupID INTEGER PRIMARY KEY AUTOINCREMENT,
+    groupKey TEXT NOT NULL,
+    productName TEXT NOT NULL,
+    category TEXT,
+    createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_ProductGroups_groupKey ON ProductGroups (groupKey);
+
+CREATE TABLE IF NOT EXISTS Products (
+    productID INTEGER PRIMARY KEY AUTOINCREMENT,
+    productName TEXT NOT NULL,
+    productDescription TEXT,
+    size TEXT,
+    color TEXT,
+    category TEXT,
+    unitPrice REAL,
+    image_path TEXT,
+    currentStock INTEGER NOT NULL DEFAULT 0,
+    availableQuantity INTEGER NOT NULL DEFAULT 0,
+    minStockLevel INTEGER,
+    maxStockLevel INTEGER,
+    isActive INTEGER NOT NULL DEFAULT 1,
+    updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    productGroupID INTEGER REFERENCES ProductGroups (productGroupID),
+    sizeKey TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_Products_category ON Products (category, isActive);
+CREATE INDEX IF NOT EXISTS ix_Products_group_size ON Products (productGroupID, sizeKey, isActive);
+CREATE INDEX IF NOT EXISTS ix_Products_category_available ON Products (category, isActive, availableQuantity);
+CREATE INDEX IF NOT EXISTS ix_Products_productName ON Products (productName, isActive);
+
+CREATE TABLE IF NOT EXISTS ProductVariants (
+    variantID INTEGER PRIMARY KEY AUTOINCREMENT,
+    barcode TEXT NOT NULL,
+    productCode TEXT,
+    productID INTEGER NOT NULL REFERENCES Products (productID),
+    isAvailable INTEGER NOT NULL DEFAULT 1,
+    isDamaged INTEGER NOT NULL DEFAULT 0,
+    isWrongItem INTEGER NOT NULL DEFAULT 0,
+    isReturned INTEGER NOT NULL DEFAULT 0,
+    updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_ProductVariants_productID ON ProductVariants (productID, isAvailable);
+DROP INDEX IF EXISTS ix_ProductVariants_barcode;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_ProductVariants_barcode ON ProductVariants (barcode);
+CREATE INDEX IF NOT EXISTS ix_ProductVariants_updatedAt ON ProductVariants (updatedAt);
+CREATE INDEX IF NOT EXISTS ix_Products_updatedAt ON Products (updatedAt);
+
+CREATE TABLE IF NOT EXISTS purchaseOrders (
+    orderID INTEGER PRIMARY KEY AUTOINCREMENT,
+    orderDate DATETIME,
+    orderStatus TEXT NOT NULL,
+    statusDate DATETIME,
+    customerID INTEGER REFERENCES Customers (customerID),
+    vendorID INTEGER REFERENCES Vendors (VendorID)
+);
+
+CREATE INDEX IF NOT EXISTS ix_purchaseOrders_orderStatus ON purchaseOrders (orderStatus, orderDate);
+
+CREATE TABLE IF NOT EXISTS purchaseOrderDetails (
+    orderDetailID INTEGER PRIMARY KEY AUTOINCREMENT,
+    orderID INTEGER NOT NULL REFERENCES purchaseOrders (orderID),
+    productID INTEGER NOT NULL REFERENCES Products (productID),
+    orderQuantity INTEGER NOT NULL,
+    expectedDate DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS ix_purchaseOrderDetails_orderID ON purchaseOrderDetails (orderID);
+
+CREATE TABLE IF NOT EXISTS ImsOutbox (
+    eventID INTEGER PRIMARY KEY AUTOINCREMENT,
+    orderID INTEGER NOT NULL,
+    eventType TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    nextAttemptAt DATETIME NOT NULL,
+    lockedUntil DATETIME,
+    claimToken TEXT,
+    lastError TEXT,
+    createdAt DATETIME NOT NULL,
+    sentAt DATETIME,
+    chunksSent INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS ix_ImsOutbox_status ON ImsOutbox (status, nextAttemptAt);
+CREATE INDEX IF NOT EXISTS ix_ImsOutbox_orderID ON ImsOutbox (orderID, eventID);
+CREATE INDEX IF NOT EXISTS ix_ImsOutbox_claimToken ON ImsOutbox (claimToken);
+
+CREATE TABLE IF NOT EXISTS CodeSequences (
+    name TEXT PRIMARY KEY,
+    nextValue INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO CodeSequences (name, nextValue) VALUES ('barcode', 1), ('sku', 1);
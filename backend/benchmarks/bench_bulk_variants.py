@@ -0,0 +1,96 @@
+"""Variant creation benchmark: per-row executemany vs the batched engine (variants.py).
+
+Runs against a scratch SQLite database. Besides wall time it reports the
+round trips each approach would cost over ODBC and the time those would add
+at --rtt-ms per round trip (Azure SQL from the app service is ~1-5 ms in
+region, more across regions).
+
+Run from backend/:  python -m benchmarks.bench_bulk_variants [--sizes 1000 10000 100000] [--rtt-ms 2]
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import tempfile
+import time
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("DB_KEEPALIVE_INTERVAL", "0")
+
+import backends.sqlite as sqlite_backend  # noqa: E402
+import database  # noqa: E402
+import inventory  # noqa: E402
+import variants  # noqa: E402
+
+
+async def legacy(cursor, product_id, quantity, progress=None):
+    # what the product routes did before: one tuple per unit through executemany
+    characters = string.ascii_uppercase + string.digits
+    rows = [(''.join(random.choices(characters, k=13)), ''.join(random.choices(characters, k=8)), product_id)
+            for _ in range(quantity)]
+    await cursor.executemany(
+        '''INSERT INTO ProductVariants (barcode, productCode, productID, updatedAt)
+           VALUES (?, ?, ?, SYSUTCDATETIME())''',
+        rows
+    )
+    await inventory.adjust_available(cursor, product_id, quantity)
+
+
+def reporter(label):
+    last = [0.0]
+
+    def progress(done, total):
+        now = time.perf_counter()
+        if now - last[0] >= 0.5 or done == total:
+            last[0] = now
+            print(f"\r  {label}: {done}/{total} ({done * 100 // total}%)", end="", flush=True)
+    return progress
+
+
+async def run(create, product_id, quantity, label):
+    before = sqlite_backend.round_trips()
+    started = time.perf_counter()
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        if create is variants.create_variants:
+            await create(cursor, product_id, quantity, progress=reporter(label))
+        else:
+            await create(cursor, product_id, quantity)
+        await conn.commit()
+    elapsed = time.perf_counter() - started
+    print("\r" + " " * 60 + "\r", end="")
+    return elapsed, sqlite_backend.round_trips() - before
+
+
+async def main(sizes, rtt_ms):
+    sqlite_backend.SQLITE_PATH = os.path.join(tempfile.mkdtemp(), "bulk_variants.db")
+    sqlite_backend.create_schema()
+    await database.init_pool()
+    try:
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute(
+                '''INSERT INTO Products (productName, productDescription, size, category, unitPrice, currentStock)
+                   VALUES ('Bench Oxford', 'Benchmark product', '42', 'Men''s Leather Shoes', 2499, 0)'''
+            )
+            await cursor.execute("SELECT @@IDENTITY")
+            product_id = (await cursor.fetchone())[0]
+            await conn.commit()
+
+        print(f"{'units':>8} {'approach':<12} {'seconds':>8} {'rows/s':>9} {'round trips':>12} {f'+RTT @{rtt_ms}ms':>12}")
+        for quantity in sizes:
+            for label, create in (("executemany", legacy), ("batched", variants.create_variants)):
+                elapsed, trips = await run(create, product_id, quantity, label)
+                print(f"{quantity:>8} {label:<12} {elapsed:>8.3f} {quantity / elapsed:>9.0f} {trips:>12} "
+                      f"{elapsed + trips * rtt_ms / 1000:>11.2f}s")
+    finally:
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="assumed database round trip")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.rtt_ms))
@@ -0,0 +1,82 @@
+"""Order confirmation availability check: per-line variant fetches vs one shortage query (inventory.py).
+
+Seeds a scratch SQLite database with --orders orders of --lines lines each
+and times the availability check of confirm_order both ways: the old loop
+(order lines, then a TOP (n) variant fetch per line) and
+inventory.shortages(), for one order and for all of them at once. Besides
+wall time it reports the round trips each costs over ODBC and the time those
+would add at --rtt-ms per round trip.
+
+Run from backend/:  python -m benchmarks.bench_confirm [--orders 200] [--lines 50] [--rtt-ms 2]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("DB_KEEPALIVE_INTERVAL", "0")
+
+import backends.seed as seed  # noqa: E402
+import backends.sqlite as sqlite_backend  # noqa: E402
+import database  # noqa: E402
+import inventory  # noqa: E402
+
+
+async def legacy(cursor, order_ids):
+    # what confirm_order did before, order by order: every line's variants fetched to be counted
+    short = []
+    for order_id in order_ids:
+        await cursor.execute("select productID, orderQuantity from purchaseOrderDetails where orderID = ?",
+                             (order_id,))
+        for product_id, order_quantity in await cursor.fetchall():
+            await cursor.execute(
+                f'''select top ({order_quantity}) pv.barcode, pv.productCode, p.productName, p.category, p.size
+                    from productVariants pv join Products p on pv.productID = p.productID
+                    where pv.productID = ? AND pv.isAvailable = 1
+                    order by pv.variantID asc''',
+                (product_id,)
+            )
+            if len(await cursor.fetchall()) < order_quantity:
+                short.append((order_id, product_id))
+    return short
+
+
+async def run(check, order_ids, repeat):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        before = sqlite_backend.round_trips()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = await check(cursor, order_ids)
+        elapsed = (time.perf_counter() - started) / repeat
+        return result, elapsed, (sqlite_backend.round_trips() - before) // repeat
+
+
+async def main(orders, lines, rtt_ms, repeat):
+    sqlite_backend.SQLITE_PATH = os.path.join(tempfile.mkdtemp(), "confirm.db")
+    # few units per size, so some lines come up short
+    counts = seed.seed(sqlite_backend.SQLITE_PATH, variants=20000, units_per_size=3, orders=orders,
+                       lines_per_order=lines)
+    print(f"{counts['orders']} orders, {counts['order_lines']} lines, {counts['variants']} variants")
+    await database.init_pool()
+    try:
+        print(f"{'orders':>7} {'approach':<10} {'ms':>9} {'round trips':>12} {f'+RTT @{rtt_ms}ms':>12} {'short':>6}")
+        for order_ids in ([1], list(range(1, orders + 1))):
+            for label, check in (("per-line", legacy), ("shortages", inventory.shortages)):
+                result, elapsed, trips = await run(check, order_ids, repeat if len(order_ids) == 1 else 1)
+                print(f"{len(order_ids):>7} {label:<10} {elapsed * 1000:>9.2f} {trips:>12} "
+                      f"{(elapsed + trips * rtt_ms / 1000) * 1000:>10.1f}ms {len(result):>6}")
+    finally:
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="assumed database round trip")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of the single-order check")
+    args = parser.parse_args()
+    asyncio.run(main(args.orders, args.lines, args.rtt_ms, args.repeat))
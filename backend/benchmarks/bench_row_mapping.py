@@ -0,0 +1,98 @@
+"""Row mapping benchmark: today's dict/pydantic path vs compiled mappers.
+
+Run from backend/:  python -m benchmarks.bench_row_mapping [rows]
+"""
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import rows
+from routers.orders import OrderSummary
+
+CATALOG_DESCRIPTION = (
+    ("productName", str), ("productDescription", str), ("category", str), ("size", str),
+    ("unitPrice", Decimal), ("image_path", str), ("available quantity", int), ("currentStock", int),
+)
+ORDER_DESCRIPTION = (
+    ("orderID", int), ("productName", str), ("size", str), ("category", str), ("quantity", int),
+    ("totalPrice", Decimal), ("customerName", str), ("warehouseAddress", str), ("image_path", str),
+)
+
+
+def catalog_rows(n):
+    return [
+        (f"Oxford {i % 500}", "Full-grain leather oxford", "Men's Leather Shoes", str(36 + i % 10),
+         Decimal("2499.00"), f"images_upload\\{i:016d}.png", i % 40, 40)
+        for i in range(n)
+    ]
+
+
+def order_rows(n):
+    return [
+        (i, f"Oxford {i % 500}", str(36 + i % 10), "Men's Leather Shoes", 3,
+         Decimal("7497.00"), "Juan Dela Cruz", "Warehouse 5, Quezon City", f"images_upload/{i:016d}.png")
+        for i in range(n)
+    ]
+
+
+def legacy_catalog(description, data):
+    # what the category endpoints did per row, then FastAPI's encode + render
+    result = [
+        {
+            **dict(zip([column[0] for column in description], row)),
+            "image_path": row[5].replace("\\", "/") if row[5] else "placeholder.png",
+        }
+        for row in data
+    ]
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+def legacy_orders(data):
+    # OrderSummary per row, then response_model validation, encode + render
+    summaries = [
+        OrderSummary(orderID=r[0], productName=r[1], size=r[2], category=r[3], quantity=r[4],
+                     totalPrice=r[5], customerName=r[6], warehouseAddress=r[7], image_path=r[8])
+        for r in data
+    ]
+    adapter = TypeAdapter(List[OrderSummary])
+    validated = adapter.validate_python([s.model_dump() for s in summaries])
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def mapped(description, data, transforms=None):
+    mapper = rows.mapper_for(description, transforms)
+    return rows.RecordsResponse(mapper, mapper.from_rows(data)).body
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(body)
+
+
+def main(n=100_000):
+    print(f"{n} rows, best of 3 ({datetime.now():%Y-%m-%d %H:%M})")
+    cases = [
+        ("catalog  dict(zip) + jsonable_encoder", legacy_catalog, CATALOG_DESCRIPTION, catalog_rows(n)),
+        ("catalog  compiled mapper", lambda d, r: mapped(d, r, {"image_path": rows.fix_image_path}),
+         CATALOG_DESCRIPTION, catalog_rows(n)),
+        ("orders   OrderSummary + response_model", lambda d, r: legacy_orders(r), ORDER_DESCRIPTION, order_rows(n)),
+        ("orders   compiled mapper", mapped, ORDER_DESCRIPTION, order_rows(n)),
+    ]
+    for label, fn, description, data in cases:
+        seconds, size = timed(fn, description, data)
+        print(f"{label:<42} {seconds * 1000:9.1f} ms  {n / seconds:12,.0f} rows/s  {size / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
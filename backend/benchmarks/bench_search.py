@@ -0,0 +1,71 @@
+"""Product search benchmark: in-process index (search.py) vs the browser-style full list scan.
+
+Seeds a scratch SQLite database with --products product rows, builds the
+index the way startup does and times typical storefront queries: exact
+words, prefixes as typed, a typo, multi-word and size queries. The scan
+baseline is what Products.js does today: lowercase substring matching over
+every listed product.
+
+Run from backend/:  python -m benchmarks.bench_search [--products 20000] [--repeat 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("DB_KEEPALIVE_INTERVAL", "0")
+
+import backends.seed as seed  # noqa: E402
+import backends.sqlite as sqlite_backend  # noqa: E402
+import database  # noqa: E402
+import search  # noqa: E402
+
+QUERIES = ["oxford", "oxf", "chelsea boot", "brogue 42", "heritage loafer 1234", "moccasn", "premium monk strap", "patent pump 38"]
+
+
+def scan(products, query):
+    terms = query.lower().split()
+    return [product for product in products
+            if all(term in f"{product['productName']} {product['productDescription']} "
+                           f"{product['category']} {product['size']}".lower() for term in terms)]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+async def main(products, repeat):
+    sqlite_backend.SQLITE_PATH = os.path.join(tempfile.mkdtemp(), "search.db")
+    seed.seed(sqlite_backend.SQLITE_PATH, variants=products, units_per_size=1, orders=0)
+    await database.init_pool()
+    try:
+        started = time.perf_counter()
+        await search.build()
+        print(f"index: {search.stats()['products']} products, {search.stats()['tokens']} tokens, "
+              f"built in {time.perf_counter() - started:.2f}s")
+        listed = [record for record, _ in search._index.docs.values()]
+
+        print(f"{'query':<24} {'hits':>6} {'index p50':>10} {'p99':>8} {'scan p50':>10}")
+        for query in QUERIES:
+            result, p50, p99 = timed(lambda: search.search(query), repeat)
+            _, scan_p50, _ = timed(lambda: scan(listed, query), max(1, repeat // 20))
+            print(f"{query:<24} {result['total']:>6} {p50:>8.3f}ms {p99:>6.3f}ms {scan_p50:>8.2f}ms")
+    finally:
+        await database.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.repeat))
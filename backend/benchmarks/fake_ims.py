@@ -0,0 +1,69 @@
+"""Minimal stand-in for the IMS backend so order endpoints can be benchmarked offline.
+
+Run standalone from backend/:  python -m benchmarks.fake_ims --port 8900 --latency-ms 20
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+app = FastAPI()
+app.state.latency = 0.0
+app.state.received = 0
+app.state.variants = 0
+
+
+async def _ack(request: Request):
+    body = await request.body()
+    app.state.received += 1
+    if request.headers.get("content-type") == "application/x-ndjson":
+        # chunked variant delivery: decode it so malformed chunks fail loudly
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        app.state.variants += len(lines) - 1
+    elif request.url.path.endswith("/variants/receive"):
+        app.state.variants += len(json.loads(body).get("variants", []))
+    if app.state.latency:
+        await asyncio.sleep(app.state.latency)
+    return {"status": "success"}
+
+
+app.add_api_route("/receive-orders/ims/orders/confirm", _ack, methods=["POST"])
+app.add_api_route("/receive-orders/ims/orders/ToShip", _ack, methods=["POST"])
+app.add_api_route("/receive-orders/ims/variants/receive", _ack, methods=["POST"])
+
+
+class FakeIMS:
+    """Runs the fake IMS with uvicorn on a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=8900, latency_ms=0):
+        app.state.latency = latency_ms / 1000
+        self.url = f"http://{host}:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    app.state.latency = args.latency_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
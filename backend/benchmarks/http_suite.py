@@ -0,0 +1,293 @@
+"""End-to-end HTTP benchmarks for every router, run in-process against the local SQLite backend.
+
+Run from backend/:
+    python -m benchmarks.http_suite --scales 10000,100000,1000000 --requests 200 --concurrency 8
+    python -m benchmarks.http_suite --endpoints "products\\." --scales 100000
+    python -m benchmarks.http_suite --compare benchmarks/results/a.json benchmarks/results/b.json
+
+Each scale seeds a fresh database (backends.seed), starts the app lifespan and
+drives it through an httpx ASGI client. Order status changes go to a local
+fake IMS (benchmarks.fake_ims). Results are printed and saved as JSON.
+"""
+import os
+
+# the app reads its configuration at import time
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ.setdefault("DB_KEEPALIVE_INTERVAL", "0")
+
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+READY_TIMEOUT = 120  # seconds to wait for /health/ready before a scale's requests
+
+
+class Scenario:
+    """One endpoint under test; build(i, ctx) returns (method, url, request kwargs)."""
+
+    def __init__(self, name, build, heavy=False, auth=False, before=None):
+        self.name = name
+        self.build = build
+        self.heavy = heavy
+        self.auth = auth
+        self.before = before
+
+
+def _product(ctx, i):
+    return ctx["products"][i % len(ctx["products"])]
+
+
+def _size_params(ctx, i):
+    p = _product(ctx, i)
+    return {"productName": p["productName"], "unitPrice": p["unitPrice"], "category": p["category"],
+            "productDescription": p["productDescription"]}
+
+
+def _display_order_payload(ctx, i):
+    p = _product(ctx, i)
+    return {
+        "productName": p["productName"], "productDescription": p["productDescription"], "size": p["size"],
+        "color": p["color"], "category": p["category"], "quantity": 1, "warehouseID": 1, "vendorID": 1,
+        "userID": 1, "orderDate": "2025-01-15", "expectedDate": "2025-01-22",
+    }
+
+
+def _vendor_payload(i):
+    return {"vendorName": f"Bench Vendor {i}", "contactNumber": f"0917{i:07d}", "contactEmail": f"bench{i}@example.com",
+            "city": "Marikina", "country": "Philippines"}
+
+
+def _load_vendor_ids(ctx):
+    conn = sqlite3.connect(ctx["path"])
+    ctx["vendor_ids"] = [row[0] for row in conn.execute(
+        "SELECT VendorID FROM Vendors WHERE VendorName LIKE 'Bench Vendor %' ORDER BY VendorID")]
+    conn.close()
+
+
+SCENARIOS = [
+    # reads
+    Scenario("products.womens", lambda i, c: ("GET", "/products/products/Womens-Leather-Shoes", {})),
+    Scenario("products.mens", lambda i, c: ("GET", "/products/products/mens-Leather-Shoes", {})),
+    Scenario("products.girls", lambda i, c: ("GET", "/products/products/girls-Leather-Shoes", {})),
+    Scenario("products.boys", lambda i, c: ("GET", "/products/products/boys-Leather-Shoes", {})),
+    Scenario("products.list", lambda i, c: ("GET", "/products/products", {}), heavy=True),
+    Scenario("products.get", lambda i, c: ("GET", f"/products/products/{_product(c, i)['productID']}", {})),
+    Scenario("products.sizes", lambda i, c: ("GET", "/products/products/sizes", {"params": _size_params(c, i)})),
+    Scenario("products.size_variants", lambda i, c: ("GET", "/products/products/size_variants", {"params": _size_params(c, i)})),
+    Scenario("products.variants", lambda i, c: ("GET", "/products/product/variants", {}), heavy=True),
+    Scenario("orders.confirmed_list", lambda i, c: ("GET", "/orders/confirmed/orders", {})),
+    Scenario("orders.toship_list", lambda i, c: ("GET", "/orders/toship/orders", {})),
+    Scenario("orders.delivered_list", lambda i, c: ("GET", "/orders/vms/orders/delivered", {})),
+    Scenario("orders.completed_list", lambda i, c: ("GET", "/orders/vms/orders/Completed", {})),
+    Scenario("orderdetails.pending_list", lambda i, c: ("GET", "/vms/order-details/orders", {})),
+    Scenario("vendors.list", lambda i, c: ("GET", "/vendors/", {}), auth=True),
+    Scenario("vendors.get", lambda i, c: ("GET", f"/vendors/{1 + i % 20}", {}), auth=True),
+    Scenario("auth.token", lambda i, c: ("POST", "/auth/token", {"data": {"username": "bench", "password": "bench123"}}), heavy=True),
+    # writes
+    Scenario("orderdetails.display_order", lambda i, c: ("POST", "/vms/orders", {"json": _display_order_payload(c, i)})),
+    Scenario("orders.receive", lambda i, c: ("POST", "/orders/vms/orders", {"json": {
+        "customerID": 1, "products": [{k: _product(c, i)[k] for k in ("productName", "size", "category")} | {"quantity": 1}]}})),
+    Scenario("orders.confirm", lambda i, c: ("PUT", f"/orders/vms/orders/{c['orders']['confirm'][i]}/confirm",
+                                             {"json": {"orderStatus": "Confirmed"}})),
+    Scenario("orders.toship", lambda i, c: ("PUT", f"/orders/vms/orders/{c['orders']['toship'][i]}/toship", {})),
+    Scenario("orders.delivered", lambda i, c: ("PUT", f"/orders/vms/orders/{c['orders']['deliver'][i]}/Delivered", {})),
+    Scenario("products.add_quantity", lambda i, c: ("POST", "/products/products/add-quantity", {"json": {
+        **{k: _product(c, i)[k] for k in ("productName", "size", "category")}, "quantity": 5}})),
+    Scenario("vendors.create", lambda i, c: ("POST", "/vendors/", {"json": _vendor_payload(i)}), auth=True),
+    Scenario("vendors.update", lambda i, c: ("PUT", f"/vendors/{c['vendor_ids'][i % len(c['vendor_ids'])]}",
+                                             {"json": _vendor_payload(i)}), auth=True, before=_load_vendor_ids),
+    Scenario("vendors.delete", lambda i, c: ("DELETE", f"/vendors/{c['vendor_ids'][i % len(c['vendor_ids'])]}", {}),
+             auth=True, before=_load_vendor_ids),
+]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def prepare(path, scale, requests):
+    """Seed the database and put enough orders in each status for the write scenarios."""
+    from backends.seed import seed
+
+    counts = seed(path, variants=scale, orders=max(scale // 200, 4 * requests), reset=True)
+    conn = sqlite3.connect(path)
+    ids = [row[0] for row in conn.execute("SELECT orderID FROM purchaseOrders ORDER BY orderID LIMIT ?", (3 * requests,))]
+    orders = {"confirm": ids[:requests], "toship": ids[requests:2 * requests], "deliver": ids[2 * requests:3 * requests]}
+    for status, chunk in (("Pending", orders["confirm"]), ("Confirmed", orders["toship"]), ("To Ship", orders["deliver"])):
+        conn.executemany("UPDATE purchaseOrders SET orderStatus = ? WHERE orderID = ?", [(status, i) for i in chunk])
+    products = [
+        dict(zip(("productID", "productName", "productDescription", "size", "color", "category", "unitPrice"), row))
+        for row in conn.execute(
+            """SELECT productID, productName, productDescription, size, color, category, unitPrice
+               FROM Products ORDER BY productID LIMIT 500""")
+    ]
+    conn.commit()
+    conn.close()
+    return counts, {"path": path, "orders": orders, "products": products}
+
+
+async def run_scenario(client, scenario, ctx, count, concurrency, headers):
+    from backends import sqlite as sqlite_backend
+
+    if scenario.before:
+        scenario.before(ctx)
+    latencies = []
+    statuses = Counter()
+    pending = iter(range(count))
+
+    async def worker():
+        for i in pending:
+            method, url, kwargs = scenario.build(i, ctx)
+            if scenario.auth:
+                kwargs = {**kwargs, "headers": headers}
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    round_trips_before = sqlite_backend.round_trips()
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    round_trips = sqlite_backend.round_trips() - round_trips_before
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "requests": count,
+        "errors": sum(n for code, n in statuses.items() if code >= 400),
+        "status_codes": {str(code): n for code, n in sorted(statuses.items())},
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "max_ms": ms(latencies[-1]) if latencies else None,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+        "db_round_trips_per_request": round(round_trips / count, 2) if count else None,
+    }
+
+
+async def run_scale(scale, args, scenarios):
+    import httpx
+    from backends import sqlite as sqlite_backend
+
+    workdir = tempfile.mkdtemp(prefix="vms-bench-")
+    path = os.path.join(workdir, "bench.db")
+    started = time.perf_counter()
+    counts, ctx = prepare(path, scale, args.requests)
+    print(f"\n== scale {scale:,} variants: seeded in {time.perf_counter() - started:.1f}s {counts}")
+    sqlite_backend.SQLITE_PATH = path
+
+    from main import app
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # bootstrap runs in the background: measure the app as it serves once ready
+            started = time.perf_counter()
+            while (await client.get("/health/ready")).status_code != 200:
+                if time.perf_counter() - started > READY_TIMEOUT:
+                    raise RuntimeError(f"app not ready after {READY_TIMEOUT}s: "
+                                       f"{(await client.get('/health/ready')).json()}")
+                await asyncio.sleep(0.05)
+            token = (await client.post("/auth/token", data={"username": "bench", "password": "bench123"})).json()
+            headers = {"Authorization": f"Bearer {token['access_token']}"}
+            for scenario in scenarios:
+                count = args.heavy_requests if scenario.heavy else args.requests
+                result = await run_scenario(client, scenario, ctx, count, args.concurrency, headers)
+                results[scenario.name] = result
+                print(f"{scenario.name:<30} p50 {result['p50_ms']:>9.2f}  p95 {result['p95_ms']:>9.2f}  "
+                      f"p99 {result['p99_ms']:>9.2f} ms  {result['throughput_rps']:>9.1f} req/s  "
+                      f"{result['db_round_trips_per_request']:>8.1f} rt/req  errors {result['errors']}")
+    return {"seed": counts, "endpoints": results}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    print(f"{old_path} ({old.get('revision')}) -> {new_path} ({new.get('revision')})")
+    for scale, new_scale in new["scales"].items():
+        old_scale = old["scales"].get(scale)
+        if not old_scale:
+            continue
+        print(f"\n== scale {int(scale):,}")
+        for name, result in new_scale["endpoints"].items():
+            before = old_scale["endpoints"].get(name)
+            if not before:
+                continue
+            change = lambda key: (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            print(f"{name:<30} p50 {before['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ({change('p50_ms'):+6.1f}%)  "
+                  f"p95 {before['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ({change('p95_ms'):+6.1f}%)  "
+                  f"rt/req {before['db_round_trips_per_request']} -> {result['db_round_trips_per_request']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10000,100000,1000000", help="comma-separated variant counts")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--heavy-requests", type=int, default=5, help="requests for full-catalog endpoints")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoints", default=None, help="regex selecting scenarios by name")
+    parser.add_argument("--ims-latency-ms", type=float, default=0, help="simulated IMS response time")
+    parser.add_argument("--ims-port", type=int, default=8900)
+    parser.add_argument("--out", default=None, help="JSON results path")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    from benchmarks.fake_ims import FakeIMS
+
+    scenarios = [s for s in SCENARIOS if not args.endpoints or re.search(args.endpoints, s.name)]
+    scales = [int(scale) for scale in args.scales.split(",")]
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        "scales": {},
+    }
+    with FakeIMS(port=args.ims_port, latency_ms=args.ims_latency_ms) as ims:
+        import ims_client
+
+        ims_client.IMS_BASE_URL = ims.url
+        for scale in scales:
+            report["scales"][str(scale)] = asyncio.run(run_scale(scale, args, scenarios))
+
+    out = args.out or os.path.join(RESULTS_DIR, f"http-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
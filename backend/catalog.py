@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+import zlib
+import database
+import images
+import metrics
+import rows
+
+# In-process catalog snapshots
+#
+# The storefront category listing is built once per category and kept as
+# encoded JSON bytes. Routes that change what a category lists call invalidate() with the
+# categories they touched after committing; the next request rebuilds that
+# category only. Snapshots also expire after CATALOG_CACHE_TTL seconds, which
+# bounds staleness from writes made by other worker processes.
+
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() == "true"
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", 300))  # seconds
+
+# URL slugs of the storefront categories (the old per-category routes)
+CATEGORY_SLUGS = {
+    "womens-leather-shoes": "Women's Leather Shoes",
+    "mens-leather-shoes": "Men's Leather Shoes",
+    "girls-leather-shoes": "Girl's Leather Shoes",
+    "boys-leather-shoes": "Boy's Leather Shoes",
+}
+# only these are listed: locks, snapshots and metric labels exist per category,
+# so arbitrary values from URLs must not create them
+LISTED_CATEGORIES = frozenset(CATEGORY_SLUGS.values())
+_LISTED_BY_KEY = {**{name.lower(): name for name in LISTED_CATEGORIES}, **CATEGORY_SLUGS}
+
+# availableQuantity is maintained by the writes (see inventory.py), so this
+# is a seek on Products without touching ProductVariants
+CATALOG_QUERY = '''SELECT productName, productDescription, category,
+        size, unitPrice, CAST(image_path AS varchar(max)) AS image_path,
+        availableQuantity AS 'available quantity', currentStock, productGroupID
+    FROM Products
+    WHERE category = ? AND isActive = 1 AND availableQuantity > 0
+    '''
+
+CATALOG_TRANSFORMS = {"image_path": images.image_url}
+
+
+class UnknownCategoryError(KeyError):
+    pass
+
+
+class Snapshot:
+    __slots__ = ("body", "etag", "count", "built_at")
+
+    def __init__(self, body, count):
+        self.body = body
+        self.etag = f'"{zlib.crc32(body):08x}-{len(body):x}"'
+        self.count = count
+        self.built_at = time.monotonic()
+
+
+_snapshots = {}
+_generations = {}
+_epoch = 0
+_locks = {}
+
+
+def resolve(category):
+    """Map a URL slug (e.g. womens-Leather-Shoes) to its category; other values pass through."""
+    return CATEGORY_SLUGS.get(category.lower(), category)
+
+
+def listed(category):
+    """The listed category for a URL slug or category name (any case); None if it is not one."""
+    return _LISTED_BY_KEY.get(category.lower())
+
+
+async def _build(category):
+    # rebuilds read the primary: a replica may not have the write that invalidated us yet
+    async with database.connection("write") as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(CATALOG_QUERY, (category,))
+        mapper, records = await rows.fetch_records(cursor, CATALOG_TRANSFORMS)
+    return Snapshot(mapper.encode(records), len(records))
+
+
+def _fresh(snapshot):
+    return snapshot is not None and time.monotonic() - snapshot.built_at < CATALOG_CACHE_TTL
+
+
+def _hit(category, snapshot):
+    metrics.CATALOG_REQUESTS.labels(category, "hit").inc()
+    metrics.CATALOG_SNAPSHOT_AGE.observe(time.monotonic() - snapshot.built_at)
+    return snapshot
+
+
+async def get(category):
+    """Return the snapshot for a listed category, building it on a miss."""
+    if category not in LISTED_CATEGORIES:
+        raise UnknownCategoryError(category)
+    if not CATALOG_CACHE_ENABLED:
+        return await _build(category)
+
+    snapshot = _snapshots.get(category)
+    if _fresh(snapshot):
+        return _hit(category, snapshot)
+
+    lock = _locks.get(category)
+    if lock is None:
+        lock = _locks[category] = asyncio.Lock()
+    async with lock:
+        # another request may have rebuilt it while we waited
+        snapshot = _snapshots.get(category)
+        if _fresh(snapshot):
+            return _hit(category, snapshot)
+
+        metrics.CATALOG_REQUESTS.labels(category, "miss").inc()
+        generation = (_epoch, _generations.get(category, 0))
+        started = time.perf_counter()
+        snapshot = await _build(category)
+        metrics.CATALOG_REBUILD_SECONDS.observe(time.perf_counter() - started)
+        # an invalidation that landed during the build means the result may already be stale
+        if generation == (_epoch, _generations.get(category, 0)):
+            _snapshots[category] = snapshot
+        return snapshot
+
+
+def invalidate(*categories):
+    """Drop the snapshots of the given categories (all of them when called without any)."""
+    global _epoch
+    if not categories:
+        _epoch += 1
+        _snapshots.clear()
+        return
+    for category in categories:
+        _generations[category] = _generations.get(category, 0) + 1
+        _snapshots.pop(category, None)
+    metrics.CATALOG_INVALIDATIONS.inc(len(categories))
+
+
+def reset():
+    """Forget every snapshot and lock (on app startup, e.g. when the database changes between runs)."""
+    invalidate()
+    _locks.clear()
+
+
+def stats():
+    now = time.monotonic()
+    return {
+        "enabled": CATALOG_CACHE_ENABLED,
+        "ttl_seconds": CATALOG_CACHE_TTL,
+        "categories": {
+            category: {"rows": snapshot.count, "bytes": len(snapshot.body), "age_seconds": round(now - snapshot.built_at, 1)}
+            for category, snapshot in _snapshots.items()
+        },
+    }
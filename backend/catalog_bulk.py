@@ -0,0 +1,255 @@
+import os
+import catalog
+import database
+import groups
+import search
+
+# Bulk catalog mutations
+#
+# POST /products/bulk applies a list of operations in one transaction. A
+# product operation selects Products rows with a filter (product or group
+# IDs, name, category, size, price range, active flag) and changes any of
+# unitPrice (absolute or by percent), category, productDescription and
+# isActive with one set-based UPDATE; a variant operation marks a list of
+# variants unavailable with one UPDATE, after lowering the products'
+# availableQuantity by the matching counts with another. Each operation
+# reports how many rows it changed.
+#
+# A category change moves the rows to the product group of their name in the
+# new category (see groups.py): the groups are created first and the UPDATE
+# sets productGroupID with a CASE over the distinct names it touches.
+#
+# With preview the operations run exactly as they would, the report adds a
+# before/after sample of each operation's rows, and the transaction is rolled
+# back. An operation's `expect` makes the request fail (and roll back) unless
+# exactly that many rows are affected, so a previewed change can be applied
+# knowing that it still matches what was previewed.
+
+BULK_MAX_OPERATIONS = 100
+BULK_MAX_IDS = 1000  # IDs in one filter list or variant operation
+BULK_PREVIEW_ROWS = int(os.getenv("BULK_PREVIEW_ROWS", 20))  # sample rows per operation in a preview
+_NAMES_PER_UPDATE = 400  # CASE branches in one recategorizing UPDATE
+
+SAMPLE_COLUMNS = ("productID", "productGroupID", "productName", "productDescription", "category", "size",
+                  "unitPrice", "isActive")
+
+
+class BulkError(ValueError):
+    pass
+
+
+class BulkConflict(Exception):
+    pass
+
+
+def _ids(values, name):
+    if len(values) > BULK_MAX_IDS:
+        raise BulkError(f"{name} is limited to {BULK_MAX_IDS} IDs per operation")
+    return list(dict.fromkeys(values))
+
+
+def _where(match):
+    """WHERE clause and parameters for a product filter."""
+    if match is None:
+        raise BulkError("product operations need a filter")
+    conditions, params = [], []
+    for column, name in (("productID", "productIDs"), ("productGroupID", "productGroupIDs")):
+        values = getattr(match, name)
+        if values is not None:
+            values = _ids(values, name)
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "1 = 0")
+            params += values
+    category = catalog.resolve(match.category) if match.category is not None else None
+    if match.productName is not None and category is not None:
+        in_group, group = groups.group_filter(None, match.productName, category)
+        conditions.append(in_group)
+        params += group
+    elif match.productName is not None:
+        conditions.append("productName = ?")
+        params.append(match.productName)
+    elif category is not None:
+        conditions.append("category = ?")
+        params.append(category)
+    if not conditions and not match.all:
+        raise BulkError("the filter matches the whole catalog; narrow it or set all")
+    if match.size is not None:
+        of_size, size = groups.size_filter(match.size)
+        conditions.append(of_size)
+        params += size
+    if match.minPrice is not None:
+        conditions.append("unitPrice >= ?")
+        params.append(match.minPrice)
+    if match.maxPrice is not None:
+        conditions.append("unitPrice <= ?")
+        params.append(match.maxPrice)
+    if match.isActive is not None:
+        conditions.append("isActive = ?")
+        params.append(1 if match.isActive else 0)
+    return " AND ".join(conditions) or "1 = 1", params
+
+
+def _assignments(changes):
+    """SET list and parameters for a product change (category is handled by the caller)."""
+    if changes is None:
+        raise BulkError("product operations need changes to set")
+    assignments, params = [], []
+    if changes.unitPrice is not None and changes.pricePercent is not None:
+        raise BulkError("set either unitPrice or pricePercent, not both")
+    if changes.unitPrice is not None:
+        if changes.unitPrice < 0:
+            raise BulkError("unitPrice cannot be negative")
+        assignments.append("unitPrice = ?")
+        params.append(round(changes.unitPrice, 2))
+    if changes.pricePercent is not None:
+        if changes.pricePercent <= -100:
+            raise BulkError("pricePercent must be above -100")
+        assignments.append("unitPrice = ROUND(unitPrice * ?, 2)")
+        params.append(1 + changes.pricePercent / 100)
+    if changes.productDescription is not None:
+        if not changes.productDescription.strip():
+            raise BulkError("productDescription cannot be empty")
+        assignments.append("productDescription = ?")
+        params.append(changes.productDescription)
+    if changes.isActive is not None:
+        assignments.append("isActive = ?")
+        params.append(1 if changes.isActive else 0)
+    if changes.category is not None and not changes.category.strip():
+        raise BulkError("category cannot be empty")
+    if not assignments and changes.category is None:
+        raise BulkError("the operation changes nothing")
+    return assignments, params
+
+
+async def _sample(cursor, where, params=(), ids=None):
+    if ids is not None:
+        if not ids:
+            return {}
+        where, params = f"productID IN ({', '.join('?' * len(ids))})", ids
+    await cursor.execute(
+        f'''SELECT TOP (?) {", ".join(SAMPLE_COLUMNS)}
+            FROM Products WHERE {where} ORDER BY productID''',
+        (BULK_PREVIEW_ROWS, *params)
+    )
+    return {row[0]: row for row in await cursor.fetchall()}
+
+
+def _differences(before, after):
+    rows = []
+    for product_id, old in before.items():
+        new = after.get(product_id, old)
+        changed = {column: {"before": _plain(old[i]), "after": _plain(new[i])}
+                   for i, column in enumerate(SAMPLE_COLUMNS) if old[i] != new[i]}
+        rows.append({"productID": product_id, "productName": old[2], "size": old[5], "changes": changed})
+    return rows
+
+
+def _plain(value):
+    # Decimal prices and bit flags as JSON numbers
+    return float(value) if value is not None and not isinstance(value, (str, int)) else value
+
+
+async def _products(cursor, operation, preview):
+    where, where_params = _where(operation.filter)
+    assignments, params = _assignments(operation.set)
+    before = await _sample(cursor, where, where_params) if preview else {}
+
+    category = operation.set.category
+    if category is None:
+        await cursor.execute(
+            f"UPDATE Products SET {', '.join(assignments)}, updatedAt = SYSUTCDATETIME() WHERE {where}",
+            (*params, *where_params)
+        )
+        affected = cursor.rowcount
+    else:
+        category = catalog.resolve(category)
+        await cursor.execute(f"SELECT DISTINCT productName FROM Products WHERE {where}", where_params)
+        names = [row[0] for row in await cursor.fetchall()]
+        group_ids = await groups.ensure_many(
+            cursor, {groups.group_key(name, category): (name, category) for name in names})
+        affected = 0
+        for start in range(0, len(names), _NAMES_PER_UPDATE):
+            chunk = names[start:start + _NAMES_PER_UPDATE]
+            case = "CASE productName " + "WHEN ? THEN ? " * len(chunk) + "END"
+            case_params = [value for name in chunk for value in (name, group_ids[groups.group_key(name, category)])]
+            await cursor.execute(
+                f'''UPDATE Products
+                    SET {"".join(a + ", " for a in assignments)}category = ?, productGroupID = {case},
+                        updatedAt = SYSUTCDATETIME()
+                    WHERE {where} AND productName IN ({", ".join("?" * len(chunk))})''',
+                (*params, category, *case_params, *where_params, *chunk)
+            )
+            affected += cursor.rowcount
+
+    result = {"kind": "products", "affected": affected}
+    if preview:
+        result["sample"] = _differences(before, await _sample(cursor, None, ids=list(before)))
+    return result
+
+
+async def _variants(cursor, operation):
+    variant_ids = _ids(operation.variantIDs, "variantIDs")
+    if not variant_ids:
+        return {"kind": "variants", "affected": 0}
+    marks = ", ".join("?" * len(variant_ids))
+    # lower each product's available count by its variants that are about to change
+    await cursor.execute(
+        f'''UPDATE Products
+            SET availableQuantity = availableQuantity - (
+                    SELECT COUNT(*) FROM ProductVariants AS pv
+                    WHERE pv.productID = Products.productID AND pv.isAvailable = 1 AND pv.variantID IN ({marks})),
+                updatedAt = SYSUTCDATETIME()
+            WHERE productID IN (
+                SELECT productID FROM ProductVariants WHERE isAvailable = 1 AND variantID IN ({marks}))''',
+        (*variant_ids, *variant_ids)
+    )
+    await cursor.execute(
+        f'''UPDATE ProductVariants SET isAvailable = 0, updatedAt = SYSUTCDATETIME()
+            WHERE isAvailable = 1 AND variantID IN ({marks})''',
+        variant_ids
+    )
+    return {"kind": "variants", "affected": cursor.rowcount}
+
+
+async def apply(operations, preview=False):
+    """Run the operations in one transaction (rolled back for a preview); returns the report."""
+    if not operations:
+        raise BulkError("no operations")
+    if len(operations) > BULK_MAX_OPERATIONS:
+        raise BulkError(f"a request is limited to {BULK_MAX_OPERATIONS} operations")
+    # filters on productGroupIDs and recategorizing rely on every row having its group
+    await groups.complete()
+    results = []
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            for index, operation in enumerate(operations):
+                try:
+                    if operation.variantIDs is not None:
+                        if operation.filter is not None or operation.set is not None:
+                            raise BulkError("variantIDs cannot be combined with a filter or changes")
+                        result = await _variants(cursor, operation)
+                    else:
+                        result = await _products(cursor, operation, preview)
+                except BulkError as e:
+                    raise BulkError(f"operation {index}: {e}") from None
+                if operation.expect is not None and result["affected"] != operation.expect:
+                    raise BulkConflict(f"operation {index} affects {result['affected']} rows, "
+                                       f"not the expected {operation.expect}")
+                results.append(dict(result, index=index))
+            if preview:
+                await conn.rollback()
+            else:
+                await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    if not preview:
+        catalog.invalidate()
+        search.changed()
+    return {
+        "preview": preview,
+        "committed": not preview,
+        "affected": sum(result["affected"] for result in results),
+        "operations": results,
+    }
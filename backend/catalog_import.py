@@ -0,0 +1,441 @@
+import asyncio
+import csv
+import io
+import itertools
+import logging
+import os
+import time
+import zipfile
+from decimal import Decimal, InvalidOperation
+import catalog
+import codes
+import database
+import groups
+import images
+import metrics
+import search
+import variants
+
+# Bulk catalog import
+#
+# A vendor catalog arrives as CSV or XLSX with one row per product and size:
+# productName, productDescription, category, size, unitPrice and quantity,
+# optionally color and image_path (an image already uploaded to
+# POST /products/images). Served on POST /products/import and by
+# `python catalog_import.py` (see --help).
+#
+# The file is read twice as a stream, never loaded whole: the first pass
+# validates every row without touching the database, the second handles
+# IMPORT_BATCH_SIZE rows at a time, matching them against the catalog with
+# one query and writing them set-based: new groups and Products rows with
+# multi-row INSERT ... OUTPUT statements, their variants in shared multi-row
+# INSERTs (variants.create_many) and the availability counts with one UPDATE
+# per few hundred products. The whole file is one transaction, and nothing is
+# written if any row is rejected; the report lists every rejected row with
+# its line number and reasons.
+#
+# A row matches an existing active size by product group, sizeKey and
+# description (see groups.py) and its quantity is added to that size's stock;
+# a row that matches nothing creates the size, and its group if needed. With
+# dry_run the same report, including what each row would change, is produced
+# without writing anything.
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))  # rows matched and written per round
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 50000))
+IMPORT_MAX_QUANTITY = int(os.getenv("IMPORT_MAX_QUANTITY", 10000))  # units per row
+IMPORT_REPORT_MAX = int(os.getenv("IMPORT_REPORT_MAX", 1000))  # rejected rows and changes listed in a report
+
+FORMATS = ("csv", "xlsx")
+
+# header, lowercased without spaces and underscores -> field
+COLUMNS = {
+    "productname": "productName", "name": "productName",
+    "productdescription": "productDescription", "description": "productDescription",
+    "category": "category",
+    "size": "size",
+    "unitprice": "unitPrice", "price": "unitPrice",
+    "quantity": "quantity", "qty": "quantity",
+    "color": "color", "colour": "color",
+    "imagepath": "image_path", "image": "image_path",
+}
+REQUIRED = ("productName", "productDescription", "category", "size", "unitPrice", "quantity")
+
+PRODUCT_COLUMNS = ("productName", "productDescription", "size", "color", "category", "unitPrice",
+                   "image_path", "currentStock", "productGroupID", "sizeKey")
+_PRODUCTS_PER_INSERT = 2000 // len(PRODUCT_COLUMNS)  # SQL Server allows 2100 parameters
+
+LOOKUP_QUERY = '''SELECT g.groupKey, g.productGroupID, p.productID, p.sizeKey, p.productDescription,
+        p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max)) AS image_path
+    FROM ProductGroups AS g
+    LEFT JOIN Products AS p
+    ON p.productGroupID = g.productGroupID AND p.isActive = 1
+    WHERE g.groupKey IN ({keys})'''
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+class Row:
+    __slots__ = ("line", "name", "description", "category", "size", "color", "price", "quantity",
+                 "image_path", "group_key", "size_key")
+
+    def __init__(self, line, fields):
+        self.line = line
+        self.name = fields["productName"]
+        self.description = fields["productDescription"]
+        self.category = fields["category"]
+        self.size = fields["size"]
+        self.color = fields.get("color")
+        self.price = fields["unitPrice"]
+        self.quantity = fields["quantity"]
+        self.image_path = fields.get("image_path")
+        self.group_key = groups.group_key(self.name, self.category)
+        self.size_key = groups.size_key(self.size)
+
+    @property
+    def key(self):
+        return self.group_key, self.size_key, self.description
+
+
+def format_of(filename):
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension not in FORMATS:
+        raise ImportFormatError(f"Cannot tell the file format from '{filename}'; use .csv or .xlsx")
+    return extension
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    except UnicodeDecodeError:
+        raise ImportFormatError("CSV files must be UTF-8 encoded")
+    finally:
+        if not file.closed:  # leave the upload open for its owner
+            text.detach()
+
+
+def _xlsx_rows(file):
+    try:
+        import openpyxl  # only needed for XLSX imports
+    except ImportError:
+        raise ImportFormatError("XLSX imports need the openpyxl package; upload the catalog as CSV")
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError):
+        raise ImportFormatError("Not a readable XLSX workbook")
+    try:
+        for values in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else value for value in values]
+    finally:
+        workbook.close()
+
+
+def _text(value):
+    # spreadsheet cells: 42.0 is size "42"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _validate(values, header):
+    """Parsed fields of one row and the list of what is wrong with it."""
+    fields, errors = {}, []
+    for index, field in header.items():
+        value = _text(values[index]) if index < len(values) else ""
+        if value:
+            fields[field] = value
+        elif field in REQUIRED:
+            errors.append(f"{field} is required")
+
+    if "category" in fields:
+        fields["category"] = catalog.resolve(fields["category"])
+    if "unitPrice" in fields:
+        try:
+            price = Decimal(fields["unitPrice"].lstrip("$"))
+            if not price.is_finite() or price < 0:
+                raise InvalidOperation
+            if price != price.quantize(Decimal("0.01")):
+                errors.append("unitPrice has more than two decimal places")
+            fields["unitPrice"] = price
+        except InvalidOperation:
+            errors.append(f"unitPrice '{fields['unitPrice']}' is not a price")
+    if "quantity" in fields:
+        try:
+            quantity = Decimal(fields["quantity"])
+            if not quantity.is_finite() or quantity != quantity.to_integral_value() or quantity < 0:
+                raise InvalidOperation
+            if quantity > IMPORT_MAX_QUANTITY:
+                errors.append(f"quantity is over the limit of {IMPORT_MAX_QUANTITY} per row")
+            fields["quantity"] = int(quantity)
+        except InvalidOperation:
+            errors.append(f"quantity '{fields['quantity']}' is not a whole number of units")
+    if "image_path" in fields:
+        stored = images.stored_path(fields["image_path"])
+        if stored is None:
+            errors.append("image_path is not an uploaded image (see POST /products/images)")
+        fields["image_path"] = stored
+    return fields, errors
+
+
+class CatalogImport:
+    """One import run of an open CSV or XLSX file; run() returns the report."""
+
+    def __init__(self, file, format="csv", dry_run=False, batch_size=None):
+        if format not in FORMATS:
+            raise ImportFormatError(f"Unknown import format '{format}'")
+        self.file = file
+        self.format = format
+        self.dry_run = dry_run
+        self.batch_size = batch_size or IMPORT_BATCH_SIZE
+        self.rows = 0
+        self.units = 0
+        self.rejected = {}  # line -> reasons
+        self.counts = {"created": 0, "restocked": 0, "unchanged": 0}
+        self.groups_created = 0
+        self.variants_created = 0
+        self.changes = []
+        self.categories = set()
+        self.seconds = 0.0
+        self._new_groups = {}  # groupKey -> productGroupID (None on a dry run)
+        self._group_images = {}  # groupKey -> image_path for new sizes without one
+        self._reserved = None  # codes.prefetch() result for the variants
+
+    def _lines(self):
+        """(line number, Row or None, reasons) for every non-blank data row."""
+        self.file.seek(0)
+        values = _xlsx_rows(self.file) if self.format == "xlsx" else _csv_rows(self.file)
+        headings = next(values, None)
+        if headings is None:
+            raise ImportFormatError("The file is empty")
+        header = {}
+        for index, heading in enumerate(headings):
+            field = COLUMNS.get(_text(heading).lower().replace(" ", "").replace("_", ""))
+            if field is not None and field not in header.values():
+                header[index] = field
+        missing = [field for field in REQUIRED if field not in header.values()]
+        if missing:
+            raise ImportFormatError(f"Missing columns: {', '.join(missing)}")
+
+        seen = {}
+        for line, row in enumerate(values, start=2):
+            if not any(_text(value) for value in row):
+                continue
+            fields, errors = _validate(row, header)
+            parsed = Row(line, fields) if not errors else None
+            if parsed is not None:
+                first = seen.setdefault(parsed.key, line)
+                if first != line:
+                    errors.append(f"duplicates line {first} (same product, size and description)")
+                    parsed = None
+            yield line, parsed, errors
+
+    async def _batches(self):
+        # parsing runs off the event loop; the generator is only ever advanced by one thread at a time
+        lines = self._lines()
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(lines, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _reject(self, line, errors):
+        self.rejected[line] = errors
+
+    def _change(self, row, action, product_id, group_id, before):
+        self.counts[action] += 1
+        self.categories.add(row.category)
+        if len(self.changes) < IMPORT_REPORT_MAX:
+            self.changes.append({
+                "line": row.line,
+                "action": action,
+                "productID": product_id,
+                "productGroupID": group_id,
+                "productName": row.name,
+                "size": row.size,
+                "unitPrice": float(row.price),
+                "quantity": row.quantity,
+                "currentStock": {"before": before, "after": before + row.quantity},
+            })
+
+    async def _validate_all(self):
+        async for batch in self._batches():
+            for line, row, errors in batch:
+                self.rows += 1
+                if self.rows > IMPORT_MAX_ROWS:
+                    raise ImportFormatError(f"Imports are limited to {IMPORT_MAX_ROWS} rows")
+                if errors:
+                    self._reject(line, errors)
+                else:
+                    self.units += row.quantity
+
+    async def _lookup(self, cursor, batch):
+        keys = list({row.group_key for row in batch})
+        await cursor.execute(LOOKUP_QUERY.format(keys=", ".join("?" * len(keys))), keys)
+        group_ids, sizes, group_images = {}, {}, {}
+        for group_key, group_id, product_id, size_key, description, price, stock, image_path in await cursor.fetchall():
+            group_ids[group_key] = group_id
+            if product_id is not None:
+                sizes[(group_key, size_key, description)] = (product_id, price, stock)
+                if image_path and group_key not in group_images:
+                    group_images[group_key] = image_path
+        return group_ids, sizes, group_images
+
+    async def _apply(self, cursor, batch):
+        """Match one batch of valid rows and, unless this is a dry run, write it."""
+        group_ids, sizes, group_images = await self._lookup(cursor, batch)
+        creates, restocks = [], {}
+        for row in batch:
+            match = sizes.get(row.key)
+            if match is None:
+                creates.append(row)
+                continue
+            product_id, price, stock = match
+            if groups.cents(price) != groups.cents(row.price):
+                self._reject(row.line, [f"already listed at {float(price):.2f}; reprice it before importing stock"])
+            elif row.quantity == 0:
+                self._change(row, "unchanged", product_id, group_ids[row.group_key], stock)
+            else:
+                restocks[product_id] = row.quantity
+                self._change(row, "restocked", product_id, group_ids[row.group_key], stock)
+
+        wanted = {row.group_key: (row.name, row.category) for row in creates
+                  if row.group_key not in group_ids and row.group_key not in self._new_groups}
+        if wanted:
+            created = await groups.ensure_many(cursor, wanted) if not self.dry_run else dict.fromkeys(wanted)
+            self._new_groups.update(created)
+            self.groups_created += len(created)
+        for row in creates:
+            image_path = row.image_path or group_images.get(row.group_key) or self._group_images.get(row.group_key)
+            row.image_path = image_path
+            if image_path:
+                self._group_images.setdefault(row.group_key, image_path)
+
+        if self.dry_run or self.rejected:
+            # nothing will be committed; only the report is still of interest
+            for row in creates:
+                self._change(row, "created", None, group_ids.get(row.group_key, self._new_groups.get(row.group_key)), 0)
+            return
+
+        new_products = {}
+        for start in range(0, len(creates), _PRODUCTS_PER_INSERT):
+            chunk = creates[start:start + _PRODUCTS_PER_INSERT]
+            params = []
+            for row in chunk:
+                group_id = group_ids.get(row.group_key) or self._new_groups[row.group_key]
+                params += (row.name, row.description, row.size, row.color, row.category, row.price,
+                           row.image_path, row.quantity, group_id, row.size_key)
+            await cursor.execute(
+                f'''INSERT INTO Products ({", ".join(PRODUCT_COLUMNS)}, isActive, updatedAt)
+                   OUTPUT inserted.productID, inserted.productGroupID, inserted.sizeKey, inserted.productDescription
+                   VALUES {", ".join(["(" + ", ".join("?" * len(PRODUCT_COLUMNS)) + ", 1, SYSUTCDATETIME())"] * len(chunk))}''',
+                params
+            )
+            # OUTPUT order is not guaranteed: map the ids back by key
+            inserted = {(group_id, size_key, description): product_id
+                        for product_id, group_id, size_key, description in await cursor.fetchall()}
+            for row in chunk:
+                group_id = group_ids.get(row.group_key) or self._new_groups[row.group_key]
+                product_id = inserted[(group_id, row.size_key, row.description)]
+                new_products[product_id] = row.quantity
+                self._change(row, "created", product_id, group_id, 0)
+
+        # new sizes were inserted with their currentStock, like add_product
+        self.variants_created += await variants.create_many(cursor, new_products, reserved=self._reserved)
+        self.variants_created += await variants.create_many(cursor, restocks, add_stock=True, reserved=self._reserved)
+
+    async def _run(self):
+        await self._validate_all()
+        if self.rejected and not self.dry_run:
+            return False
+
+        # rows are matched through ProductGroups, so every row needs its keys
+        await groups.complete()
+        if not self.dry_run:
+            # reserve the variants' codes before the transaction takes any locks
+            self._reserved = await codes.prefetch(self.units)
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+            try:
+                async for batch in self._batches():
+                    valid = [row for _, row, _ in batch if row is not None]
+                    if valid:
+                        await self._apply(cursor, valid)
+                if self.dry_run or self.rejected:
+                    await conn.rollback()
+                    return False
+                await conn.commit()
+                return True
+            except Exception:
+                await conn.rollback()
+                raise
+
+    async def run(self):
+        started = time.perf_counter()
+        try:
+            committed = await self._run()
+        finally:
+            self.seconds = time.perf_counter() - started
+            metrics.CATALOG_IMPORT_DURATION.labels("dry_run" if self.dry_run else "commit").observe(self.seconds)
+        if not committed:
+            return self.report(committed=False)
+
+        for category in self.categories:
+            catalog.invalidate(category)
+        search.changed()
+        for action, count in self.counts.items():
+            metrics.CATALOG_IMPORT_ROWS.labels(action).inc(count)
+        logging.info(
+            f"Imported {self.rows} catalog rows in {self.seconds:.2f}s: {self.counts['created']} sizes created, "
+            f"{self.counts['restocked']} restocked, {self.groups_created} new products, "
+            f"{self.variants_created} variants"
+        )
+        return self.report(committed=True)
+
+    def report(self, committed):
+        rejected = sorted(self.rejected.items())
+        return {
+            "dryRun": self.dry_run,
+            "committed": committed,
+            "rows": self.rows,
+            "rejected": len(rejected),
+            "created": self.counts["created"],
+            "restocked": self.counts["restocked"],
+            "unchanged": self.counts["unchanged"],
+            "productGroupsCreated": self.groups_created,
+            "units": self.units,
+            "variantsCreated": self.variants_created,
+            "seconds": round(self.seconds, 3),
+            "errors": [{"line": line, "errors": errors} for line, errors in rejected[:IMPORT_REPORT_MAX]],
+            "changes": self.changes,
+            "truncated": len(rejected) > IMPORT_REPORT_MAX or sum(self.counts.values()) > len(self.changes),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Import products x sizes x quantities from a CSV or XLSX file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without writing them")
+    args = parser.parse_args()
+
+    async def main():
+        await database.init_pool()
+        try:
+            with open(args.path, "rb") as file:
+                return await CatalogImport(file, args.format or format_of(args.path), args.dry_run).run()
+        finally:
+            await database.close_pool()
+
+    try:
+        report = asyncio.run(main())
+    except ImportFormatError as e:
+        sys.exit(f"error: {e}")
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    sys.exit(0 if report["committed"] or (args.dry_run and not report["rejected"]) else 1)
@@ -0,0 +1,154 @@
+import asyncio
+import itertools
+import os
+import database
+import metrics
+
+# Barcode and SKU allocation
+#
+# Both codes are minted from sequences in the CodeSequences table. A worker
+# reserves a block of values with one UPDATE ... OUTPUT (committed on its own
+# connection straight away, so the row is locked only for that statement)
+# and hands codes out of the block from memory; blocks never overlap, so
+# codes are unique across workers without checking each one. Unused values
+# of a block are lost when the worker stops, which leaves gaps but never
+# duplicates. ProductVariants.barcode also has a unique index as a backstop.
+#
+# Routes that create variants call prefetch() before opening their write
+# transaction and pass what it returns to the variant functions: the codes
+# are taken out of the shared block for that request, so concurrent requests
+# cannot use them up, and no second pooled connection is needed while the
+# request holds its own. Only a caller that did not prefetch (or prefetched
+# too few) still reserves on a connection of its own from inside its
+# transaction.
+#
+# Barcodes are EAN-13: BARCODE_PREFIX, the serial zero-padded to fill twelve
+# digits, and the check digit. SKUs are SKU_LENGTH base-36 characters: the
+# serial is scrambled with a bijection mod 36^SKU_LENGTH, so consecutive SKUs
+# do not look alike.
+
+BARCODE_PREFIX = os.getenv("BARCODE_PREFIX", "200")  # GS1 prefix; 200-299 is reserved for in-store numbering
+SKU_LENGTH = int(os.getenv("SKU_LENGTH", 8))
+CODE_BLOCK_SIZE = int(os.getenv("CODE_BLOCK_SIZE", 1000))  # sequence values reserved per round trip
+
+SKU_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_SKU_SPACE = 36 ** SKU_LENGTH
+_SKU_MULTIPLIER = 2654435761 % _SKU_SPACE  # coprime with 36, so the scramble is a bijection
+_SKU_OFFSET = 1013904223 % _SKU_SPACE
+_SERIAL_DIGITS = 12 - len(BARCODE_PREFIX)
+# base-36 digits two at a time
+_SKU_PAIR_CHARS = [a + b for a in SKU_ALPHABET for b in SKU_ALPHABET]
+_SKU_PAIRS = (SKU_LENGTH + 1) // 2
+
+_blocks = {}
+_locks = {}
+
+
+class SequenceExhaustedError(Exception):
+    pass
+
+
+def ean13(payload):
+    """Append the EAN-13 check digit to a 12-digit payload."""
+    # weights 1, 3, 1, 3, ... from the left
+    total = sum(payload[0::2].encode()) + 3 * sum(payload[1::2].encode()) - 48 * 4 * 6
+    return payload + str(-total % 10)
+
+
+def is_valid_ean13(code):
+    return len(code) == 13 and code.isdigit() and ean13(code[:12]) == code
+
+
+def format_barcode(serial):
+    if serial >= 10 ** _SERIAL_DIGITS:
+        raise SequenceExhaustedError(f"Barcode serials for prefix {BARCODE_PREFIX} are exhausted")
+    return ean13(f"{BARCODE_PREFIX}{serial:0{_SERIAL_DIGITS}d}")
+
+
+def format_sku(serial):
+    if serial >= _SKU_SPACE:
+        raise SequenceExhaustedError("SKU serials are exhausted")
+    value = (serial * _SKU_MULTIPLIER + _SKU_OFFSET) % _SKU_SPACE
+    pairs = []
+    for _ in range(_SKU_PAIRS):
+        value, pair = divmod(value, 1296)
+        pairs.append(_SKU_PAIR_CHARS[pair])
+    return "".join(reversed(pairs))[-SKU_LENGTH:]
+
+
+async def _reserve_block(name, size):
+    async with database.connection("write") as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''UPDATE CodeSequences
+               SET nextValue = nextValue + ?
+               OUTPUT inserted.nextValue
+               WHERE name = ?''',
+            (size, name)
+        )
+        row = await cursor.fetchone()
+        await conn.commit()
+    if row is None:
+        raise RuntimeError(f"Sequence '{name}' is missing from CodeSequences")
+    metrics.CODE_BLOCKS_RESERVED.labels(name).inc()
+    end = int(row[0])
+    return end - size, end
+
+
+def _lock(name):
+    lock = _locks.get(name)
+    if lock is None:
+        lock = _locks[name] = asyncio.Lock()
+    return lock
+
+
+async def reserve(name, count):
+    """Reserve `count` values of a sequence; returns them as a list of ranges."""
+    if count <= 0:
+        return []
+    async with _lock(name):
+        start, end = _blocks.get(name, (0, 0))
+        taken = min(count, end - start)
+        ranges = [range(start, start + taken)] if taken else []
+        start += taken
+        if taken < count:
+            # one round trip covers the rest of a large request plus a block for later calls
+            start, end = await _reserve_block(name, count - taken + CODE_BLOCK_SIZE)
+            ranges.append(range(start, start + count - taken))
+            start += count - taken
+        _blocks[name] = (start, end)
+    return ranges
+
+
+async def prefetch(count):
+    """Take `count` barcodes and SKUs for the caller; pass the result to barcodes()/skus() as `reserved`.
+
+    Call before opening a write transaction that creates variants: on SQLite
+    the reservation's own write would wait for that transaction to finish,
+    and elsewhere it would take a second pooled connection.
+    """
+    return {name: itertools.chain.from_iterable(await reserve(name, count)) for name in ("barcode", "sku")}
+
+
+async def _serials(name, count, reserved):
+    taken = list(itertools.islice(reserved[name], count)) if reserved is not None else []
+    if len(taken) == count:
+        return taken
+    # not (or not enough) prefetched: reserved on a connection of its own
+    return itertools.chain(taken, itertools.chain.from_iterable(await reserve(name, count - len(taken))))
+
+
+async def barcodes(count, reserved=None):
+    """Iterator over `count` new EAN-13 barcodes, drawn from a prefetch() result if given."""
+    return map(format_barcode, await _serials("barcode", count, reserved))
+
+
+async def skus(count, reserved=None):
+    """Iterator over `count` new SKUs, drawn from a prefetch() result if given."""
+    return map(format_sku, await _serials("sku", count, reserved))
+
+
+def reset():
+    """Forget reserved blocks (on startup; the database may have changed between runs)."""
+    _blocks.clear()
+    _locks.clear()
@@ -1,56 +1,588 @@
-import aioodbc
+import asyncio
+import logging
 import os
+import time
+import traceback
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import wraps
 from dotenv import load_dotenv
+from backends import get_backend
+import metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get database configuration from environment variables
-server = os.getenv("DB_SERVER")
-database = os.getenv("DB_NAME")
-username = os.getenv("DB_USER")
-password = os.getenv("DB_PASSWORD")
-driver = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")  # Default to ODBC Driver 17
+# Which database to talk to: "mssql" (Azure SQL, the default) or "sqlite" (local stand-in)
+DB_BACKEND = os.getenv("DB_BACKEND", "mssql")
+backend = get_backend(DB_BACKEND)
 
-# Async function to get database connection
+# Connection pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))  # seconds to wait for a free connection
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", 30))  # ping connections idle longer than this on checkout
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))  # close idle connections above min size after this
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", 1800))  # replace connections older than this
+DB_KEEPALIVE_INTERVAL = float(os.getenv("DB_KEEPALIVE_INTERVAL", 300))  # 0 disables; keeps serverless databases from auto-pausing
+DB_LEAK_THRESHOLD = float(os.getenv("DB_LEAK_THRESHOLD", 30))  # 0 disables; log connections held longer than this
+
+# Read replica configuration (Azure SQL read scale-out / geo-replica)
+DB_READ_REPLICA = os.getenv("DB_READ_REPLICA", "false").lower() == "true"
+DB_READ_POOL_MIN_SIZE = int(os.getenv("DB_READ_POOL_MIN_SIZE", 1))
+DB_READ_POOL_MAX_SIZE = int(os.getenv("DB_READ_POOL_MAX_SIZE", DB_POOL_MAX_SIZE))
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))  # seconds; reads fall back to the primary above this
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 15))
+DB_REPLICA_RETRY_AFTER = float(os.getenv("DB_REPLICA_RETRY_AFTER", 30))  # seconds to avoid a replica that failed
+DB_REPLICA_LAG_QUERY = os.getenv(
+    "DB_REPLICA_LAG_QUERY",
+    "SELECT MAX(secondary_lag_seconds) FROM sys.dm_database_replica_states WHERE is_local = 0",
+)
+
+
+class PoolClosedError(Exception):
+    """Raised when a connection is requested from a pool that is not open."""
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes free within the acquire timeout."""
+
+
+def dialect():
+    """SQL dialect of the configured backend, for the few statements that differ."""
+    return backend.name
+
+
+# Open a new physical connection (used by the pool, not by the routers)
 async def get_db_connection():
-    dsn = (
-        f"DRIVER={{{driver}}};"
-        f"SERVER={server};"
-        f"DATABASE={database};"
-        f"UID={username};"
-        f"PWD={password};"
-        f"Encrypt=yes;"
-        f"TrustServerCertificate=no;"
-    )
+    return await backend.connect()
+
+
+# Open a read-only connection to the replica
+async def get_read_db_connection():
+    return await backend.connect_read()
+
+
+async def ping(conn):
+    async with conn.cursor() as cursor:
+        await cursor.execute("SELECT 1")
+        await cursor.fetchone()
+
+
+class _PoolEntry:
+    __slots__ = ("conn", "created_at", "last_used", "acquired_at", "acquired_stack", "leak_reported")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.acquired_at = None
+        self.acquired_stack = None
+        self.leak_reported = False
+
+
+class ConnectionPool:
+    """Process-wide pool of database connections.
+
+    Idle connections are reused LIFO so the hot ones stay warm and the extras
+    age out. Connections idle longer than `healthcheck_after` are pinged before
+    being handed out, and a background task trims idle connections, refills the
+    pool to `min_size` and pings the database every `keepalive_interval`.
+
+    When `leak_threshold` is set, the stack that acquired each connection is
+    recorded and any connection held longer than the threshold is logged with
+    that stack once.
+    """
+
+    def __init__(self, connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT, healthcheck_after=DB_POOL_HEALTHCHECK_AFTER,
+                 max_idle=DB_POOL_MAX_IDLE, recycle=DB_POOL_RECYCLE,
+                 keepalive_interval=DB_KEEPALIVE_INTERVAL, leak_threshold=DB_LEAK_THRESHOLD,
+                 reset_on_release=True, name="primary"):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.healthcheck_after = healthcheck_after
+        self.max_idle = max_idle
+        self.recycle = recycle
+        self.keepalive_interval = keepalive_interval
+        self.leak_threshold = leak_threshold
+        self.reset_on_release = reset_on_release
+        self._connect = connect
+        self._idle = deque()
+        self._checked_out = set()
+        self._size = 0  # open connections plus connections being opened
+        self._waiting = 0
+        self._cond = asyncio.Condition()
+        self._closed = True
+        self._maintenance_task = None
+        self._last_activity = time.monotonic()
+        self._stats = {
+            "acquired_total": 0,
+            "created_total": 0,
+            "closed_total": 0,
+            "timeouts_total": 0,
+            "healthcheck_failures_total": 0,
+            "wait_seconds_total": 0.0,
+            "max_wait_seconds": 0.0,
+            "leaks_reported_total": 0,
+        }
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def open(self, fill=True):
+        """Start the pool; with fill=False connections are opened on first use or by warm()."""
+        if not self._closed:
+            return
+        self._closed = False
+        self._maintenance_task = asyncio.create_task(self._maintenance())
+        if fill:
+            await self._fill()
+        logging.info(f"Database pool '{self.name}' opened (min={self.min_size}, max={self.max_size})")
+
+    async def warm(self):
+        """Open connections up to min_size."""
+        await self._fill()
+
+    async def close(self):
+        """Close idle connections; connections still in use are closed when released."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        async with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            await self._close_entry(entry)
+        logging.info(f"Database pool '{self.name}' closed")
+
+    @asynccontextmanager
+    async def acquire(self):
+        entry = await self._acquire()
+        discard = False
+        try:
+            yield metrics.instrument(entry.conn)
+        except BaseException as e:
+            # a connection that failed at the driver level is not worth keeping
+            discard = _is_disconnect(e)
+            raise
+        finally:
+            await self._release(entry, discard)
+
+    def stats(self):
+        in_use = self._size - len(self._idle)
+        now = time.monotonic()
+        oldest = max((now - entry.acquired_at for entry in self._checked_out), default=0.0)
+        return {
+            "name": self.name,
+            "open": not self._closed,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": in_use,
+            "waiting": self._waiting,
+            "oldest_checkout_seconds": round(oldest, 3),
+            **self._stats,
+        }
+
+    async def _acquire(self):
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        while True:
+            entry = None
+            async with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosedError(f"Database pool '{self.name}' is not open")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1  # reserve the slot, connect outside the lock
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts_total"] += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.acquire_timeout}s waiting for a connection "
+                            f"from pool '{self.name}' (max_size={self.max_size})"
+                        )
+                    self._waiting += 1
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    finally:
+                        self._waiting -= 1
+
+            if entry is None:
+                entry = await self._new_entry()
+            elif not await self._check(entry):
+                async with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                await self._close_entry(entry)
+                continue
+
+            waited = time.monotonic() - started
+            self._stats["acquired_total"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            metrics.observe_pool_wait(self.name, waited)
+            self._last_activity = time.monotonic()
+            entry.acquired_at = self._last_activity
+            entry.leak_reported = False
+            if self.leak_threshold:
+                # skip the pool's own frames so the log points at the caller
+                entry.acquired_stack = traceback.extract_stack(limit=16)[:-3]
+            self._checked_out.add(entry)
+            return entry
+
+    async def _new_entry(self):
+        try:
+            conn = await self._connect()
+        except BaseException:
+            async with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._stats["created_total"] += 1
+        return _PoolEntry(conn)
+
+    async def _check(self, entry):
+        """Return False if the idle connection should be replaced instead of handed out."""
+        now = time.monotonic()
+        if getattr(entry.conn, "closed", False):
+            return False
+        if self.recycle and now - entry.created_at > self.recycle:
+            return False
+        if now - entry.last_used > self.healthcheck_after:
+            try:
+                await ping(entry.conn)
+            except Exception as e:
+                self._stats["healthcheck_failures_total"] += 1
+                logging.warning(f"Dropping stale connection from pool '{self.name}': {e}")
+                return False
+        return True
+
+    async def _release(self, entry, discard=False):
+        self._checked_out.discard(entry)
+        entry.acquired_stack = None
+        if getattr(entry.conn, "closed", False):
+            discard = True
+        elif not discard and self.reset_on_release:
+            try:
+                # end whatever transaction the handler left open
+                await entry.conn.rollback()
+            except Exception as e:
+                logging.warning(f"Discarding connection that failed to reset: {e}")
+                discard = True
+        entry.last_used = time.monotonic()
+        async with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+        if discard or self._closed:
+            await self._close_entry(entry)
+
+    async def _close_entry(self, entry):
+        self._stats["closed_total"] += 1
+        try:
+            if not getattr(entry.conn, "closed", False):
+                await entry.conn.close()
+        except Exception as e:
+            logging.warning(f"Error closing pooled connection: {e}")
+
+    async def _fill(self):
+        while not self._closed:
+            async with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            entry = await self._new_entry()
+            async with self._cond:
+                self._idle.appendleft(entry)
+                self._cond.notify()
+
+    def _report_leaks(self):
+        now = time.monotonic()
+        for entry in list(self._checked_out):
+            held = now - entry.acquired_at
+            if entry.leak_reported or held < self.leak_threshold:
+                continue
+            entry.leak_reported = True
+            self._stats["leaks_reported_total"] += 1
+            stack = "".join(traceback.format_list(entry.acquired_stack or []))
+            logging.warning(
+                f"Connection from pool '{self.name}' held for {held:.1f}s "
+                f"(threshold {self.leak_threshold}s); acquired at:\n{stack}"
+            )
+
+    async def _trim(self):
+        now = time.monotonic()
+        expired = []
+        async with self._cond:
+            keep = deque()
+            # oldest-used connections sit at the left end of the deque
+            for entry in self._idle:
+                too_old = self.recycle and now - entry.created_at > self.recycle
+                too_idle = now - entry.last_used > self.max_idle and self._size - len(expired) > self.min_size
+                if too_old or too_idle:
+                    expired.append(entry)
+                else:
+                    keep.append(entry)
+            self._idle = keep
+            self._size -= len(expired)
+        for entry in expired:
+            await self._close_entry(entry)
+
+    async def _maintenance(self):
+        interval = min(self.keepalive_interval or 60, self.leak_threshold or 60, 60)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.leak_threshold:
+                    self._report_leaks()
+                await self._trim()
+                await self._fill()
+                if self.keepalive_interval and time.monotonic() - self._last_activity >= self.keepalive_interval:
+                    async with self.acquire() as conn:
+                        await ping(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Database pool '{self.name}' maintenance failed: {e}")
+
+
+def _is_disconnect(exc):
+    # pyodbc reports broken links with SQLSTATE 08xxx (connection exceptions)
+    args = getattr(exc, "args", ())
+    return bool(args) and isinstance(args[0], str) and args[0].startswith("08")
+
+
+# The process-wide pools, created in the FastAPI lifespan
+pool = None
+read_pool = None
+
+# Which pool the current route reads from; set by @read_only
+_route_intent = ContextVar("db_route_intent", default="write")
+
+_replica_state = {
+    "lag_seconds": None,
+    "down_until": 0.0,
+    "last_error": None,
+}
+_routing_stats = {
+    "replica_reads": 0,
+    "primary_reads": 0,
+    "replica_fallbacks": 0,
+}
+_replica_monitor_task = None
+
+
+# fill=False returns without connecting; call warm_pool() (a startup task) to connect
+async def init_pool(fill=True):
+    global pool, read_pool, _replica_monitor_task
+    if pool is None:
+        await backend.prepare()
+        pool = ConnectionPool(get_db_connection)
+    await pool.open(fill)
+    if DB_READ_REPLICA and read_pool is None:
+        read_pool = ConnectionPool(
+            get_read_db_connection,
+            min_size=DB_READ_POOL_MIN_SIZE,
+            max_size=DB_READ_POOL_MAX_SIZE,
+            reset_on_release=False,  # autocommit snapshot reads leave nothing to roll back
+            name="replica",
+        )
+        try:
+            await read_pool.open(fill)
+        except Exception as e:
+            # the app still works off the primary; the pool refills itself once the replica is back
+            _mark_replica_down(e)
+        if backend.name == "mssql":
+            _replica_monitor_task = asyncio.create_task(_monitor_replica_lag())
+    return pool
+
+
+async def warm_pool(retry_interval=2.0):
+    """Connect the primary pool up to its min size, retrying until it succeeds
+    (e.g. while a serverless database resumes or a firewall rule propagates)."""
+    while True:
+        try:
+            await pool.warm()
+            break
+        except Exception as e:
+            logging.warning(f"Database not reachable yet, retrying in {retry_interval}s: {e}")
+            await asyncio.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, 30)
+    if read_pool is not None:
+        try:
+            await read_pool.warm()
+        except Exception as e:
+            _mark_replica_down(e)
+
+
+async def close_pool():
+    global pool, read_pool, _replica_monitor_task
+    if _replica_monitor_task is not None:
+        _replica_monitor_task.cancel()
+        try:
+            await _replica_monitor_task
+        except asyncio.CancelledError:
+            pass
+        _replica_monitor_task = None
+    if read_pool is not None:
+        await read_pool.close()
+        read_pool = None
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+def read_only(handler):
+    """Route decorator: serve this handler's connections from the read replica.
+
+    Only for routes that can tolerate replica lag; writes and read-your-writes
+    paths stay undecorated and use the primary.
+    """
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        token = _route_intent.set("read")
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            _route_intent.reset(token)
+
+    return wrapper
+
+
+def _mark_replica_down(error):
+    _replica_state["down_until"] = time.monotonic() + DB_REPLICA_RETRY_AFTER
+    _replica_state["last_error"] = str(error)
+    logging.warning(f"Read replica unavailable, routing reads to the primary for {DB_REPLICA_RETRY_AFTER}s: {error}")
+
+
+def _replica_usable():
+    if read_pool is None or read_pool.closed:
+        return False
+    if time.monotonic() < _replica_state["down_until"]:
+        return False
+    lag = _replica_state["lag_seconds"]
+    return lag is None or lag <= DB_REPLICA_MAX_LAG
+
+
+async def _monitor_replica_lag():
+    while True:
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(DB_REPLICA_LAG_QUERY)
+                    row = await cursor.fetchone()
+            lag = float(row[0]) if row and row[0] is not None else None
+            if lag is not None and lag > DB_REPLICA_MAX_LAG and (_replica_state["lag_seconds"] or 0) <= DB_REPLICA_MAX_LAG:
+                logging.warning(f"Read replica is {lag:.1f}s behind, routing reads to the primary")
+            _replica_state["lag_seconds"] = lag
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Could not check read replica lag: {e}")
+        await asyncio.sleep(DB_REPLICA_LAG_CHECK_INTERVAL)
+
+
+# Borrow a pooled connection for the duration of the block.
+# Routes decorated with @read_only (or intent="read") get a replica connection
+# when one is configured and healthy, otherwise the primary.
+@asynccontextmanager
+async def connection(intent=None):
+    if pool is None:
+        raise PoolClosedError("Database pool has not been initialised")
+    if (intent or _route_intent.get()) == "read":
+        if _replica_usable():
+            acquire = read_pool.acquire()
+            try:
+                conn = await acquire.__aenter__()
+            except Exception as e:
+                _mark_replica_down(e)
+            else:
+                _routing_stats["replica_reads"] += 1
+                try:
+                    yield conn
+                except BaseException as exc:
+                    if not await acquire.__aexit__(type(exc), exc, exc.__traceback__):
+                        raise
+                else:
+                    await acquire.__aexit__(None, None, None)
+                return
+        if read_pool is not None:
+            _routing_stats["replica_fallbacks"] += 1
+        _routing_stats["primary_reads"] += 1
+    async with pool.acquire() as conn:
+        yield conn
+
+
+# Request-scoped connection for FastAPI routes: db=Depends(database.get_db)
+async def get_db():
+    async with connection() as conn:
+        try:
+            yield conn
+        except Exception:
+            # undo anything the handler wrote before failing
+            await conn.rollback()
+            raise
 
-    try:
-        conn = await aioodbc.connect(dsn=dsn, autocommit=True)
-        print("✅ Connection successful")
 
-        async def dict_row_factory(cursor, row):
-            return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
+# Read-only variant for routes that take their connection as a dependency
+async def get_read_db():
+    async with connection("read") as conn:
+        yield conn
 
-        async with conn.cursor() as cursor:
-            cursor.row_factory = dict_row_factory  # Assign row factory
 
-        return conn  # Return the connection
+def pool_stats():
+    stats = pool.stats() if pool is not None else {"open": False}
+    if DB_READ_REPLICA:
+        stats["replica"] = {
+            **(read_pool.stats() if read_pool is not None else {"open": False}),
+            "usable": _replica_usable(),
+            "lag_seconds": _replica_state["lag_seconds"],
+            "last_error": _replica_state["last_error"],
+        }
+    stats["routing"] = dict(_routing_stats)
+    return stats
 
-    except Exception as e:
-        print(f"❌ Connection failed: {str(e)}")
-        return None  # Return None in case of failure
 
 # Test connection (Only runs if executed directly)
 if __name__ == "__main__":
-    import asyncio
 
     async def test_connection():
-        conn = await get_db_connection()
-        if conn:
-            print("✅ Azure SQL Database Connected Successfully!")
-            await conn.close()  # Ensure connection is closed
-        else:
-            print("❌ Failed to connect.")
+        try:
+            await init_pool()
+            async with connection() as conn:
+                await ping(conn)
+            print(f"✅ Database ({DB_BACKEND}) Connected Successfully!")
+            print(pool_stats())
+        except Exception as e:
+            print(f"❌ Failed to connect: {e}")
+        finally:
+            await close_pool()
 
     asyncio.run(test_connection())
 
@@ -0,0 +1,172 @@
+import csv
+import io
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+import database
+import metrics
+import rows
+
+# Full variant inventory export
+#
+# Streams every variant with its product's attributes as NDJSON or CSV,
+# optionally gzip-compressed, straight from one forward-only cursor: rows are
+# pulled with fetchmany() and encoded a batch at a time, so memory stays flat
+# however large the inventory is. Served on GET /products/export and by
+# `python export.py` (see --help).
+#
+# Incremental pulls: each export reports a watermark; pass it back as
+# updatedSince to get only variants whose row, or whose product's row, has
+# changed since. The watermark is EXPORT_WATERMARK_OVERLAP seconds before the
+# export started, so changes committed by transactions that were still open
+# are not missed; consumers should upsert by variantID.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 2000))  # rows per fetchmany()
+EXPORT_WATERMARK_OVERLAP = float(os.getenv("EXPORT_WATERMARK_OVERLAP", 60))  # seconds
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_QUERY = '''SELECT pv.variantID, pv.barcode, pv.productCode, p.productID, p.productName,
+        p.productDescription, p.category, p.size, p.color, p.unitPrice,
+        CAST(pv.isAvailable AS int) AS isAvailable, CAST(p.isActive AS int) AS isActive,
+        CAST(pv.isDamaged AS int) AS isDamaged, CAST(pv.isWrongItem AS int) AS isWrongItem,
+        CAST(pv.isReturned AS int) AS isReturned,
+        CASE WHEN pv.updatedAt > p.updatedAt THEN pv.updatedAt ELSE p.updatedAt END AS updatedAt
+    FROM ProductVariants AS pv
+    JOIN Products AS p
+    ON p.productID = pv.productID'''
+
+
+def _utc(value):
+    # the database stores naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class Export:
+    """One export run; iterate chunks() for the encoded bytes."""
+
+    def __init__(self, format="ndjson", category=None, available=None, updated_since=None, compress=False,
+                 batch_size=None):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format '{format}'")
+        self.format = format
+        self.category = category
+        self.available = available
+        self.updated_since = _utc(updated_since)
+        self.compress = compress
+        self.batch_size = batch_size or EXPORT_BATCH_SIZE
+        self.watermark = datetime.utcnow() - timedelta(seconds=EXPORT_WATERMARK_OVERLAP)
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def media_type(self):
+        return "application/gzip" if self.compress else FORMATS[self.format]
+
+    @property
+    def filename(self):
+        return f"variants.{self.format}" + (".gz" if self.compress else "")
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def query(self):
+        conditions, params = [], []
+        if self.category is not None:
+            conditions.append("p.category = ?")
+            params.append(self.category)
+        if self.available is not None:
+            conditions.append("pv.isAvailable = ?")
+            params.append(1 if self.available else 0)
+        if self.updated_since is not None:
+            conditions.append("(pv.updatedAt > ? OR p.updatedAt > ?)")
+            params += [self.updated_since, self.updated_since]
+        query = EXPORT_QUERY
+        if conditions:
+            query += "\n    WHERE " + " AND ".join(conditions)
+        return query + "\n    ORDER BY pv.variantID", params
+
+    async def chunks(self):
+        compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if self.compress else None
+        started = time.perf_counter()
+        try:
+            async with database.connection("read") as conn:
+                cursor = await conn.cursor()
+                await cursor.execute(*self.query())
+                if self.format == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer, lineterminator="\n")
+                    writer.writerow([column[0] for column in cursor.description])
+                else:
+                    mapper = rows.mapper_for(cursor.description)
+                while True:
+                    batch = await cursor.fetchmany(self.batch_size)
+                    if self.format == "csv":
+                        writer.writerows(batch)
+                        data = buffer.getvalue().encode("utf-8")
+                        buffer.seek(0)
+                        buffer.truncate()
+                    elif batch:
+                        data = mapper.encode_lines(mapper.from_rows(batch))
+                    else:
+                        data = b""
+                    self.rows += len(batch)
+                    if compressor is not None:
+                        data = compressor.compress(data) + (b"" if batch else compressor.flush())
+                    if data:
+                        self.bytes += len(data)
+                        yield data
+                    if not batch:
+                        break
+        finally:
+            self.seconds = time.perf_counter() - started
+            metrics.EXPORT_ROWS.labels(self.format).inc(self.rows)
+            metrics.EXPORT_DURATION.labels(self.format).observe(self.seconds)
+            logging.info(
+                f"Exported {self.rows} variants as {self.filename} in {self.seconds:.2f}s "
+                f"({self.rows_per_second:.0f} rows/s, {self.bytes} bytes)"
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import sys
+
+    parser = argparse.ArgumentParser(description="Export the variant inventory as NDJSON or CSV.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    parser.add_argument("--category")
+    availability = parser.add_mutually_exclusive_group()
+    availability.add_argument("--available", dest="available", action="store_const", const=True)
+    availability.add_argument("--unavailable", dest="available", action="store_const", const=False)
+    parser.add_argument("--updated-since", type=datetime.fromisoformat, help="ISO timestamp (UTC if no offset)")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    async def main():
+        export = Export(args.format, args.category, args.available, args.updated_since, args.gzip)
+        await database.init_pool()
+        try:
+            with open(args.output, "wb") if args.output else sys.stdout.buffer as out:
+                async for chunk in export.chunks():
+                    out.write(chunk)
+        finally:
+            await database.close_pool()
+        print(
+            f"{export.rows} rows in {export.seconds:.2f}s ({export.rows_per_second:.0f} rows/s), "
+            f"{export.bytes} bytes; next --updated-since {export.watermark.isoformat()}",
+            file=sys.stderr,
+        )
+
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import logging
+import os
+import unicodedata
+import catalog
+import database
+import search
+
+# Product groups
+#
+# The sizes of a product are separate Products rows that share a name and a
+# category (and usually a description and price). Lookups used to match them
+# on those free-text columns plus a float price, none of which is keyed.
+# Each row now carries productGroupID, a ProductGroups row identified by
+# groupKey, a hash of the normalised name and category (case, accents
+# composed, whitespace collapsed), and sizeKey, its normalised size; both are
+# set on write and ix_Products_group_size makes "this product in this size"
+# one index seek. Description, price and color, where a route still checks
+# them, filter the few rows of the group. Prices are compared in whole cents.
+#
+# Rows written before the columns existed (or by tools that do not set them)
+# are backfilled at startup by backfill(), or with `python groups.py`. Until
+# the backfill has finished in this process, group_filter() and size_filter()
+# also match rows whose keys are still NULL on their name, category and size,
+# so lookups are right while it runs (or if it timed out). Set-based writers
+# that join ProductGroups call complete() first instead.
+
+GROUP_BACKFILL_BATCH = int(os.getenv("GROUP_BACKFILL_BATCH", 500))  # (name, category) pairs per backfill round
+
+_KEYS_PER_STATEMENT = 500  # groupKeys per IN list / multi-row INSERT
+
+# WHERE clause fragment: rows of the group with the given groupKey
+IN_GROUP = "productGroupID = (SELECT productGroupID FROM ProductGroups WHERE groupKey = ?)"
+
+_backfilled = False  # every row had its keys when backfill() last finished
+_backfill_lock = asyncio.Lock()
+
+
+def normalize(value):
+    return " ".join(unicodedata.normalize("NFKC", value or "").casefold().split())
+
+
+def group_key(name, category):
+    return hashlib.sha1(f"{normalize(name)}\x1f{normalize(category)}".encode()).hexdigest()
+
+
+def size_key(size):
+    return normalize(size) if size is not None else None
+
+
+def cents(price):
+    return round(float(price) * 100)
+
+
+def group_filter(group_id=None, name=None, category=None, alias=""):
+    """WHERE fragment and its parameters selecting a group by ID, or by name and category.
+
+    `alias` qualifies the Products columns ("p." for `Products AS p`).
+    """
+    a = alias
+    if group_id is not None:
+        if _backfilled:
+            return f"{a}productGroupID = ?", (int(group_id),)
+        return (f"""({a}productGroupID = ? OR ({a}productGroupID IS NULL AND EXISTS (
+                    SELECT 1 FROM ProductGroups AS g WHERE g.productGroupID = ?
+                    AND g.productName = {a}productName AND g.category = {a}category)))""",
+                (int(group_id), int(group_id)))
+    if _backfilled:
+        return a + IN_GROUP, (group_key(name, category),)
+    return (f"({a}{IN_GROUP} OR ({a}productGroupID IS NULL AND {a}productName = ? AND {a}category = ?))",
+            (group_key(name, category), name, category))
+
+
+def size_filter(size, alias=""):
+    """WHERE fragment and its parameters selecting one size of a group."""
+    a = alias
+    if _backfilled:
+        return f"{a}sizeKey = ?", (size_key(size),)
+    return f"({a}sizeKey = ? OR ({a}sizeKey IS NULL AND {a}size = ?))", (size_key(size), size)
+
+
+async def ensure(cursor, name, category):
+    """productGroupID for a name and category, creating the group if needed."""
+    key = group_key(name, category)
+    await cursor.execute("SELECT productGroupID FROM ProductGroups WHERE groupKey = ?", (key,))
+    row = await cursor.fetchone()
+    if row:
+        return row[0]
+    try:
+        await cursor.execute(
+            '''INSERT INTO ProductGroups (groupKey, productName, category)
+               OUTPUT inserted.productGroupID
+               VALUES (?, ?, ?)''',
+            (key, name, category)
+        )
+        return (await cursor.fetchone())[0]
+    except Exception:
+        # created by a concurrent request since the SELECT (unique groupKey)
+        await cursor.execute("SELECT productGroupID FROM ProductGroups WHERE groupKey = ?", (key,))
+        row = await cursor.fetchone()
+        if row is None:
+            raise
+        return row[0]
+
+
+async def ensure_many(cursor, wanted):
+    """ensure() for many groups: `wanted` maps groupKey to (name, category); returns groupKey -> productGroupID."""
+    keys = list(wanted)
+    found = {}
+    for start in range(0, len(keys), _KEYS_PER_STATEMENT):
+        chunk = keys[start:start + _KEYS_PER_STATEMENT]
+        await cursor.execute(
+            f"SELECT groupKey, productGroupID FROM ProductGroups WHERE groupKey IN ({', '.join('?' * len(chunk))})",
+            chunk
+        )
+        found.update((row[0], row[1]) for row in await cursor.fetchall())
+    missing = [key for key in keys if key not in found]
+    for start in range(0, len(missing), _KEYS_PER_STATEMENT):
+        chunk = missing[start:start + _KEYS_PER_STATEMENT]
+        params = [value for key in chunk for value in (key, *wanted[key])]
+        try:
+            await cursor.execute(
+                f'''INSERT INTO ProductGroups (groupKey, productName, category)
+                   OUTPUT inserted.groupKey, inserted.productGroupID
+                   VALUES {", ".join(["(?, ?, ?)"] * len(chunk))}''',
+                params
+            )
+            found.update((row[0], row[1]) for row in await cursor.fetchall())
+        except Exception:
+            # some were created by a concurrent request: one at a time
+            for key in chunk:
+                found[key] = await ensure(cursor, *wanted[key])
+    return found
+
+
+async def backfill(batch_size=None):
+    """Set productGroupID and sizeKey where they are missing; returns the rows updated."""
+    async with _backfill_lock:
+        return await _backfill(batch_size or GROUP_BACKFILL_BATCH)
+
+
+async def complete():
+    """Return once every row has its keys, running backfill() unless it has finished in this process."""
+    if not _backfilled:
+        await backfill()
+
+
+async def _backfill(batch_size):
+    global _backfilled
+    updated = 0
+    async with database.connection("write") as conn:
+        cursor = await conn.cursor()
+        while True:
+            await cursor.execute(
+                '''SELECT DISTINCT TOP (?) productName, category
+                   FROM Products
+                   WHERE productGroupID IS NULL''',
+                (batch_size,)
+            )
+            pairs = await cursor.fetchall()
+            if not pairs:
+                break
+            for name, category in pairs:
+                group_id = await ensure(cursor, name, category)
+                await cursor.execute(
+                    '''UPDATE Products SET productGroupID = ?, updatedAt = SYSUTCDATETIME()
+                       WHERE productGroupID IS NULL AND productName = ?
+                       AND (category = ? OR (category IS NULL AND ? IS NULL))''',
+                    (group_id, name, category, category)
+                )
+                updated += cursor.rowcount
+            await conn.commit()
+
+        await cursor.execute("SELECT DISTINCT size FROM Products WHERE sizeKey IS NULL AND size IS NOT NULL")
+        for (size,) in await cursor.fetchall():
+            await cursor.execute(
+                "UPDATE Products SET sizeKey = ?, updatedAt = SYSUTCDATETIME() WHERE sizeKey IS NULL AND size = ?",
+                (size_key(size), size))
+        await conn.commit()
+    _backfilled = True
+    if updated:
+        # updatedAt moved, so the search sync picks the keys up like any product write
+        catalog.invalidate()
+        search.changed()
+        logging.info(f"Backfilled product groups for {updated} products")
+    return updated
+
+
+if __name__ == "__main__":
+    async def main():
+        await database.init_pool()
+        try:
+            print(f"Backfilled product groups for {await backfill()} products")
+        finally:
+            await database.close_pool()
+
+    asyncio.run(main())
@@ -0,0 +1,387 @@
+import asyncio
+import base64
+import binascii
+import collections
+import functools
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from starlette.responses import FileResponse
+import metrics
+import workers
+
+# Product image storage
+#
+# Uploads are streamed to a temporary file while their SHA-256 is computed,
+# then decoded, validated and resized with Pillow in the worker pool
+# (workers.py), never on the event loop. Images are stored under their
+# content hash, IMAGE_DIR/<2 hex>/<hash>.<ext>, so uploading the same bytes
+# twice stores them once. Next to the original each image gets a thumbnail
+# and a medium rendition (JPEG, or PNG when the image has transparency) and a
+# full-size WebP copy. Renditions are written before the original is moved
+# into place, so an existing original means its renditions exist too.
+#
+# Stored images are served from IMAGE_URL_PREFIX/<hash>.<ext>. The URL
+# changes whenever the content does, so responses are cacheable forever
+# (Cache-Control: immutable) and the hash is a strong ETag. ?w= serves the
+# image scaled to the next of IMAGE_WIDTHS; scaled copies are made in the
+# worker pool from the medium rendition where it is big enough, and kept in
+# IMAGE_CACHE_DIR, which is trimmed least-recently-used first to
+# IMAGE_CACHE_MAX_BYTES. Listings return the URL path without a leading
+# slash ("images/<hash>.<ext>"), as they always returned image paths, since
+# clients join it to "<host>/". Images uploaded before content hashing keep
+# their old images_upload/ paths.
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "images_upload")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 20 * 1024 * 1024))  # upload size limit
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 40_000_000))  # decompression bomb guard
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))  # JPEG/WebP quality of renditions
+
+# rendition name -> maximum width in pixels (never upscaled)
+RENDITIONS = {
+    "thumb": int(os.getenv("IMAGE_THUMB_WIDTH", 320)),
+    "medium": int(os.getenv("IMAGE_MEDIUM_WIDTH", 1024)),
+}
+# accepted upload formats (as detected by Pillow, not as named) -> extension
+FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+IMAGE_URL_PREFIX = "/images"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")  # scaled copies served for ?w=
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))  # per worker process
+# ?w= is rounded up to one of these, so a grid asking for odd sizes does not fill the cache
+IMAGE_WIDTHS = tuple(int(width) for width in os.getenv("IMAGE_WIDTHS", "160,320,480,640,960,1280,1920").split(","))
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_CHUNK_SIZE = 1024 * 1024
+_INCOMING = os.path.join(IMAGE_DIR, ".incoming")
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+_STORED = re.compile(r"([0-9a-f]{64})\.(jpg|png|webp|gif)$")
+
+# ?w= scales these; GIFs are always served as uploaded, which keeps animations
+SCALABLE = frozenset({"jpg", "png", "webp"})
+
+# scaled copies on disk, least recently used first: path -> [size, last handed out (monotonic)]
+_cache = collections.OrderedDict()
+_cache_bytes = 0
+_cache_loaded = False
+# a copy handed out this recently may still be sent (FileResponse and pathsend
+# open the path after image_file() returns), so it is not evicted yet
+_EVICT_GRACE = 60  # seconds
+# (hash, ext, width) of images already no wider than the width asked for
+_unscaled = set()
+_inflight = {}
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+def _url_path(path):
+    # stored and returned with forward slashes, whatever the platform
+    return path.replace(os.sep, "/")
+
+
+def stored_file(digest, ext):
+    return os.path.join(IMAGE_DIR, digest[:2], f"{digest}.{ext}")
+
+
+def image_url(path):
+    """Public URL of a stored image_path (listing transform)."""
+    if not path:
+        return "placeholder.png"
+    path = path.replace("\\", "/")
+    match = _STORED.search(path)
+    # relative like the legacy paths: clients prepend their "<host>/"
+    return f"{IMAGE_URL_PREFIX.lstrip('/')}/{match[1]}.{match[2]}" if match else path
+
+
+def stored_path(value):
+    """image_path of an already stored image, given its image_path or URL; None if it is not stored."""
+    match = _STORED.search((value or "").replace("\\", "/"))
+    if match is None or not os.path.exists(stored_file(match[1], match[2])):
+        return None
+    return _url_path(stored_file(match[1], match[2]))
+
+
+def is_digest(value):
+    return _DIGEST.match(value) is not None
+
+
+# listing transform for rows.fetch_records: image_path as its public URL
+TRANSFORMS = {"image_path": image_url}
+
+
+def etag(digest, ext, width=None):
+    return f'"{digest}-{width}.{ext}"' if width else f'"{digest}.{ext}"'
+
+
+def snap_width(width):
+    return next((step for step in IMAGE_WIDTHS if step >= width), IMAGE_WIDTHS[-1])
+
+
+def _describe(digest, ext, rendition_ext, width, height, duplicate):
+    base = os.path.join(IMAGE_DIR, digest[:2], digest)
+    return {
+        "hash": digest,
+        "image_path": _url_path(f"{base}.{ext}"),
+        "width": width,
+        "height": height,
+        "renditions": dict(
+            {name: _url_path(f"{base}-{name}.{rendition_ext}") for name in RENDITIONS},
+            webp=_url_path(f"{base}.webp" if ext != "webp" else f"{base}.{ext}"),
+        ),
+        "duplicate": duplicate,
+    }
+
+
+# Worker-side functions (run in the process pool)
+
+def _upright_size(image):
+    # size once exif_transpose() has applied the orientation, without decoding the pixels
+    width, height = image.size
+    # orientations 5-8 rotate by a quarter turn
+    return (height, width) if image.getexif().get(0x0112) in (5, 6, 7, 8) else (width, height)
+
+
+def _save(image, path, fmt):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if fmt == "JPEG":
+        image.convert("RGB").save(tmp, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        image.save(tmp, "WEBP", quality=IMAGE_QUALITY, method=4)
+    else:
+        image.save(tmp, "PNG", optimize=True)
+    os.replace(tmp, path)
+
+
+def store(tmp_path, digest):
+    """Validate the uploaded file and store it with its renditions under its hash."""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    try:
+        with Image.open(tmp_path) as image:
+            image.verify()
+        with Image.open(tmp_path) as image:
+            ext = FORMATS.get(image.format)
+            if ext is None:
+                raise InvalidImageError(f"Unsupported image format {image.format}; use JPEG, PNG, WebP or GIF")
+            transparent = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            rendition_format = "PNG" if transparent or ext in ("png", "gif") else "JPEG"
+            rendition_ext = "png" if rendition_format == "PNG" else "jpg"
+            base = os.path.join(IMAGE_DIR, digest[:2], digest)
+            if os.path.exists(f"{base}.{ext}"):
+                return _describe(digest, ext, rendition_ext, *_upright_size(image), duplicate=True)
+
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            # camera images are often stored sideways with an EXIF orientation
+            upright = ImageOps.exif_transpose(image)
+            width, height = upright.size
+            if upright.mode not in ("RGB", "RGBA", "L", "LA"):
+                upright = upright.convert("RGBA" if transparent else "RGB")
+            for name, max_width in RENDITIONS.items():
+                rendition = upright.copy()
+                rendition.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+                _save(rendition, f"{base}-{name}.{rendition_ext}", rendition_format)
+            if ext != "webp":
+                _save(upright, f"{base}.webp", "WEBP")
+    except Image.DecompressionBombError as e:
+        raise InvalidImageError(f"Image is too large: {e}")
+    except Image.UnidentifiedImageError:
+        raise InvalidImageError("Not a JPEG, PNG, WebP or GIF image")
+    except (OSError, SyntaxError, ValueError) as e:
+        raise InvalidImageError(f"Invalid image: {e}")
+    # the original last: its presence marks a complete set
+    os.replace(tmp_path, f"{base}.{ext}")
+    return _describe(digest, ext, rendition_ext, width, height, duplicate=False)
+
+
+def scale(source, path, width, ext):
+    """Write `source` scaled to `width` as `path`; False if it is not wider than that."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        if _upright_size(image)[0] <= width:
+            return False
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _save(image, path, {"jpg": "JPEG", "webp": "WEBP"}.get(ext, "PNG"))
+    return True
+
+
+# Event-loop side
+
+async def _ingest(chunks):
+    os.makedirs(_INCOMING, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=_INCOMING, suffix=".upload")
+    started = time.perf_counter()
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as file:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise ImageTooLargeError(f"Images are limited to {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+                digest.update(chunk)
+                await asyncio.to_thread(file.write, chunk)
+        if size == 0:
+            raise InvalidImageError("Empty image")
+        result = await workers.run(store, tmp_path, digest.hexdigest())
+    except (InvalidImageError, ImageTooLargeError):
+        metrics.IMAGE_UPLOADS.labels("rejected").inc()
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    metrics.IMAGE_UPLOADS.labels("duplicate" if result["duplicate"] else "stored").inc()
+    metrics.IMAGE_PROCESS_SECONDS.observe(time.perf_counter() - started)
+    logging.info(f"Image {result['hash'][:12]} {'deduplicated' if result['duplicate'] else 'stored'} "
+                 f"({size} bytes, {result['width']}x{result['height']})")
+    return result
+
+
+async def ingest_upload(upload):
+    """Store a multipart UploadFile; returns the stored image description."""
+    async def chunks():
+        while chunk := await upload.read(_CHUNK_SIZE):
+            yield chunk
+    return await _ingest(chunks())
+
+
+async def ingest_base64(data):
+    """Store a base64 (optionally data URI) image from a JSON body."""
+    # ignore the data URI prefix if present, and fix missing padding
+    if "," in data:
+        data = data.split(",", 1)[1]
+    data += "=" * (-len(data) % 4)
+    try:
+        decoded = base64.b64decode(data)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidImageError(f"Invalid Base64 image: {e}")
+
+    async def chunks():
+        for start in range(0, len(decoded), _CHUNK_SIZE):
+            yield decoded[start:start + _CHUNK_SIZE]
+    return await _ingest(chunks())
+
+
+def _load_cache():
+    # pick up the copies left by earlier runs, oldest access first
+    global _cache_bytes, _cache_loaded
+    _cache_loaded = True
+    entries = []
+    for root, _, files in os.walk(IMAGE_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, path, stat.st_size))
+    for _, path, size in sorted(entries):
+        _cache[path] = [size, 0.0]
+        _cache_bytes += size
+    _trim()
+
+
+def _trim():
+    global _cache_bytes
+    recent = time.monotonic() - _EVICT_GRACE
+    while _cache_bytes > IMAGE_CACHE_MAX_BYTES and len(_cache) > 1:
+        path, (size, used_at) = next(iter(_cache.items()))
+        if used_at > recent:
+            # least recently used first: the rest are recent too; over the limit until they age
+            break
+        del _cache[path]
+        _cache_bytes -= size
+        metrics.IMAGE_CACHE_EVICTIONS.inc()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _remember(path):
+    global _cache_bytes
+    size = os.path.getsize(path)
+    _cache[path] = [size, time.monotonic()]
+    _cache_bytes += size
+    _trim()
+
+
+async def _scaled(digest, ext, width):
+    path = os.path.join(IMAGE_CACHE_DIR, digest[:2], f"{digest}-{width}.{ext}")
+    if path in _cache:
+        _cache.move_to_end(path)
+        _cache[path][1] = time.monotonic()
+        metrics.IMAGE_CACHE.labels("hit").inc()
+        return path
+    metrics.IMAGE_CACHE.labels("miss").inc()
+
+    # the medium rendition is much cheaper to decode than a camera original
+    source = stored_file(digest, ext)
+    if width <= RENDITIONS["medium"]:
+        for rendition_ext in ("jpg", "png"):
+            medium = os.path.join(IMAGE_DIR, digest[:2], f"{digest}-medium.{rendition_ext}")
+            if os.path.exists(medium):
+                source = medium
+                break
+
+    future = _inflight.get(path)
+    if future is None:
+        if os.path.exists(path):
+            # scaled by another worker process
+            _remember(path)
+            return path
+        future = _inflight[path] = asyncio.ensure_future(workers.run(scale, source, path, width, ext))
+        future.add_done_callback(functools.partial(_scaled_done, path))
+    return path if await asyncio.shield(future) else None
+
+
+def _scaled_done(path, future):
+    _inflight.pop(path, None)
+    if not future.cancelled() and future.exception() is None and future.result():
+        _remember(path)
+
+
+async def image_file(digest, ext, width=None):
+    """Path of a stored image, scaled to `width` (already snapped) if given and smaller."""
+    source = stored_file(digest, ext)
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if width is None or ext not in SCALABLE or (digest, ext, width) in _unscaled:
+        return source
+    if not _cache_loaded:
+        await asyncio.to_thread(_load_cache)
+    path = await _scaled(digest, ext, width)
+    if path is None:
+        if len(_unscaled) > 100000:
+            _unscaled.clear()
+        _unscaled.add((digest, ext, width))
+        return source
+    return path
+
+
+class ImageResponse(FileResponse):
+    """FileResponse that hands the file to the server (ASGI pathsend) when it can.
+
+    Servers with the http.response.pathsend extension send the file with
+    sendfile(); others get Starlette's chunked reads.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if ("http.response.pathsend" not in scope.get("extensions", {}) or self.stat_result is None
+                or scope["method"] == "HEAD" or any(name == b"range" for name, _ in scope["headers"])):
+            return await super().__call__(scope, receive, send)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
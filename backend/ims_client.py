@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import metrics
+
+# Shared client for the IMS backend
+#
+# One long-lived httpx.AsyncClient (keep-alive, HTTP/2 when the h2 package is
+# installed) serves every IMS call. Each call has an overall deadline; failed
+# attempts (network errors, timeouts, 5xx, 408/429) are retried with
+# exponential backoff and full jitter while the deadline allows. A circuit
+# breaker opens after IMS_BREAKER_FAILURES consecutive failed attempts and
+# fails calls immediately until IMS_BREAKER_RESET seconds have passed, when a
+# single trial call is let through.
+
+IMS_BASE_URL = os.getenv("IMS_BASE_URL", "https://ims-wc58.onrender.com")
+IMS_HTTP2 = os.getenv("IMS_HTTP2", "true").lower() == "true"
+IMS_DEADLINE = float(os.getenv("IMS_DEADLINE", 10))  # seconds for a whole call, retries included
+IMS_CONNECT_TIMEOUT = float(os.getenv("IMS_CONNECT_TIMEOUT", 3))
+IMS_ATTEMPT_TIMEOUT = float(os.getenv("IMS_ATTEMPT_TIMEOUT", 5))  # seconds for one attempt
+IMS_ATTEMPTS = int(os.getenv("IMS_ATTEMPTS", 3))
+IMS_BACKOFF_BASE = float(os.getenv("IMS_BACKOFF_BASE", 0.25))  # seconds; doubles per attempt
+IMS_BACKOFF_MAX = float(os.getenv("IMS_BACKOFF_MAX", 4))
+IMS_MAX_CONNECTIONS = int(os.getenv("IMS_MAX_CONNECTIONS", 20))
+IMS_KEEPALIVE_EXPIRY = float(os.getenv("IMS_KEEPALIVE_EXPIRY", 60))
+IMS_BREAKER_FAILURES = int(os.getenv("IMS_BREAKER_FAILURES", 5))  # consecutive failed attempts that open the breaker
+IMS_BREAKER_RESET = float(os.getenv("IMS_BREAKER_RESET", 30))  # seconds before a trial call is allowed
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class IMSError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IMSUnavailableError(IMSError):
+    """Raised without calling IMS while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=IMS_BREAKER_FAILURES, reset_after=IMS_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_started_at = None
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+            self._set_state("half_open")
+        if self.state == "half_open":
+            # one trial call at a time; a trial that never reported back (e.g. cancelled) expires
+            now = time.monotonic()
+            if self._trial_started_at is None or now - self._trial_started_at >= self.reset_after:
+                self._trial_started_at = now
+                return True
+        return False
+
+    def retry_in(self):
+        return max(0.0, self.reset_after - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_started_at = None
+        if self.state != "closed":
+            logging.info("IMS circuit breaker closed")
+            self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_started_at = None
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logging.warning(f"IMS circuit breaker opened after {self.failures} failed attempts")
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.IMS_BREAKER_STATE.set({"closed": 0, "half_open": 1, "open": 2}[state])
+
+
+breaker = CircuitBreaker()
+_client = None
+
+
+def _http2_available():
+    if not IMS_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("IMS_HTTP2 is on but the h2 package is not installed; using HTTP/1.1")
+        return False
+
+
+def client():
+    """The shared httpx client, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx  # imported on first use to keep cold starts short
+
+        _client = httpx.AsyncClient(
+            base_url=IMS_BASE_URL,
+            http2=_http2_available(),
+            timeout=httpx.Timeout(IMS_ATTEMPT_TIMEOUT, connect=IMS_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=IMS_MAX_CONNECTIONS,
+                max_keepalive_connections=IMS_MAX_CONNECTIONS,
+                keepalive_expiry=IMS_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _backoff(attempt):
+    # full jitter: uniform over [0, base * 2^attempt], capped
+    return random.uniform(0, min(IMS_BACKOFF_MAX, IMS_BACKOFF_BASE * 2 ** attempt))
+
+
+async def post(path, payload, deadline=None, attempts=None, **kwargs):
+    """POST to IMS and return the decoded JSON response.
+
+    Raises IMSUnavailableError when the breaker is open and IMSError when
+    IMS answers with an error or every attempt within the deadline failed.
+    Extra keyword arguments go to httpx (e.g. content= and headers=).
+    """
+    import httpx
+
+    if not breaker.allow():
+        raise IMSUnavailableError(f"IMS is unavailable (circuit open, retrying in {breaker.retry_in():.0f}s)")
+
+    request = {"json": payload} if payload is not None else {}
+    request.update(kwargs)
+    attempts = attempts or IMS_ATTEMPTS
+    give_up_at = time.monotonic() + (deadline or IMS_DEADLINE)
+    error = None
+    for attempt in range(attempts):
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            with metrics.ims_call(path) as call:
+                timeout = httpx.Timeout(min(remaining, IMS_ATTEMPT_TIMEOUT), connect=min(remaining, IMS_CONNECT_TIMEOUT))
+                response = await client().post(path, timeout=timeout, **request)
+                call.status = response.status_code
+        except httpx.TransportError as e:
+            error = IMSError(f"{type(e).__name__} calling IMS {path}: {e}")
+        else:
+            if response.status_code < 400:
+                breaker.record_success()
+                try:
+                    return response.json()
+                except ValueError:
+                    raise IMSError(f"IMS returned a non-JSON response from {path}", response.status_code)
+            error = IMSError(f"IMS returned {response.status_code} from {path}: {response.text[:500]}", response.status_code)
+            if response.status_code not in RETRY_STATUSES:
+                # IMS is up and rejected the request; retrying will not help
+                breaker.record_success()
+                raise error
+
+        logging.warning(f"IMS attempt {attempt + 1}/{attempts} failed: {error}")
+        breaker.record_failure()
+        if attempt + 1 == attempts or breaker.state == "open":
+            break
+        delay = _backoff(attempt)
+        if time.monotonic() + delay >= give_up_at:
+            break
+        await asyncio.sleep(delay)
+    raise error or IMSError(f"IMS call to {path} exceeded its {deadline or IMS_DEADLINE}s deadline")
+
+
+def stats():
+    return {
+        "base_url": IMS_BASE_URL,
+        "breaker": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "retry_in_seconds": round(breaker.retry_in(), 1) if breaker.state == "open" else None,
+    }
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import catalog
+import database
+import metrics
+
+# Maintained per-product availability
+#
+# Products.availableQuantity holds the number of the product's variants with
+# isAvailable = 1, so catalog reads do not count ProductVariants. Every write
+# that inserts variants or changes their availability adjusts it in the same
+# transaction with a single relative UPDATE (adjust_available), never by
+# reading the value and writing it back. The drift check compares it with
+# the real count; it runs every INVENTORY_DRIFT_CHECK_INTERVAL seconds and on
+# demand from /admin/inventory, and reconcile() recounts drifted products.
+
+INVENTORY_DRIFT_CHECK_INTERVAL = float(os.getenv("INVENTORY_DRIFT_CHECK_INTERVAL", 3600))  # seconds; 0 disables the periodic check
+INVENTORY_DRIFT_AUTOFIX = os.getenv("INVENTORY_DRIFT_AUTOFIX", "false").lower() == "true"  # reconcile when the periodic check finds drift
+
+DRIFT_QUERY = '''SELECT TOP (?) p.productID, p.category, p.availableQuantity, COUNT(pv.variantID) AS actualQuantity
+    FROM Products AS p
+    LEFT JOIN ProductVariants AS pv
+    ON pv.productID = p.productID AND pv.isAvailable = 1
+    GROUP BY p.productID, p.category, p.availableQuantity
+    HAVING p.availableQuantity <> COUNT(pv.variantID)
+    ORDER BY p.productID'''
+
+# products of each order that have fewer available variants than the orders
+# need in total (several lines, or several orders, may want the same product);
+# one row per order and product, as order lines have no key of their own
+SHORTAGE_QUERY = '''SELECT d.orderID, d.productID, p.productName, p.size, p.category,
+        SUM(d.orderQuantity) AS ordered, t.required, COALESCE(p.availableQuantity, 0) AS available
+    FROM purchaseOrderDetails AS d
+    JOIN (SELECT productID, SUM(orderQuantity) AS required
+          FROM purchaseOrderDetails
+          WHERE orderID IN ({orders})
+          GROUP BY productID) AS t
+    ON t.productID = d.productID
+    LEFT JOIN Products AS p
+    ON p.productID = d.productID
+    WHERE d.orderID IN ({orders}) AND COALESCE(p.availableQuantity, 0) < t.required
+    GROUP BY d.orderID, d.productID, p.productName, p.size, p.category, t.required, p.availableQuantity
+    ORDER BY d.orderID, d.productID'''
+SHORTAGE_MAX_ORDERS = 1000  # orders per shortages() call; the IDs are bound twice
+
+_ADJUST_BATCH = 400  # products per adjust_available_many() UPDATE; up to 5 parameters each
+
+_task = None
+
+
+async def adjust_available(cursor, product_id, delta, stock_delta=0):
+    """Add `delta` to a product's availableQuantity (and `stock_delta` to currentStock)."""
+    await cursor.execute(
+        '''UPDATE Products
+           SET availableQuantity = availableQuantity + ?, currentStock = currentStock + ?,
+               updatedAt = SYSUTCDATETIME()
+           WHERE productID = ?''',
+        (delta, stock_delta, product_id)
+    )
+
+
+async def adjust_available_many(cursor, deltas, add_stock=False):
+    """adjust_available() for many products: `deltas` maps productID to delta.
+
+    One UPDATE per _ADJUST_BATCH products, with the deltas in a CASE expression;
+    with add_stock currentStock is raised by the same amounts.
+    """
+    items = list(deltas.items())
+    for start in range(0, len(items), _ADJUST_BATCH):
+        chunk = items[start:start + _ADJUST_BATCH]
+        case = "CASE productID " + "WHEN ? THEN ? " * len(chunk) + "END"
+        case_params = [value for item in chunk for value in item]
+        await cursor.execute(
+            f'''UPDATE Products
+               SET availableQuantity = availableQuantity + {case},
+                   currentStock = currentStock + {case if add_stock else "0"},
+                   updatedAt = SYSUTCDATETIME()
+               WHERE productID IN ({", ".join("?" * len(chunk))})''',
+            case_params + (case_params if add_stock else []) + [product_id for product_id, _ in chunk]
+        )
+
+
+async def shortages(cursor, order_ids):
+    """Products of the orders that cannot be filled from the available variants; empty when all can.
+
+    One aggregate query against the maintained availableQuantity, returning
+    only the short products of each order, instead of fetching variants line
+    by line.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return []
+    if len(order_ids) > SHORTAGE_MAX_ORDERS:
+        raise ValueError(f"At most {SHORTAGE_MAX_ORDERS} orders can be checked at once")
+    marks = ", ".join("?" * len(order_ids))
+    await cursor.execute(SHORTAGE_QUERY.format(orders=marks), (*order_ids, *order_ids))
+    return [
+        {
+            "orderID": row[0],
+            "productID": row[1],
+            "productName": row[2],
+            "size": row[3],
+            "category": row[4],
+            "ordered": row[5],  # by the order's lines of the product
+            "required": row[6],  # by all checked orders
+            "available": row[7],
+            "short": row[6] - row[7],
+        }
+        for row in await cursor.fetchall()
+    ]
+
+
+async def drift(limit=1000):
+    """Products whose availableQuantity differs from their count of available variants."""
+    async with database.connection("read") as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(DRIFT_QUERY, (limit,))
+        found = await cursor.fetchall()
+    metrics.INVENTORY_DRIFT_PRODUCTS.set(len(found))
+    return [
+        {"productID": row[0], "category": row[1], "availableQuantity": row[2], "actualQuantity": row[3]}
+        for row in found
+    ]
+
+
+async def reconcile(limit=1000):
+    """Recount drifted products; returns the products that were corrected."""
+    drifted = await drift(limit)
+    if not drifted:
+        return []
+    async with database.connection("write") as conn:
+        cursor = await conn.cursor()
+        product_ids = [product["productID"] for product in drifted]
+        placeholders = ", ".join("?" for _ in product_ids)
+        # the count is taken inside the UPDATE, so changes made since the check are included
+        await cursor.execute(
+            f'''UPDATE Products
+                SET availableQuantity = (SELECT COUNT(*) FROM ProductVariants AS pv
+                                         WHERE pv.productID = Products.productID AND pv.isAvailable = 1),
+                    updatedAt = SYSUTCDATETIME()
+                WHERE productID IN ({placeholders})''',
+            product_ids
+        )
+        await conn.commit()
+    catalog.invalidate(*{product["category"] for product in drifted})
+    metrics.INVENTORY_DRIFT_PRODUCTS.set(0)
+    logging.warning(f"Reconciled availableQuantity of {len(drifted)} products")
+    return drifted
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(INVENTORY_DRIFT_CHECK_INTERVAL)
+        try:
+            drifted = await drift()
+            if drifted:
+                logging.warning(
+                    f"availableQuantity has drifted for {len(drifted)} products, e.g. {drifted[0]}"
+                )
+                if INVENTORY_DRIFT_AUTOFIX:
+                    await reconcile()
+        except Exception as e:
+            logging.error(f"Inventory drift check failed: {e}")
+
+
+def start():
+    global _task
+    if INVENTORY_DRIFT_CHECK_INTERVAL > 0 and _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+if __name__ == "__main__":
+    import sys
+
+    async def main():
+        await database.init_pool()
+        try:
+            if "--fix" in sys.argv:
+                fixed = await reconcile()
+                print(f"Reconciled {len(fixed)} products")
+            else:
+                drifted = await drift()
+                for product in drifted:
+                    print(product)
+                print(f"{len(drifted)} products with drift")
+                return 1 if drifted else 0
+        finally:
+            await database.close_pool()
+
+    sys.exit(asyncio.run(main()) or 0)
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+import metrics
+import workers
+from codes import is_valid_ean13
+
+# Barcode labels
+#
+# Labels are rendered with python-barcode in the worker pool (workers.py) and
+# cached on disk under LABEL_CACHE_DIR, keyed by the barcode: a label is a
+# pure function of its barcode and the render options, and the options are
+# hashed into the cache directory name, so changing them starts a fresh
+# cache. Sheets (every label of a product or order, laid out on A4 pages as
+# PDF or one PNG page) are cached under a hash of their barcodes. EAN-13
+# barcodes are drawn as EAN-13, anything else (older random codes) as Code 128.
+
+LABEL_CACHE_DIR = os.getenv("LABEL_CACHE_DIR", "label_cache")
+LABEL_SHEET_MAX = int(os.getenv("LABEL_SHEET_MAX", 5000))  # labels per sheet request
+LABEL_RENDER_CHUNK = int(os.getenv("LABEL_RENDER_CHUNK", 50))  # labels per worker task when filling a sheet
+LABEL_PDF_BATCH = int(os.getenv("LABEL_PDF_BATCH", 20))  # PDF pages held in memory while a sheet is written
+
+LABEL_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+SHEET_FORMATS = {"pdf": "application/pdf", "png": "image/png"}
+
+LABEL_OPTIONS = {"module_height": 15.0, "font_size": 10, "text_distance": 5.0, "quiet_zone": 6.5}
+PNG_DPI = 300
+
+# A4 at 300 dpi, 3 x 8 labels
+SHEET_SIZE = (2480, 3508)
+SHEET_MARGIN = 120
+SHEET_COLUMNS = 3
+SHEET_ROWS = 8
+SHEET_PADDING = 24
+
+_STYLE = hashlib.sha1(json.dumps([LABEL_OPTIONS, PNG_DPI, SHEET_SIZE, SHEET_COLUMNS, SHEET_ROWS]).encode()).hexdigest()[:10]
+_CODE = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+_inflight = {}
+
+
+def valid_code(code):
+    """Barcodes that are safe to use as a cache file name."""
+    return bool(_CODE.match(code))
+
+
+def label_file(code, fmt):
+    return os.path.join(LABEL_CACHE_DIR, _STYLE, fmt, code[-2:], f"{code}.{fmt}")
+
+
+def pages_for(count):
+    return max(1, -(-count // (SHEET_COLUMNS * SHEET_ROWS)))
+
+
+# Worker-side functions (run in the process pool)
+
+def _temp(path):
+    # unique even between threads (WORKER_PROCESSES=0 runs every render in one process)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    return tmp
+
+
+def _write(path, data):
+    tmp = _temp(path)
+    try:
+        with open(tmp, "wb") as file:
+            file.write(data)
+        # atomic: readers never see a partial file
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _render(code, fmt):
+    import barcode
+    from barcode.writer import ImageWriter, SVGWriter
+
+    symbology = "ean13" if is_valid_ean13(code) else "code128"
+    if fmt == "png":
+        writer, options = ImageWriter(), dict(LABEL_OPTIONS, dpi=PNG_DPI)
+    else:
+        writer, options = SVGWriter(), LABEL_OPTIONS
+    buffer = io.BytesIO()
+    barcode.get(symbology, code, writer=writer).write(buffer, options=options)
+    return buffer.getvalue()
+
+
+def render_labels(codes, fmt):
+    """Render and cache every label in `codes` that is not cached yet."""
+    rendered = 0
+    for code in codes:
+        path = label_file(code, fmt)
+        if not os.path.exists(path):
+            _write(path, _render(code, fmt))
+            rendered += 1
+    return rendered
+
+
+def compose_sheet(codes, fmt, path, page=None):
+    """Lay cached PNG labels out on A4 pages; all pages for PDF, one page for PNG."""
+    from PIL import Image
+
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    cell_width = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_height = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS
+    page_numbers = [page] if page is not None else range(1, pages_for(len(codes)) + 1)
+
+    def page_image(number):
+        sheet = Image.new("L", SHEET_SIZE, 255)
+        for index, code in enumerate(codes[(number - 1) * per_page:number * per_page]):
+            with Image.open(label_file(code, "png")) as image:
+                image = image.convert("L")
+                image.thumbnail((cell_width - 2 * SHEET_PADDING, cell_height - 2 * SHEET_PADDING))
+                row, column = divmod(index, SHEET_COLUMNS)
+                x = SHEET_MARGIN + column * cell_width + (cell_width - image.width) // 2
+                y = SHEET_MARGIN + row * cell_height + (cell_height - image.height) // 2
+                sheet.paste(image, (x, y))
+        # 1-bit pages: barcodes are black and white anyway, and bilevel PDF
+        # pages are CCITT G4 compressed (a few KB instead of ~500 KB)
+        return sheet.point(lambda value: 255 if value >= 128 else 0, "1")
+
+    tmp = _temp(path)
+    try:
+        if fmt == "pdf":
+            # LABEL_PDF_BATCH pages at a time, each batch appended to the file
+            # written so far: a 5000-label sheet is ~200 pages of ~1 MB each
+            for start in range(0, len(page_numbers), LABEL_PDF_BATCH):
+                sheets = [page_image(number) for number in page_numbers[start:start + LABEL_PDF_BATCH]]
+                sheets[0].save(tmp, "PDF", resolution=PNG_DPI, save_all=True, append_images=sheets[1:],
+                               append=start > 0)
+        else:
+            page_image(page_numbers[0]).save(tmp, "PNG", dpi=(PNG_DPI, PNG_DPI), optimize=False)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+# Event-loop side
+
+async def _once(path, fn, *args):
+    # concurrent requests for the same file share one render
+    future = _inflight.get(path)
+    if future is None:
+        future = _inflight[path] = asyncio.ensure_future(workers.run(fn, *args))
+        future.add_done_callback(lambda _: _inflight.pop(path, None))
+    await asyncio.shield(future)
+
+
+async def label(code, fmt):
+    """Path of the cached label for a barcode, rendering it if needed."""
+    path = label_file(code, fmt)
+    if os.path.exists(path):
+        metrics.LABEL_CACHE.labels("label", "hit").inc()
+        return path
+    metrics.LABEL_CACHE.labels("label", "miss").inc()
+    await _once(path, render_labels, [code], fmt)
+    return path
+
+
+async def sheet(codes, fmt, page=None):
+    """Path of the cached label sheet for `codes`; PNG sheets are one page at a time."""
+    if fmt == "png" and page is None:
+        page = 1
+    key = hashlib.sha256("\n".join([fmt, str(page)] + list(codes)).encode()).hexdigest()
+    path = os.path.join(LABEL_CACHE_DIR, _STYLE, "sheets", f"{key}.{fmt}")
+    if os.path.exists(path):
+        metrics.LABEL_CACHE.labels("sheet", "hit").inc()
+        return path
+    metrics.LABEL_CACHE.labels("sheet", "miss").inc()
+
+    if page is not None:
+        per_page = SHEET_COLUMNS * SHEET_ROWS
+        codes = codes[(page - 1) * per_page:page * per_page]
+        page = 1
+    missing = [code for code in codes if not os.path.exists(label_file(code, "png"))]
+    chunks = [missing[i:i + LABEL_RENDER_CHUNK] for i in range(0, len(missing), LABEL_RENDER_CHUNK)]
+    await asyncio.gather(*(workers.run(render_labels, chunk, "png") for chunk in chunks))
+    await _once(path, compose_sheet, list(codes), fmt, path, page)
+    return path
+
+
+async def sheet_response(codes, fmt, page, name):
+    """FileResponse for a label sheet of `codes`, with the page count in X-Sheet-Pages."""
+    if not codes:
+        raise HTTPException(status_code=404, detail="No available variants to label")
+    if len(codes) > LABEL_SHEET_MAX:
+        raise HTTPException(status_code=413, detail=f"Sheets are limited to {LABEL_SHEET_MAX} labels")
+    pages = pages_for(len(codes))
+    if page is not None and page > pages:
+        raise HTTPException(status_code=400, detail=f"Sheet has {pages} pages")
+    try:
+        path = await sheet(codes, fmt, page)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    filename = f"{name}.{fmt}" if fmt == "pdf" else f"{name}-{page or 1}.{fmt}"
+    return FileResponse(path, media_type=SHEET_FORMATS[fmt], filename=filename,
+                        headers={"X-Sheet-Pages": str(pages), "X-Sheet-Labels": str(len(codes))})
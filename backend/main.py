@@ -1,17 +1,30 @@
-from fastapi import FastAPI, BackgroundTasks
+import startup  # first, so the cold-start clock includes every other import
+from fastapi import FastAPI, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers.auth import router as auth_router
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from routers.auth import router as auth_router, create_default_user
 from routers.vendor import router as vendor_router
 from routers.products import router as products_router
 from routers.orderdetails import router as orderdetails_router
 from routers.orders import router as orders_router
+from routers.outbox import router as outbox_router
+from routers.inventory import router as inventory_router
+from routers.images import router as images_router
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
+import catalog
+import codes
+import database
+import groups
+import images
+import ims_client
+import inventory
+import metrics
+import outbox
 import os
-import uvicorn
-import requests
-import httpx
-import asyncio
+import search
+import workers
 
 
 # Load environment variables
@@ -21,11 +34,47 @@ load_dotenv()
 HOST = os.getenv("HOST", "127.0.0.1")
 PORT = int(os.getenv("PORT", 8001))
 
+# Bootstrap tasks run in the background (see startup.py); the pools are created
+# here but connect in the "database" task. Pools are drained on shutdown.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # only the Azure database sits behind the firewall rule
+    if database.DB_BACKEND == "mssql":
+        startup.register("firewall", on_startup, required=False)
+    await database.init_pool(fill=False)
+    catalog.reset()
+    codes.reset()
+    startup.register("database", database.warm_pool)
+    # Ensure the default user is created at startup
+    startup.register("default_user", create_default_user, required=False, after=("database",))
+    # productGroupID / sizeKey for rows written before they existed (see groups.py)
+    startup.register("product_groups", groups.backfill, after=("database",))
+    # /products/search answers 503 until the index is loaded
+    startup.register("search_index", search.build, required=False, after=("database",))
+    await startup.start()
+    # deliver queued IMS notifications in the background
+    outbox.start()
+    # periodic availableQuantity drift check
+    inventory.start()
+    # keep the search index current with product writes
+    search.start()
+    try:
+        yield
+    finally:
+        await search.stop()
+        await inventory.stop()
+        await outbox.stop()
+        await startup.stop()
+        workers.shutdown()
+        await ims_client.close()
+        await database.close_pool()
+
+
 # Initialize the FastAPI application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Serve static files for image uploads
-app.mount("/images_upload", StaticFiles(directory="images_upload"), name="images")
+app.mount("/images_upload", StaticFiles(directory=images.IMAGE_DIR), name="images")
 
 # Add CORS middleware to allow requests from the React frontend (localhost:3000)
 origins = [
@@ -45,6 +94,9 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Per-route latency and SQL statement counts, scraped from /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include the authentication router
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 
@@ -60,6 +112,15 @@ app.include_router(orderdetails_router, prefix='/vms', tags=["Order Details"])
 # Include the orders router
 app.include_router(orders_router, prefix='/orders', tags=["Orders"])
 
+# Include the IMS outbox admin router
+app.include_router(outbox_router, prefix='/admin/outbox', tags=["IMS Outbox"])
+
+# availableQuantity drift check and reconciliation
+app.include_router(inventory_router, prefix='/admin/inventory', tags=["Inventory"])
+
+# Content-hashed product images with long-lived caching and ?w= resizing
+app.include_router(images_router, prefix=images.IMAGE_URL_PREFIX, tags=["Images"])
+
 # Add an API endpoint to serve some data (to match the React fetch URL)
 @app.get("/api/data")
 async def get_data():
@@ -70,7 +131,35 @@ async def get_data():
 async def health_check():
     return {"status": "ok"}
 
+# readiness probe: 503 until the required bootstrap tasks have finished
+@app.get("/health/ready")
+async def readiness_check():
+    report = startup.readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+# connection pool statistics, for sizing DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE
+@app.get("/health/db-pool")
+async def db_pool_stats():
+    return database.pool_stats()
+
+# catalog snapshot sizes and ages
+@app.get("/health/catalog-cache")
+async def catalog_cache_stats():
+    return catalog.stats()
+
+# search index size and sync watermark
+@app.get("/health/search")
+async def search_index_stats():
+    return search.stats()
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 async def get_current_ip():
+    import httpx  # deferred: only needed for the firewall bootstrap
+
     try:
         async with httpx.AsyncClient() as client:
             response = await client.get('https://api.ipify.org?format=json')
@@ -87,6 +176,8 @@ async def update_firewall_rule(current_ip):
         'resourceGroupName': 'IMS-VMS',
         'ipAddress': current_ip
     }
+    import httpx
+
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(webhook_url, json=data)
@@ -97,12 +188,11 @@ async def update_firewall_rule(current_ip):
     except httpx.RequestError as e:
         print(f"❌ Error while sending request to webhook: {e}")
 
-@app.on_event("startup")
 async def on_startup():
     current_ip = await get_current_ip()
     if current_ip:
-        loop = asyncio.get_event_loop()
-        loop.create_task(update_firewall_rule(current_ip))  # run in background
+        # already off the startup path, so wait for the webhook to answer
+        await update_firewall_rule(current_ip)
     else:
         print("❌ Could not retrieve current IP address.")
 
@@ -118,4 +208,6 @@ async def trigger_update():
 
 # Run the FastAPI application
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
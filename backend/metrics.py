@@ -0,0 +1,339 @@
+import functools
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Prometheus metrics
+#
+# MetricsMiddleware times every request and keeps a per-request tally of the
+# SQL statements it ran; connections handed out by the pool are wrapped so
+# each cursor.execute() is timed and counted under its statement shape
+# (whitespace collapsed, literals replaced by ?). Exposed on /metrics.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", 10))  # warn when one statement shape runs more often in a request
+METRICS_STATEMENT_LABEL_LENGTH = int(os.getenv("METRICS_STATEMENT_LABEL_LENGTH", 160))
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_LATENCY = Histogram(
+    "vms_http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+REQUEST_STATEMENTS = Histogram(
+    "vms_db_statements_per_request", "SQL statements executed per HTTP request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000),
+)
+STATEMENT_LATENCY = Histogram(
+    "vms_db_statement_duration_seconds", "SQL statement execution latency by statement shape",
+    ["operation", "statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REPEATED_STATEMENTS = Counter(
+    "vms_db_repeated_statements_total",
+    "Requests that ran one statement shape more than METRICS_N_PLUS_ONE_THRESHOLD times",
+    ["route", "statement"],
+)
+POOL_WAIT = Histogram(
+    "vms_db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    ["pool"], buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10),
+)
+POOL_CONNECTIONS = Gauge(
+    "vms_db_pool_connections", "Connection pool occupancy, sampled on scrape",
+    ["pool", "state"], multiprocess_mode="livesum",
+)
+IMS_LATENCY = Histogram(
+    "vms_ims_request_duration_seconds", "Latency of calls to the IMS backend",
+    ["endpoint", "outcome"],
+)
+OUTBOX_DELIVERIES = Counter(
+    "vms_ims_outbox_deliveries_total", "IMS outbox delivery attempts by outcome",
+    ["event_type", "outcome"],
+)
+OUTBOX_DELIVERY_LAG = Histogram(
+    "vms_ims_outbox_delivery_lag_seconds", "Time from an outbox event's commit to its delivery to IMS",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+IMS_BREAKER_STATE = Gauge(
+    "vms_ims_circuit_breaker_state", "IMS circuit breaker: 0 closed, 1 half-open, 2 open",
+    multiprocess_mode="max",
+)
+CATALOG_REQUESTS = Counter(
+    "vms_catalog_cache_requests_total", "Catalog listing requests served from a snapshot (hit) or rebuilt (miss)",
+    ["category", "result"],
+)
+CATALOG_SNAPSHOT_AGE = Histogram(
+    "vms_catalog_snapshot_age_seconds", "Age of the catalog snapshot served on a cache hit",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+CATALOG_REBUILD_SECONDS = Histogram(
+    "vms_catalog_rebuild_duration_seconds", "Time to rebuild one category's catalog snapshot",
+)
+CATALOG_INVALIDATIONS = Counter(
+    "vms_catalog_invalidations_total", "Catalog snapshots invalidated by writes",
+)
+INVENTORY_DRIFT_PRODUCTS = Gauge(
+    "vms_inventory_drift_products", "Products whose availableQuantity differed from their variant count at the last check",
+    multiprocess_mode="max",
+)
+EXPORT_ROWS = Counter(
+    "vms_export_rows_total", "Variants written by inventory exports",
+    ["format"],
+)
+EXPORT_DURATION = Histogram(
+    "vms_export_duration_seconds", "Duration of inventory exports",
+    ["format"], buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+VARIANTS_CREATED = Counter(
+    "vms_variants_created_total", "Product variants created by bulk variant creation",
+)
+CODE_BLOCKS_RESERVED = Counter(
+    "vms_code_blocks_reserved_total", "Barcode/SKU sequence blocks reserved from the database",
+    ["sequence"],
+)
+LABEL_CACHE = Counter(
+    "vms_label_cache_total", "Barcode label and label sheet requests by cache result",
+    ["kind", "result"],
+)
+SEARCH_INDEX_PRODUCTS = Gauge(
+    "vms_search_index_products", "Products in the in-process search index",
+)
+SEARCH_SECONDS = Histogram(
+    "vms_search_seconds", "Time to answer a product search from the index",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+IMAGE_UPLOADS = Counter(
+    "vms_image_uploads_total", "Product image uploads by result (stored, duplicate, rejected)",
+    ["result"],
+)
+IMAGE_CACHE = Counter(
+    "vms_image_cache_total", "Scaled image (?w=) requests by disk cache result",
+    ["result"],
+)
+IMAGE_CACHE_EVICTIONS = Counter(
+    "vms_image_cache_evictions_total", "Scaled images evicted from the disk cache",
+)
+IMAGE_PROCESS_SECONDS = Histogram(
+    "vms_image_process_seconds", "Time to receive, validate and resize an uploaded image",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CATALOG_IMPORT_ROWS = Counter(
+    "vms_catalog_import_rows_total", "Rows of committed catalog imports by action (created, restocked, unchanged)",
+    ["action"],
+)
+CATALOG_IMPORT_DURATION = Histogram(
+    "vms_catalog_import_duration_seconds", "Duration of catalog imports",
+    ["mode"], buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+class _RequestStats:
+    __slots__ = ("statements", "shapes")
+
+    def __init__(self):
+        self.statements = 0
+        self.shapes = {}
+
+
+_request_stats = ContextVar("metrics_request_stats", default=None)
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_shape(sql):
+    """Normalise a statement so queries differing only in literals share a label."""
+    shape = _WHITESPACE.sub(" ", sql).strip()
+    shape = _LITERALS.sub("?", shape)
+    shape = _PARAM_LIST.sub("(?, ...)", shape)
+    return shape[:METRICS_STATEMENT_LABEL_LENGTH]
+
+
+@functools.lru_cache(maxsize=4096)
+def _statement_histogram(sql):
+    shape = statement_shape(sql)
+    operation = shape.split(" ", 1)[0].upper() if shape else "UNKNOWN"
+    return shape, STATEMENT_LATENCY.labels(operation, shape)
+
+
+def _observe_statement(sql, elapsed):
+    shape, histogram = _statement_histogram(sql)
+    histogram.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.shapes[shape] = stats.shapes.get(shape, 0) + 1
+
+
+# Instrumented connection / cursor wrappers
+
+class _Cursor:
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def execute(self, sql, *params):
+        started = time.perf_counter()
+        try:
+            result = await self._cursor.execute(sql, *params)
+        finally:
+            _observe_statement(sql, time.perf_counter() - started)
+        return self if result is self._cursor else result
+
+    async def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            result = await self._cursor.executemany(sql, seq_of_params)
+        finally:
+            _observe_statement(sql, time.perf_counter() - started)
+        return self if result is self._cursor else result
+
+    async def __aenter__(self):
+        await self._cursor.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._cursor.__aexit__(*exc_info)
+
+
+class _CursorContext:
+    """conn.cursor() stays both awaitable and usable with `async with`."""
+
+    __slots__ = ("_context",)
+
+    def __init__(self, context):
+        self._context = context
+
+    async def _open(self):
+        return _Cursor(await self._context)
+
+    def __await__(self):
+        return self._open().__await__()
+
+    async def __aenter__(self):
+        return _Cursor(await self._context.__aenter__())
+
+    async def __aexit__(self, *exc_info):
+        return await self._context.__aexit__(*exc_info)
+
+
+class _Connection:
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return _CursorContext(self._conn.cursor())
+
+
+def instrument(conn):
+    """Wrap a driver connection so its statements are timed and counted."""
+    return _Connection(conn) if METRICS_ENABLED else conn
+
+
+def observe_pool_wait(pool_name, seconds):
+    if METRICS_ENABLED:
+        POOL_WAIT.labels(pool_name).observe(seconds)
+
+
+class _IMSCall:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = None
+
+
+@contextmanager
+def ims_call(url):
+    """Time one attempt at a call to the IMS backend.
+
+    Set `.status` on the yielded object to label the call with the HTTP
+    status; calls that raise before a response arrives are labelled "error".
+    """
+    endpoint = urlsplit(url).path or "/"
+    call = _IMSCall()
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        outcome = str(call.status) if call.status is not None else "error"
+        IMS_LATENCY.labels(endpoint, outcome).observe(time.perf_counter() - started)
+
+
+# Middleware
+
+def _route_label(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            route = _route_label(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
+            REQUEST_STATEMENTS.labels(route).observe(stats.statements)
+            for shape, count in stats.shapes.items():
+                if count > METRICS_N_PLUS_ONE_THRESHOLD:
+                    REPEATED_STATEMENTS.labels(route, shape).inc()
+                    logging.warning(
+                        f"Possible N+1 query: {scope['method']} {route} ran the same statement {count} times: {shape}"
+                    )
+
+
+def _sample_pools():
+    import database
+
+    stats = database.pool_stats()
+    for pool_stats in (stats, stats.get("replica")):
+        if pool_stats and "name" in pool_stats:
+            for state in ("size", "idle", "in_use", "waiting"):
+                POOL_CONNECTIONS.labels(pool_stats["name"], state).set(pool_stats[state])
+
+
+def render():
+    """Serialise all metrics in the Prometheus text format."""
+    _sample_pools()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # gunicorn with several workers: aggregate every worker's samples
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
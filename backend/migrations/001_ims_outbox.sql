@@ -0,0 +1,25 @@
+-- IMS outbox (outbox.py): status notifications queued in the same transaction
+-- as the order change and delivered to IMS by the background dispatcher.
+-- Apply with: sqlcmd -S <server> -d <database> -U <user> -i migrations/001_ims_outbox.sql
+
+CREATE TABLE ImsOutbox (
+    eventID bigint IDENTITY(1,1) NOT NULL PRIMARY KEY,
+    orderID int NOT NULL,
+    eventType varchar(50) NOT NULL,
+    endpoint varchar(200) NOT NULL,
+    payload nvarchar(max) NOT NULL,
+    status varchar(10) NOT NULL CONSTRAINT DF_ImsOutbox_status DEFAULT 'pending',
+    attempts int NOT NULL CONSTRAINT DF_ImsOutbox_attempts DEFAULT 0,
+    nextAttemptAt datetime2 NOT NULL,
+    lockedUntil datetime2 NULL,
+    claimToken char(32) NULL,
+    lastError nvarchar(2000) NULL,
+    createdAt datetime2 NOT NULL,
+    sentAt datetime2 NULL
+);
+
+-- dispatcher scan: due pending events
+CREATE INDEX ix_ImsOutbox_status ON ImsOutbox (status, nextAttemptAt) INCLUDE (orderID, lockedUntil);
+-- per-order ordering check and the admin view by order
+CREATE INDEX ix_ImsOutbox_orderID ON ImsOutbox (orderID, eventID) INCLUDE (status);
+CREATE INDEX ix_ImsOutbox_claimToken ON ImsOutbox (claimToken) WHERE claimToken IS NOT NULL;
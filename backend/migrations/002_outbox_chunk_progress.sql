@@ -0,0 +1,5 @@
+-- Chunked variant delivery (IMS_VARIANT_DELIVERY=ndjson): number of NDJSON
+-- chunks IMS has acknowledged for an event, so retries resume from the next one.
+-- Apply with: sqlcmd -S <server> -d <database> -U <user> -i migrations/002_outbox_chunk_progress.sql
+
+ALTER TABLE ImsOutbox ADD chunksSent int NOT NULL CONSTRAINT DF_ImsOutbox_chunksSent DEFAULT 0;
@@ -0,0 +1,24 @@
+-- Maintained count of each product's available variants (ProductVariants
+-- rows with isAvailable = 1), so catalog reads no longer aggregate
+-- ProductVariants. Backfilled here; the app keeps it current afterwards.
+-- Check for drift with GET /admin/inventory/drift or `python inventory.py`.
+-- Apply with: sqlcmd -S <server> -d <database> -U <user> -i migrations/003_available_quantity.sql
+
+ALTER TABLE Products ADD availableQuantity int NOT NULL CONSTRAINT DF_Products_availableQuantity DEFAULT 0;
+GO
+
+UPDATE p
+SET availableQuantity = c.actualQuantity
+FROM Products AS p
+JOIN (SELECT productID, COUNT(*) AS actualQuantity
+      FROM ProductVariants
+      WHERE isAvailable = 1
+      GROUP BY productID) AS c
+ON c.productID = p.productID;
+GO
+
+-- Catalog listing: seek on category (image_path is a LOB and cannot be included)
+CREATE INDEX ix_Products_category_available
+ON Products (category, isActive, availableQuantity)
+INCLUDE (productName, productDescription, size, unitPrice, currentStock);
+GO
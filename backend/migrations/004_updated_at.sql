@@ -0,0 +1,13 @@
+-- Last-modified time of products and variants, the watermark for
+-- incremental inventory exports (GET /products/export?updatedSince=...).
+-- The app sets it on every insert and update of these tables; existing rows
+-- take the time of the migration.
+-- Apply with: sqlcmd -S <server> -d <database> -U <user> -i migrations/004_updated_at.sql
+
+ALTER TABLE Products ADD updatedAt datetime2 NOT NULL CONSTRAINT DF_Products_updatedAt DEFAULT SYSUTCDATETIME();
+ALTER TABLE ProductVariants ADD updatedAt datetime2 NOT NULL CONSTRAINT DF_ProductVariants_updatedAt DEFAULT SYSUTCDATETIME();
+GO
+
+CREATE INDEX ix_Products_updatedAt ON Products (updatedAt);
+CREATE INDEX ix_ProductVariants_updatedAt ON ProductVariants (updatedAt) INCLUDE (productID);
+GO
@@ -0,0 +1,14 @@
+-- Sequences the barcode/SKU allocator (codes.py) reserves blocks from, and a
+-- unique index on ProductVariants.barcode. The index cannot be created while
+-- duplicate barcodes exist; list them with:
+--   SELECT barcode, COUNT(*) FROM ProductVariants GROUP BY barcode HAVING COUNT(*) > 1;
+-- Apply with: sqlcmd -S <server> -d <database> -U <user> -i migrations/005_code_sequences.sql
+
+CREATE TABLE CodeSequences (
+    name varchar(32) NOT NULL CONSTRAINT PK_CodeSequences PRIMARY KEY,
+    nextValue bigint NOT NULL
+);
+
+INSERT INTO CodeSequences (name, nextValue) VALUES ('barcode', 1), ('sku', 1);
+
+CREATE UNIQUE INDEX ux_ProductVariants_barcode ON ProductVariants (barcode);
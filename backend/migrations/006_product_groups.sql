@@ -0,0 +1,30 @@
+-- Product groups: the sizes of a product share a productGroupID, found by
+-- groupKey (a hash of the normalised name and category, computed by
+-- groups.py), and each row has a normalised sizeKey, so "this product in
+-- this size" is one seek on ix_Products_group_size instead of matching
+-- name, description, category, size and a float price.
+-- The keys are computed in Python: the app fills them for existing rows on
+-- startup, or run `python groups.py` after applying this.
+-- Apply with: sqlcmd -S <server> -d <database> -U <user> -i migrations/006_product_groups.sql
+
+CREATE TABLE ProductGroups (
+    productGroupID int IDENTITY(1,1) NOT NULL CONSTRAINT PK_ProductGroups PRIMARY KEY,
+    groupKey char(40) NOT NULL,
+    productName nvarchar(255) NOT NULL,
+    category nvarchar(255) NULL,
+    createdAt datetime2 NOT NULL CONSTRAINT DF_ProductGroups_createdAt DEFAULT SYSUTCDATETIME()
+);
+
+CREATE UNIQUE INDEX ux_ProductGroups_groupKey ON ProductGroups (groupKey);
+GO
+
+ALTER TABLE Products ADD
+    productGroupID int NULL CONSTRAINT FK_Products_ProductGroups REFERENCES ProductGroups (productGroupID),
+    sizeKey nvarchar(100) NULL;
+GO
+
+-- covers the size lookups and the size lists of a group
+CREATE INDEX ix_Products_group_size
+ON Products (productGroupID, sizeKey)
+INCLUDE (isActive, size, unitPrice, currentStock, availableQuantity, productDescription, color);
+GO
@@ -0,0 +1,315 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+import database
+import ims_client
+import metrics
+
+# Transactional outbox for IMS notifications
+#
+# Order endpoints write their status change and an ImsOutbox row in the same
+# transaction (enqueue) and return once that commits. The dispatcher started
+# with the app claims due events in batches, sends them to IMS concurrently
+# and records the outcome, retrying failures with exponential backoff. An
+# event is only sent once every earlier event for the same order has been
+# delivered, so IMS sees each order's changes in order. Events that exhaust
+# OUTBOX_MAX_ATTEMPTS are marked failed and wait for a retry from the admin
+# view (/admin/outbox); they hold back later events for their order.
+
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"  # run the dispatcher in this process
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 2))  # seconds between polls when idle
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", 8))  # IMS calls in flight per batch
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 120))  # seconds a claimed batch is reserved for this worker
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 2))  # seconds; doubles per attempt
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 600))
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", 7))  # delete sent events older than this
+
+# Delivered-order variants: "json" posts them as one JSON document; "ndjson"
+# posts gzip-compressed NDJSON chunks of IMS_VARIANT_CHUNK_SIZE variants and
+# records each acknowledged chunk, so a retry resumes where delivery stopped
+IMS_VARIANT_DELIVERY = os.getenv("IMS_VARIANT_DELIVERY", "json")
+IMS_VARIANT_CHUNK_SIZE = int(os.getenv("IMS_VARIANT_CHUNK_SIZE", 500))
+
+# events whose IMS endpoint acknowledges with {"status": "success"}
+ACKNOWLEDGED_EVENTS = {"order.delivered"}
+
+_task = None
+_wakeup = asyncio.Event()
+_last_purge = 0.0
+
+
+async def enqueue(cursor, order_id, event_type, endpoint, payload):
+    """Queue an IMS call inside the caller's transaction; it is sent after the commit."""
+    now = datetime.utcnow()
+    await cursor.execute(
+        '''INSERT INTO ImsOutbox (orderID, eventType, endpoint, payload, status, attempts, nextAttemptAt, createdAt)
+           VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)''',
+        (order_id, event_type, endpoint, json.dumps(payload, default=str), now, now)
+    )
+
+
+def notify():
+    """Wake the dispatcher after a commit that queued events."""
+    _wakeup.set()
+
+
+async def _claim():
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''SELECT TOP (?) o.eventID
+               FROM ImsOutbox o
+               WHERE o.status = 'pending' AND o.nextAttemptAt <= ?
+                 AND (o.lockedUntil IS NULL OR o.lockedUntil < ?)
+                 AND NOT EXISTS (
+                     SELECT 1 FROM ImsOutbox e
+                     WHERE e.orderID = o.orderID AND e.eventID < o.eventID AND e.status <> 'sent')
+               ORDER BY o.eventID''',
+            (OUTBOX_BATCH_SIZE, now, now)
+        )
+        ids = [row[0] for row in await cursor.fetchall()]
+        if not ids:
+            await conn.rollback()
+            return []
+        # the lease keeps other workers off these rows; the token tells us which ones we won
+        placeholders = ", ".join("?" * len(ids))
+        await cursor.execute(
+            f'''UPDATE ImsOutbox
+                SET claimToken = ?, lockedUntil = ?
+                WHERE eventID IN ({placeholders}) AND (lockedUntil IS NULL OR lockedUntil < ?)''',
+            (token, now + timedelta(seconds=OUTBOX_LEASE), *ids, now)
+        )
+        await conn.commit()
+        await cursor.execute(
+            '''SELECT eventID, orderID, eventType, endpoint, payload, attempts, createdAt, chunksSent
+               FROM ImsOutbox
+               WHERE claimToken = ?
+               ORDER BY eventID''',
+            (token,)
+        )
+        events = await cursor.fetchall()
+        await conn.rollback()
+        return events
+
+
+def _check_ack(event_type, response):
+    if event_type in ACKNOWLEDGED_EVENTS and (not isinstance(response, dict) or response.get("status") != "success"):
+        raise ims_client.IMSError(f"IMS did not acknowledge {event_type}: {str(response)[:200]}")
+
+
+def variant_chunks(payload, chunk_size=None):
+    """Yield (index, count, gzip NDJSON body) for a delivered order's variants.
+
+    Each body starts with a header line (orderID, orderStatus, chunk, chunks,
+    variantCount) followed by one variant per line.
+    """
+    chunk_size = chunk_size or IMS_VARIANT_CHUNK_SIZE
+    variants = payload["variants"]
+    count = max(1, -(-len(variants) // chunk_size))
+    for index in range(count):
+        header = {
+            "orderID": payload["orderID"], "orderStatus": payload["orderStatus"],
+            "chunk": index, "chunks": count, "variantCount": len(variants),
+        }
+        lines = [json.dumps(header)]
+        lines.extend(json.dumps(variant) for variant in variants[index * chunk_size:(index + 1) * chunk_size])
+        yield index, count, gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=6)
+
+
+async def _save_progress(event_id, chunks_sent):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute("UPDATE ImsOutbox SET chunksSent = ? WHERE eventID = ?", (chunks_sent, event_id))
+        await conn.commit()
+
+
+async def _send_variant_chunks(event_id, order_id, event_type, endpoint, payload, chunks_sent):
+    sent_bytes = 0
+    for index, count, body in variant_chunks(payload):
+        if index < chunks_sent:
+            continue  # acknowledged by IMS on an earlier attempt
+        response = await ims_client.post(endpoint, None, content=body, headers={
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip",
+            "X-Order-ID": str(order_id),
+            "X-Chunk-Index": str(index),
+            "X-Chunk-Count": str(count),
+            "Idempotency-Key": f"order-{order_id}-variants-{index}",
+        })
+        _check_ack(event_type, response)
+        sent_bytes += len(body)
+        await _save_progress(event_id, index + 1)
+    return sent_bytes
+
+
+async def _send(event, semaphore):
+    event_id, order_id, event_type, endpoint, payload, attempts, created_at, chunks_sent = event
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            if event_type == "order.delivered" and IMS_VARIANT_DELIVERY == "ndjson":
+                document = json.loads(payload)
+                sent_bytes = await _send_variant_chunks(event_id, order_id, event_type, endpoint, document, chunks_sent)
+                detail = f"{len(document['variants'])} variants, {len(payload)} bytes as {sent_bytes} bytes gzip NDJSON"
+            else:
+                response = await ims_client.post(endpoint, json.loads(payload))
+                _check_ack(event_type, response)
+                detail = f"{len(payload)} bytes JSON"
+            logging.info(
+                f"Sent {event_type} for order {order_id} to IMS: {detail} "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+            return event, None
+        except Exception as e:
+            return event, e
+
+
+def _next_attempt(attempts):
+    return datetime.utcnow() + timedelta(seconds=min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** attempts))
+
+
+async def dispatch_once():
+    """Claim and send one batch; returns the number of events processed."""
+    events = await _claim()
+    if not events:
+        return 0
+
+    semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+    results = await asyncio.gather(*(_send(event, semaphore) for event in events))
+
+    now = datetime.utcnow()
+    updates = []
+    for (event_id, order_id, event_type, endpoint, payload, attempts, created_at, chunks_sent), error in results:
+        if error is None:
+            updates.append(("sent", attempts + 1, now, now, None, event_id))
+            metrics.OUTBOX_DELIVERIES.labels(event_type, "sent").inc()
+            if created_at:
+                metrics.OUTBOX_DELIVERY_LAG.observe((now - created_at).total_seconds())
+        elif isinstance(error, ims_client.IMSUnavailableError):
+            # the breaker kept us from calling IMS: not an attempt, try again once it half-opens
+            retry_at = now + timedelta(seconds=ims_client.breaker.retry_in() + 1)
+            updates.append(("pending", attempts, retry_at, None, str(error)[:2000], event_id))
+            metrics.OUTBOX_DELIVERIES.labels(event_type, "deferred").inc()
+        else:
+            attempts += 1
+            status = "failed" if attempts >= OUTBOX_MAX_ATTEMPTS else "pending"
+            updates.append((status, attempts, _next_attempt(attempts), None, str(error)[:2000], event_id))
+            metrics.OUTBOX_DELIVERIES.labels(event_type, status).inc()
+            log = logging.error if status == "failed" else logging.warning
+            log(f"IMS outbox event {event_id} ({event_type}, order {order_id}) attempt {attempts} failed: {error}")
+
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.executemany(
+            '''UPDATE ImsOutbox
+               SET status = ?, attempts = ?, nextAttemptAt = ?, sentAt = ?, lastError = ?,
+                   lockedUntil = NULL, claimToken = NULL
+               WHERE eventID = ?''',
+            updates
+        )
+        await conn.commit()
+    return len(events)
+
+
+async def _purge():
+    global _last_purge
+    if time.monotonic() - _last_purge < 3600:
+        return
+    _last_purge = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=OUTBOX_RETENTION_DAYS)
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute("DELETE FROM ImsOutbox WHERE status = 'sent' AND sentAt < ?", (cutoff,))
+        await conn.commit()
+
+
+async def _run():
+    while True:
+        processed = 0
+        try:
+            processed = await dispatch_once()
+            await _purge()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"IMS outbox dispatch failed: {e}")
+        if processed:
+            continue  # delivering an event can unblock the next one for its order
+        # not wait_for(): on 3.11 it swallows a cancel that arrives as the event is set
+        try:
+            async with asyncio.timeout(OUTBOX_POLL_INTERVAL):
+                await _wakeup.wait()
+        except TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def start():
+    global _task, _wakeup
+    if OUTBOX_ENABLED and _task is None:
+        _wakeup = asyncio.Event()
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+async def summary():
+    async with database.connection("read") as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''SELECT status, COUNT(*), MIN(createdAt)
+               FROM ImsOutbox
+               GROUP BY status'''
+        )
+        rows = await cursor.fetchall()
+    now = datetime.utcnow()
+    counts = {"pending": 0, "failed": 0, "sent": 0}
+    oldest = {}
+    for status, count, created_at in rows:
+        counts[status] = count
+        if status != "sent" and created_at:
+            if isinstance(created_at, str):
+                # SQLite drops the column type on aggregates
+                created_at = datetime.fromisoformat(created_at)
+            oldest[status] = round((now - created_at).total_seconds(), 1)
+    return {
+        "dispatcher_running": _task is not None and not _task.done(),
+        "counts": counts,
+        "oldest_seconds": oldest,
+        "ims": ims_client.stats(),
+    }
+
+
+async def retry(event_id):
+    """Put a failed event back in the queue; returns False if it is not failed."""
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''UPDATE ImsOutbox
+               SET status = 'pending', attempts = 0, nextAttemptAt = ?, lastError = NULL
+               WHERE eventID = ? AND status = 'failed' ''',
+            (datetime.utcnow(), event_id)
+        )
+        updated = cursor.rowcount
+        await conn.commit()
+    if updated:
+        notify()
+    return updated > 0
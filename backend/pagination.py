@@ -0,0 +1,85 @@
+import base64
+import os
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+import database
+import rows
+
+# Keyset pagination and streamed listings
+#
+# Paged list endpoints order by a unique key (e.g. productID, variantID) and
+# hand out an opaque cursor holding the last key returned; the next page
+# seeks past it (WHERE key > cursor) instead of using OFFSET, so every page
+# costs the same however deep the client pages. Streamed listings pull rows
+# with fetchmany() and write the JSON array a batch at a time, so a full dump
+# runs in constant memory.
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 100))  # when a cursor is given without a limit
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 5000))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 1000))  # rows per fetchmany() when streaming
+
+# TOP (?) argument for a streamed listing without a limit
+ALL_ROWS = 2 ** 31 - 1
+
+
+def encode_cursor(*keys):
+    token = ":".join(str(int(key)) for key in keys).encode("ascii")
+    return base64.urlsafe_b64encode(token).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    """Return the `size` integer keys in a cursor; raises HTTPException(400) for a bad one."""
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        keys = tuple(int(key) for key in token.split(":"))
+    except (ValueError, UnicodeDecodeError):
+        keys = ()
+    if len(keys) != size:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return keys
+
+
+async def fetch_page(cursor, limit, key_columns, transforms=None):
+    """Fetch up to `limit` records of a query that selected TOP (limit + 1) rows.
+
+    Returns a response whose body is {"items": [...], "nextCursor": ...};
+    nextCursor is null on the last page. key_columns name the columns the
+    query is ordered by.
+    """
+    found = await cursor.fetchmany(limit + 1)
+    mapper = rows.mapper_for(cursor.description, transforms)
+    next_cursor = None
+    if len(found) > limit:
+        found = found[:limit]
+        names = [column[0] for column in cursor.description]
+        last = found[-1]
+        next_cursor = encode_cursor(*(last[names.index(column)] for column in key_columns))
+    items = mapper.encode(mapper.from_rows(found))
+    next_json = b"null" if next_cursor is None else f'"{next_cursor}"'.encode("ascii")
+    return Response(b'{"items":' + items + b',"nextCursor":' + next_json + b"}", media_type="application/json")
+
+
+async def _stream(query, params, transforms, batch_size):
+    async with database.connection("read") as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(query, params)
+        mapper = rows.mapper_for(cursor.description, transforms)
+        yield b"["
+        first = True
+        while True:
+            batch = await cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            encoded = mapper.encode(mapper.from_rows(batch))[1:-1]
+            yield encoded if first else b"," + encoded
+            first = False
+        yield b"]"
+
+
+def stream_records(query, params=(), transforms=None, batch_size=None):
+    """Stream a query's rows as one JSON array, fetching batch_size rows at a time.
+
+    The query runs on a read connection held until the last row is sent.
+    """
+    return StreamingResponse(_stream(query, params, transforms, batch_size or STREAM_BATCH_SIZE),
+                             media_type="application/json")
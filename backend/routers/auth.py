@@ -4,7 +4,6 @@ from pydantic import BaseModel
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import aioodbc
 import database as database
 
 # JWT Configuration
@@ -47,13 +46,13 @@ class UserInDB(User):
 async def get_user_from_db(username: str):
     """Fetch user from DB."""
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-        await cursor.execute(
-            "SELECT username, userPassword, userRole, isDisabled, firstName, lastName FROM users WHERE username = ?", 
-            (username,)
-        )
-        user_row = await cursor.fetchone()
+        async with database.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT username, userPassword, userRole, isDisabled, firstName, lastName FROM users WHERE username = ?", 
+                    (username,)
+                )
+                user_row = await cursor.fetchone()
         if user_row:
             return UserInDB(
                 username=user_row[0],
@@ -67,9 +66,6 @@ async def get_user_from_db(username: str):
     except Exception as e:
         print(f"Error accessing database: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        await cursor.close()
-        await conn.close()
 
 
 # JWT Helper Functions
@@ -147,40 +143,30 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def create_default_user():
     """Creates the first default user if no users exist in the database."""
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-        
-        # Check if any user exists
-        await cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = await cursor.fetchone()
-        
-        if user_count[0] == 0:  # No users exist
-            # Define default user details
-            default_username = "admin"
-            default_password = "admin123"
-            hashed_password = get_password_hash(default_password)
-            
-            # Insert the default user
-            await cursor.execute(
-                """
-                INSERT INTO users (username, userPassword, userRole, isDisabled, firstName, lastName)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (default_username, hashed_password, "admin", False, "Default", "Admin")
-            )
-            await conn.commit()
-            print("Default admin user created: username=admin, password=admin123")
-        else:
-            print("Users already exist in the database. Default user not created.")
+        async with database.connection() as conn:
+            async with conn.cursor() as cursor:
+                # Check if any user exists
+                await cursor.execute("SELECT COUNT(*) FROM users")
+                user_count = await cursor.fetchone()
+
+                if user_count[0] == 0:  # No users exist
+                    # Define default user details
+                    default_username = "admin"
+                    default_password = "admin123"
+                    hashed_password = get_password_hash(default_password)
+
+                    # Insert the default user
+                    await cursor.execute(
+                        """
+                        INSERT INTO users (username, userPassword, userRole, isDisabled, firstName, lastName)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (default_username, hashed_password, "admin", False, "Default", "Admin")
+                    )
+                    await conn.commit()
+                    print("Default admin user created: username=admin, password=admin123")
+                else:
+                    print("Users already exist in the database. Default user not created.")
     except Exception as e:
         print(f"Error creating default user: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        await cursor.close()
-        await conn.close()
-
-
-# Ensure the default user is created at startup
-@router.on_event("startup")
-async def on_startup():
-    await create_default_user()
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import Optional
+import images
+import os
+
+# Content-addressed product images (see images.py). The URL names the
+# content, so responses never change: clients cache them for a year and
+# revalidation is answered from the ETag alone, without touching the disk.
+router = APIRouter()
+
+
+@router.get("/{digest}.{ext}")
+async def get_image(digest: str, ext: str, request: Request, w: Optional[int] = Query(None, ge=1, le=10000)):
+    if ext not in images.MEDIA_TYPES or not images.is_digest(digest):
+        raise HTTPException(status_code=404, detail="image not found")
+    width = images.snap_width(w) if w and ext in images.SCALABLE else None
+    headers = {"ETag": images.etag(digest, ext, width), "Cache-Control": images.IMMUTABLE}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        path = await images.image_file(digest, ext, width)
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="image not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return images.ImageResponse(path, media_type=images.MEDIA_TYPES[ext], headers=headers,
+                                stat_result=stat_result)
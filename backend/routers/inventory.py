@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from routers.auth import get_current_user
+import inventory
+
+# Admin checks of the maintained Products.availableQuantity counts
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.get("/drift")
+async def inventory_drift(limit: int = Query(1000, ge=1, le=10000)):
+    try:
+        drifted = await inventory.drift(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking inventory drift: {e}")
+    return {"drifted": len(drifted), "products": drifted}
+
+
+@router.post("/reconcile")
+async def reconcile_inventory(limit: int = Query(1000, ge=1, le=10000)):
+    try:
+        fixed = await inventory.reconcile(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reconciling inventory: {e}")
+    return {"reconciled": len(fixed), "products": fixed}
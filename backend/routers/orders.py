@@ -2,16 +2,23 @@ from fastapi import FastAPI, HTTPException, Query, APIRouter
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import logging
-import httpx
 import asyncio
-from aiohttp import ClientSession
 import json
+import catalog
 import database
-from typing import List
+import groups
+import images
+import inventory
+import labels
+import rows
+import outbox
+from typing import List, Optional
 
 
 router = APIRouter()
 
+DELIVERY_FLIP_BATCH = 1000  # variantIDs per UPDATE when delivering; SQL Server allows 2100 parameters
+
 class OrderStatusUpdate(BaseModel):
     orderStatus: str
 
@@ -30,25 +37,6 @@ class OrderSummary(BaseModel):
     warehouseAddress: str
     image_path: str
 
-# helper function to send order to ims
-async def send_to_ims_api(ims_api_url: str, payload: dict):
-    try:
-        logging.info(f'Sending data to IMS API: {ims_api_url}')
-        logging.debug(f'Payload: {payload}')
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(ims_api_url, json=payload)
-            response.raise_for_status()
-            logging.info(f'Response received from IMS API: {response.json()}')
-            return response.json()
-    
-    except httpx.HTTPStatusError as http_err:
-        logging.error(f"HTTP error occured: {http_err.response.status_code} - {http_err.response.text}")
-        raise HTTPException(status_code=500, detail=f"IMS API error:{http_err.response.text}")
-    except Exception as e:
-        logging.error(f"Error sending data to IMS API: {e}")
-        raise HTTPException(status_code=500, detail=f'Error sending data to IMS API:{e}')
-
 def parse_datetime(date_str):
     """Convert string timestamp to datetime format for SQL Server."""
     if isinstance(date_str, str):
@@ -65,7 +53,6 @@ def parse_datetime(date_str):
 # receive order from ims
 @router.post('/vms/orders')
 async def receive_order(order: dict):
-    conn = None
     try:
         # extract order details
         customer_id = order.get('customerID')
@@ -78,675 +65,567 @@ async def receive_order(order: dict):
             raise HTTPException(status_code=400, detail="Invalid order data.")
 
         # get database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # save order in VMS
-        await cursor.execute(
-            '''INSERT INTO purchaseOrders (orderDate, orderStatus, statusDate, customerID)
-               OUTPUT inserted.orderID
-               VALUES (?, ?, ?, ?)''',
-            (order_date, order_status, datetime.utcnow(), customer_id)
-        )
-        
-        vms_order_id = await cursor.fetchone()
-        if not vms_order_id:
-            raise HTTPException(status_code=500, detail='Failed to create purchase order.')
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
 
-        vms_order_id = vms_order_id[0]
-
-        # Insert order details
-        for product in products:
-            product_name = product.get('productName')
-            size = product.get('size')
-            category = product.get('category')
-            quantity = product.get('quantity')
-            expected_date = parse_datetime(product.get('expectedDate', (datetime.utcnow() + timedelta(days=7))))
-
-            if not quantity or not size or not category:
-                raise HTTPException(status_code=400, detail="Invalid product details.")
-
-            # look up product
+            # save order in VMS
             await cursor.execute(
-                '''SELECT productID FROM products WHERE productName = ? AND size = ? AND category = ?''',
-                (product_name, size, category)
+                '''INSERT INTO purchaseOrders (orderDate, orderStatus, statusDate, customerID)
+                   OUTPUT inserted.orderID
+                   VALUES (?, ?, ?, ?)''',
+                (order_date, order_status, datetime.utcnow(), customer_id)
             )
-            product_result = await cursor.fetchone()
-            
-            if not product_result:
-                raise HTTPException(status_code=400, detail=f"Product not found: {product_name}, {size}, {category}")
 
-            product_id = product_result[0]
+            vms_order_id = await cursor.fetchone()
+            if not vms_order_id:
+                raise HTTPException(status_code=500, detail='Failed to create purchase order.')
+
+            vms_order_id = vms_order_id[0]
+
+            # Insert order details
+            for product in products:
+                product_name = product.get('productName')
+                size = product.get('size')
+                category = product.get('category')
+                group_id = product.get('productGroupID')  # instead of productName and category
+                quantity = product.get('quantity')
+                expected_date = parse_datetime(product.get('expectedDate', (datetime.utcnow() + timedelta(days=7))))
+
+                if not quantity or not size or not (category or group_id):
+                    raise HTTPException(status_code=400, detail="Invalid product details.")
+
+                # look up product: a seek on ix_Products_group_size, preferring the active row
+                in_group, group = groups.group_filter(group_id, product_name, category)
+                of_size, size_params = groups.size_filter(size)
+                await cursor.execute(
+                    f'''SELECT TOP 1 productID FROM products WHERE {in_group} AND {of_size}
+                        ORDER BY isActive DESC, productID''',
+                    (*group, *size_params)
+                )
+                product_result = await cursor.fetchone()
 
-            # Insert into purchaseOrderDetails
-            await cursor.execute(
-                '''INSERT INTO purchaseOrderDetails (orderQuantity, expectedDate, productID, orderID)
-                   VALUES (?, ?, ?, ?)''',
-                (quantity, expected_date, product_id, vms_order_id)
-            )
+                if not product_result:
+                    raise HTTPException(status_code=400, detail=f"Product not found: {product_name}, {size}, {category}")
 
-        # Commit transaction
-        await conn.commit()
+                product_id = product_result[0]
 
-        return {"message": "Order received successfully.", "orderID": vms_order_id}
+                # Insert into purchaseOrderDetails
+                await cursor.execute(
+                    '''INSERT INTO purchaseOrderDetails (orderQuantity, expectedDate, productID, orderID)
+                       VALUES (?, ?, ?, ?)''',
+                    (quantity, expected_date, product_id, vms_order_id)
+                )
+
+            # Commit transaction
+            await conn.commit()
+
+            return {"message": "Order received successfully.", "orderID": vms_order_id}
 
     except Exception as e:
         logging.error(f"Error receiving order: {e}")
         raise HTTPException(status_code=500, detail="Error processing order.")
-    
-    finally:
-        if conn:
-            await conn.close()
+
+# availability of one or many orders (?orderID=1&orderID=2): only the products
+# that cannot be filled, counting every checked line of a product together
+@router.get('/vms/orders/availability')
+@database.read_only
+async def check_orders_availability(orderID: List[int] = Query(...)):
+    if len(orderID) > inventory.SHORTAGE_MAX_ORDERS:
+        raise HTTPException(status_code=400, detail=f"At most {inventory.SHORTAGE_MAX_ORDERS} orders can be checked at once")
+    try:
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+            shortages = await inventory.shortages(cursor, orderID)
+        return {"orders": len(set(orderID)), "available": not shortages, "shortages": shortages}
+    except Exception as e:
+        logging.error(f"error checking order availability: {e}")
+        raise HTTPException(status_code=500, detail=f"error checking availability: {e}")
 
 # confirm or reject order
 @router.put('/vms/orders/{orderID}/confirm')
 async def confirm_order(orderID: int, order_status_update: OrderStatusUpdate):
-    conn = None
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
 
-        # validate order and its current status
-        await cursor.execute(
-            '''select orderStatus 
-            from purchaseOrders 
-            where orderID =?''',
-            (orderID,)
-        )
-        order = await cursor.fetchone()
-        if not order:
-            raise HTTPException(status_code=404, detail="order not found.")
-        # only allow "Pending" orders to be confirmed or rejected
-        if order[0] != 'Pending':
-            raise HTTPException(status_code=400, detail="Order is not in 'Pending' status")
-        
-        # validate the status provided
-        status = order_status_update.orderStatus
-        if status not in ["Confirmed", "Rejected"]:
-            raise HTTPException(status_code=400, detail="Invalid order status. Must be 'Confirmed' or 'Rejected' only.")
-        
-        # fetch order details for the products
-        await cursor.execute(
-            '''select productID, orderQuantity
-            from purchaseOrderDetails 
-            where orderID = ?''',
-            (orderID,)
-        )
-        products = await cursor.fetchall()
-
-        # check the availability of product variants
-        for product in products: 
-            product_id = product[0]
-            order_quantity = product[1]
-
-            # fetch available variant for the product
-            variant_query = f'''select top ({order_quantity}) pv.barcode, pv.productCode, p.productName, 
-                                       p.category, p.size
-                                       from productVariants pv
-                                       join Products p 
-                                       on pv.productID = p.productID
-                                       where pv.productID = ? AND pv.isAvailable = 1
-                                       order by pv.variantID asc'''
-            await cursor.execute(variant_query, (product_id,))
-            variants = await cursor.fetchall()
-
-            # check if there are enough available variants
-            if len(variants) < order_quantity:
-                raise HTTPException(status_code=400, detail=f"not enough available variants for productID {product_id}. Required: {order_quantity}, Available: {len(variants)}")
-        
-        # prepare the payload for IMS if the status is "Confirmed"
-        ims_api_url = "https://ims-wc58.onrender.com/receive-orders/ims/orders/confirm"
-        ims_payload = {"orderID": orderID, "orderStatus": status}
-
-        # send the confirmation or rejection to IMS and wait for a response
-        ims_response = await send_to_ims_api(ims_api_url, ims_payload)
-
-        # update the status in VMS immediately after receiving the response from IMS
-        await cursor.execute(
-            '''update purchaseOrders 
-            set orderStatus = ?, statusDate = ?
-            where orderID = ? ''',
-            (status, datetime.utcnow(), orderID)
-        )
-        await conn.commit()
+            # validate order and its current status
+            await cursor.execute(
+                '''select orderStatus 
+                from purchaseOrders 
+                where orderID =?''',
+                (orderID,)
+            )
+            order = await cursor.fetchone()
+            if not order:
+                raise HTTPException(status_code=404, detail="order not found.")
+            # only allow "Pending" orders to be confirmed or rejected
+            if order[0] != 'Pending':
+                raise HTTPException(status_code=400, detail="Order is not in 'Pending' status")
+
+            # validate the status provided
+            status = order_status_update.orderStatus
+            if status not in ["Confirmed", "Rejected"]:
+                raise HTTPException(status_code=400, detail="Invalid order status. Must be 'Confirmed' or 'Rejected' only.")
+
+            # check the availability of product variants for every product at once (rejecting needs none)
+            if status == "Confirmed":
+                shortages = await inventory.shortages(cursor, (orderID,))
+                if shortages:
+                    raise HTTPException(status_code=409, detail={
+                        "message": f"not enough available variants for order {orderID}",
+                        "shortages": shortages,
+                    })
+
+            # update the status in VMS
+            await cursor.execute(
+                '''update purchaseOrders 
+                set orderStatus = ?, statusDate = ?
+                where orderID = ? ''',
+                (status, datetime.utcnow(), orderID)
+            )
+
+            # queue the confirmation or rejection for IMS in the same transaction
+            ims_payload = {"orderID": orderID, "orderStatus": status}
+            await outbox.enqueue(cursor, orderID, "order.confirmed", "/receive-orders/ims/orders/confirm", ims_payload)
+            await conn.commit()
+            outbox.notify()
 
-        return {'message': f"order {orderID} has been {status} in VMS", 'imsResponse': ims_response}
+            return {'message': f"order {orderID} has been {status} in VMS", 'imsDelivery': 'queued'}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"error confirming order: {e}")
         raise HTTPException(status_code=500, detail=f"error processing order: {e}")
-    finally:
-        if conn:
-            await conn.close()
 
 @router.get("/confirmed/orders", response_model=List[OrderSummary])
+@database.read_only
 async def get_order_details():
-    conn = None
     try:
         # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  -- Include imagePath from the Products table
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'Confirmed'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+
+            # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
+            query = """
+            SELECT 
+                po.orderID,  -- Include orderID
+                p.productName, 
+                p.size, 
+                p.category, 
+                pod.orderQuantity AS quantity,
+                (p.unitPrice * pod.orderQuantity) AS totalPrice,
+                c.customerName,
+                c.customerAddress AS warehouseAddress,
+                p.image_path  -- Include imagePath from the Products table
+            FROM 
+                purchaseOrderDetails pod
+            JOIN 
+                Products p ON pod.productID = p.productID
+            JOIN 
+                purchaseOrders po ON pod.orderID = po.orderID
+            JOIN 
+                Customers c ON po.customerID = c.customerID
+            WHERE
+                po.orderStatus = 'Confirmed'  
+            """
+            await cursor.execute(query)
+            # Map rows straight to records; the query columns match OrderSummary
+            mapper, order_summaries = await rows.fetch_records(cursor, images.TRANSFORMS)
+
+            # Close cursor
+            await cursor.close()
+
+            return rows.RecordsResponse(mapper, order_summaries)
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
-
 
 @router.put('/vms/orders/{orderID}/toship')
 async def mark_to_ship(orderID: int):
-    conn = None
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
 
-        # validate order sttaus in VMS
-        await cursor.execute(
-            '''select orderStatus
-            from purchaseOrders
-            where orderID = ?''',
-            (orderID,)
-        )
-        order = await cursor.fetchone()
-        if not order or order[0] != 'Confirmed':
-            raise HTTPException(status_code=400, detail="order is not in 'Confirmed' status")
-        
-        # update to "To Ship" in VMS
-        await cursor.execute(
-            '''update purchaseOrders
-            set orderStatus = 'To Ship', 
-            statusDate = ?
-            where orderID = ?''',
-            (datetime.utcnow(), orderID)
-        )
-        await conn.commit()
-
-        # after updatimg VMS, also update IMS with the 'To Ship' status
-        ims_url = 'https://ims-wc58.onrender.com/receive-orders/ims/orders/ToShip'  
+            # validate order sttaus in VMS
+            await cursor.execute(
+                '''select orderStatus
+                from purchaseOrders
+                where orderID = ?''',
+                (orderID,)
+            )
+            order = await cursor.fetchone()
+            if not order or order[0] != 'Confirmed':
+                raise HTTPException(status_code=400, detail="order is not in 'Confirmed' status")
 
-        ims_payload = {
-            "orderID": orderID,
-            "orderStatus": "To Ship"
-        }
+            # update to "To Ship" in VMS
+            await cursor.execute(
+                '''update purchaseOrders
+                set orderStatus = 'To Ship', 
+                statusDate = ?
+                where orderID = ?''',
+                (datetime.utcnow(), orderID)
+            )
 
-        # make the API call to IMS to update the order status
-        async with httpx.AsyncClient() as client:
-            ims_response = await client.post(ims_url, json = ims_payload)
-            ims_response.raise_for_status()
-        
-        # log the ims response for debuggin
-        logging.info(f"IMS response: {ims_response.status_code} - {ims_response.text}")
+            # also queue the 'To Ship' status for IMS, committed with the update
+            ims_payload = {
+                "orderID": orderID,
+                "orderStatus": "To Ship"
+            }
+            await outbox.enqueue(cursor, orderID, "order.toship", "/receive-orders/ims/orders/ToShip", ims_payload)
+            await conn.commit()
+            outbox.notify()
 
-        return {'message': f"order {orderID} marked as 'To Ship' in VMS and updated in IMS."}
+            return {'message': f"order {orderID} marked as 'To Ship' in VMS and queued for IMS.", 'imsDelivery': 'queued'}
     
-    except httpx.HTTPStatusError as http_err:
-        logging.error(f"HTTP Error while communication with IMS: {http_err}")
-        raise HTTPException(status_code=500, detail=f'Error processing the update: {http_err.response.status_code} - {http_err.response.text}')
     except Exception as e: 
         logging.error(f"UNexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing the update: {e}")
-    finally:
-        if conn:
-            await conn.close()
-
-# Define the send_to_ims_api_with_retries function
-async def send_to_ims_api_with_retries(url, payload, retries=3, delay=2):
-    for attempt in range(retries):
-        try:
-            async with ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        return await response.json()
-        except Exception as e:
-            logging.error(f"Attempt {attempt + 1} failed: {e}")
-        await asyncio.sleep(delay)
-    raise HTTPException(status_code=500, detail="Failed to send data to IMS after multiple attempts.")
 
 @router.get("/toship/orders", response_model=List[OrderSummary])
+@database.read_only
 async def get_order_details():
-    conn = None
     try:
         # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  -- Include imagePath from the Products table
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'To Ship'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+
+            # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
+            query = """
+            SELECT 
+                po.orderID,  -- Include orderID
+                p.productName, 
+                p.size, 
+                p.category, 
+                pod.orderQuantity AS quantity,
+                (p.unitPrice * pod.orderQuantity) AS totalPrice,
+                c.customerName,
+                c.customerAddress AS warehouseAddress,
+                p.image_path  -- Include imagePath from the Products table
+            FROM 
+                purchaseOrderDetails pod
+            JOIN 
+                Products p ON pod.productID = p.productID
+            JOIN 
+                purchaseOrders po ON pod.orderID = po.orderID
+            JOIN 
+                Customers c ON po.customerID = c.customerID
+            WHERE
+                po.orderStatus = 'To Ship'  
+            """
+            await cursor.execute(query)
+            # Map rows straight to records; the query columns match OrderSummary
+            mapper, order_summaries = await rows.fetch_records(cursor, images.TRANSFORMS)
+
+            # Close cursor
+            await cursor.close()
+
+            return rows.RecordsResponse(mapper, order_summaries)
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
 
 @router.put('/vms/orders/{orderID}/Delivered')
 async def delivered_order(orderID: int):
-    conn = None
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
 
-        # Validate order status
-        await cursor.execute(
-            '''SELECT orderStatus
-               FROM purchaseOrders
-               WHERE orderID = ?''',
-            (orderID,)
-        )
-        order = await cursor.fetchone()
-        if not order or order[0] != 'To Ship':
-            raise HTTPException(status_code=400, detail="Order is not in 'To Ship' status.")
-
-        # Fetch products and order quantities
-        await cursor.execute(
-            '''SELECT pod.productID, pod.orderQuantity
-               FROM purchaseOrderDetails pod
-               WHERE pod.orderID = ?''',
-            (orderID,)
-        )
-        products = await cursor.fetchall()
-        if not products:
-            raise HTTPException(status_code=404, detail="No products found for this order.")
-
-        # Prepare the list of product variants to send to IMS
-        variant_data = []
-        for product in products:
-            product_id, order_quantity = product
-            order_quantity = int(order_quantity)
-
-            # Fetch only the required number of product variants (orderQuantity)
+            # Validate order status
             await cursor.execute(
-                '''SELECT TOP (?) pv.barcode, pv.productCode, p.productName, p.category, p.size
-                   FROM productVariants pv
-                   JOIN products p ON pv.productID = p.productID
-                   WHERE pv.productID = ? AND pv.isAvailable = 1
-                   ORDER BY pv.variantID ASC''',
-                (order_quantity, product_id)
+                '''SELECT orderStatus
+                   FROM purchaseOrders
+                   WHERE orderID = ?''',
+                (orderID,)
             )
-            variants = await cursor.fetchall()
-            logging.info(f"Available variants for productID {product_id}: {len(variants)}")
-
-            if len(variants) < order_quantity:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Not enough available variants for productID {product_id}. "
-                           f"Required: {order_quantity}, Available: {len(variants)}"
-                )
-
-            # Add the fetched variants to the variant_data list
-            variant_data.extend([{
-                "barcode": v[0],
-                "productCode": v[1],
-                "productName": v[2],
-                "category": v[3],
-                "size": v[4]
-            } for v in variants[:order_quantity]])
+            order = await cursor.fetchone()
+            if not order or order[0] != 'To Ship':
+                raise HTTPException(status_code=400, detail="Order is not in 'To Ship' status.")
 
-        # Deduct the currentStock for each product based on order quantity
-        for product in products:
-            product_id, order_quantity = product
-
-            # Fetch the current stock
+            # Fetch products and order quantities, one row per product: lines of the
+            # same product must not pick the same variants or deduct them twice
             await cursor.execute(
-                '''SELECT currentStock
-                   FROM products
-                   WHERE productID = ?''',
-                (product_id,)
+                '''SELECT pod.productID, SUM(pod.orderQuantity)
+                   FROM purchaseOrderDetails pod
+                   WHERE pod.orderID = ?
+                   GROUP BY pod.productID''',
+                (orderID,)
             )
-            current_stock_row = await cursor.fetchone()
-            if not current_stock_row:
-                raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found.")
-
-            current_stock = int(current_stock_row[0])
-
-            # Check if stock is sufficient
-            if current_stock < order_quantity:
+            products = await cursor.fetchall()
+            if not products:
+                raise HTTPException(status_code=404, detail="No products found for this order.")
+
+            # Prepare the list of product variants to send to IMS
+            variant_data = []
+            variant_ids = []
+            for product in products:
+                product_id, order_quantity = product
+                order_quantity = int(order_quantity)
+
+                # Fetch only the required number of product variants (orderQuantity)
+                await cursor.execute(
+                    '''SELECT TOP (?) pv.barcode, pv.productCode, p.productName, p.category, p.size, pv.variantID
+                       FROM productVariants pv
+                       JOIN products p ON pv.productID = p.productID
+                       WHERE pv.productID = ? AND pv.isAvailable = 1
+                       ORDER BY pv.variantID ASC''',
+                    (order_quantity, product_id)
+                )
+                variants = await cursor.fetchall()
+                logging.info(f"Available variants for productID {product_id}: {len(variants)}")
+
+                if len(variants) < order_quantity:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Not enough available variants for productID {product_id}. "
+                               f"Required: {order_quantity}, Available: {len(variants)}"
+                    )
+
+                # Add the fetched variants to the variant_data list
+                variant_data.extend([{
+                    "barcode": v[0],
+                    "productCode": v[1],
+                    "productName": v[2],
+                    "category": v[3],
+                    "size": v[4]
+                } for v in variants[:order_quantity]])
+                variant_ids.extend(v[5] for v in variants[:order_quantity])
+
+            # Mark the selected variants unavailable, set-based. The SELECTs above take
+            # no locks: a concurrent delivery may have flipped some of them since, and
+            # then this one must not ship (or count) them again.
+            flipped = 0
+            for start in range(0, len(variant_ids), DELIVERY_FLIP_BATCH):
+                chunk = variant_ids[start:start + DELIVERY_FLIP_BATCH]
+                await cursor.execute(
+                    f'''UPDATE productVariants
+                       SET isAvailable = 0, updatedAt = SYSUTCDATETIME()
+                       WHERE isAvailable = 1 AND variantID IN ({", ".join("?" * len(chunk))})''',
+                    chunk
+                )
+                flipped += cursor.rowcount
+            if flipped != len(variant_ids):
+                await conn.rollback()
                 raise HTTPException(
-                    status_code=400,
-                    detail=f"Not enough stock for productID {product_id}. "
-                           f"Required: {order_quantity}, Available: {current_stock}"
+                    status_code=409,
+                    detail=f"{len(variant_ids) - flipped} of the selected variants were taken by a concurrent "
+                           f"delivery; retry the delivery."
+                )
+
+            # Deduct the delivered quantity from each product's stock and available
+            # count in one relative UPDATE; a product without enough stock matches no row
+            for product_id, order_quantity in products:
+                order_quantity = int(order_quantity)
+                await cursor.execute(
+                    '''UPDATE products
+                       SET currentStock = currentStock - ?, availableQuantity = availableQuantity - ?,
+                           updatedAt = SYSUTCDATETIME()
+                       WHERE productID = ? AND currentStock >= ?''',
+                    (order_quantity, order_quantity, product_id, order_quantity)
                 )
+                if cursor.rowcount == 0:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Not enough stock for productID {product_id}. Required: {order_quantity}"
+                    )
 
-            # Deduct stock
-            new_stock = current_stock - order_quantity
+            # Update order status to 'Delivered'
             await cursor.execute(
-                '''UPDATE products
-                   SET currentStock = ?
-                   WHERE productID = ?''',
-                (new_stock, product_id)
+                '''UPDATE purchaseOrders
+                   SET orderStatus = 'Delivered', statusDate = ?
+                   WHERE orderID = ?''',
+                (datetime.utcnow(), orderID)
             )
 
-        # Mark selected variants as unavailable
-        await cursor.executemany(
-            '''UPDATE productVariants
-               SET isAvailable = 0
-               WHERE barcode = ?''',
-            [(variant['barcode'],) for variant in variant_data]
-        )
-
-        # Send the prepared variants to IMS
-        ims_api_url = 'https://ims-wc58.onrender.com/receive-orders/ims/variants/receive'
-        payload = {
-            'orderID': orderID,
-            'orderStatus': 'Delivered',
-            'variants': variant_data
-        }
-        logging.info(f"Sending payload to IMS: {payload}")
-        ims_response = await send_to_ims_api_with_retries(ims_api_url, payload)
-
-        if ims_response.get('status') != 'success':
-            raise HTTPException(status_code=500, detail="Failed to send order data to IMS.")
-
-        # Update order status to 'Delivered'
-        await cursor.execute(
-            '''UPDATE purchaseOrders
-               SET orderStatus = 'Delivered', statusDate = ?
-               WHERE orderID = ?''',
-            (datetime.utcnow(), orderID)
-        )
-
-        # Commit the changes
-        await conn.commit()
-
-        logging.info(f"Sending payload to IMS: {json.dumps(payload, indent=4)}")
-        return {
-            'message': f"Order {orderID} marked as 'Delivered' and variants sent to IMS successfully.",
-            'imsResponse': ims_response
-        }
-
+            # Queue the delivered variants for IMS and commit everything together
+            payload = {
+                'orderID': orderID,
+                'orderStatus': 'Delivered',
+                'variants': variant_data
+            }
+            await outbox.enqueue(cursor, orderID, "order.delivered", '/receive-orders/ims/variants/receive', payload)
+            await conn.commit()
+            outbox.notify()
+            catalog.invalidate(*{variant['category'] for variant in variant_data})
+
+            logging.info(f"Order {orderID} delivered; {len(variant_data)} variants queued for IMS")
+            return {
+                'message': f"Order {orderID} marked as 'Delivered' and variants queued for IMS.",
+                'imsDelivery': 'queued'
+            }
+
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error delivering order: {e}")
         raise HTTPException(status_code=500, detail=f"Error delivering order: {e}")
-    finally:
-        if conn:
-            await conn.close()
 
+# Label sheet for an order: per order line, the variants delivery would pick
+# (the first orderQuantity available ones). Delivered orders are not linked to
+# the variants that shipped, so their sheets cannot be rebuilt.
+@router.get('/vms/orders/{orderID}/labels.{fmt}')
+@database.read_only
+async def get_order_labels(orderID: int, fmt: str, page: Optional[int] = Query(None, ge=1)):
+    if fmt not in labels.SHEET_FORMATS:
+        raise HTTPException(status_code=404, detail="Label sheets are available as .pdf or .png")
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute("SELECT orderStatus FROM purchaseOrders WHERE orderID = ?", (orderID,))
+        order = await cursor.fetchone()
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found.")
+        if order[0] in ('Delivered', 'Completed'):
+            raise HTTPException(status_code=409, detail=f"Order {orderID} is already {order[0]}.")
 
-async def send_to_ims_api_with_retries(url, payload, retries=3, delay=2):
-    for attempt in range(retries):
-        try:
-            logging.info(f"Attempt {attempt + 1} to send payload to IMS: {json.dumps(payload)}")
-            async with ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    response_body = await response.text()
-                    logging.info(f"IMS response (status: {response.status}): {response_body}")
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        logging.error(f"IMS API returned non-200 status: {response.status}")
-        except Exception as e:
-            logging.error(f"Attempt {attempt + 1} failed: {e}")
-        await asyncio.sleep(delay)
-    raise HTTPException(status_code=500, detail="Failed to send data to IMS after multiple attempts.")
+        await cursor.execute(
+            '''SELECT productID, orderQuantity
+               FROM purchaseOrderDetails
+               WHERE orderID = ?''',
+            (orderID,)
+        )
+        codes = []
+        for product_id, order_quantity in await cursor.fetchall():
+            await cursor.execute(
+                '''SELECT TOP (?) barcode FROM productVariants
+                   WHERE productID = ? AND isAvailable = 1
+                   ORDER BY variantID ASC''',
+                (min(int(order_quantity), labels.LABEL_SHEET_MAX + 1), product_id)
+            )
+            codes.extend(row[0] for row in await cursor.fetchall())
+    return await labels.sheet_response(codes, fmt, page, f"order-{orderID}-labels")
 
 @router.get('/vms/orders/delivered')
+@database.read_only
 async def get_order_details():
-    conn = None
     try:
         # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'Delivered'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+
+            # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
+            query = """
+            SELECT 
+                po.orderID,  -- Include orderID
+                p.productName, 
+                p.size, 
+                p.category, 
+                pod.orderQuantity AS quantity,
+                (p.unitPrice * pod.orderQuantity) AS totalPrice,
+                c.customerName,
+                c.customerAddress AS warehouseAddress,
+                p.image_path  
+            FROM 
+                purchaseOrderDetails pod
+            JOIN 
+                Products p ON pod.productID = p.productID
+            JOIN 
+                purchaseOrders po ON pod.orderID = po.orderID
+            JOIN 
+                Customers c ON po.customerID = c.customerID
+            WHERE
+                po.orderStatus = 'Delivered'  
+            """
+            await cursor.execute(query)
+            # Map rows straight to records; the query columns match OrderSummary
+            mapper, order_summaries = await rows.fetch_records(cursor, images.TRANSFORMS)
+
+            # Close cursor
+            await cursor.close()
+
+            return rows.RecordsResponse(mapper, order_summaries)
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
 
 #Completed
 @router.get('/vms/orders/Completed')
+@database.read_only
 async def get_order_details():
-    conn = None
     try:
         # Establish database connection
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
-
-        # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
-        query = """
-        SELECT 
-            po.orderID,  -- Include orderID
-            p.productName, 
-            p.size, 
-            p.category, 
-            pod.orderQuantity AS quantity,
-            (p.unitPrice * pod.orderQuantity) AS totalPrice,
-            c.customerName,
-            c.customerAddress AS warehouseAddress,
-            p.image_path  -- Include imagePath from the Products table
-        FROM 
-            purchaseOrderDetails pod
-        JOIN 
-            Products p ON pod.productID = p.productID
-        JOIN 
-            purchaseOrders po ON pod.orderID = po.orderID
-        JOIN 
-            Customers c ON po.customerID = c.customerID
-        WHERE
-            po.orderStatus = 'Received'  
-        """
-        await cursor.execute(query)
-        results = await cursor.fetchall()
-
-        # Format results into response model
-        order_summaries = [
-            OrderSummary(
-                orderID=row[0],  # Map orderID
-                productName=row[1],
-                size=row[2],
-                category=row[3],
-                quantity=row[4],
-                totalPrice=row[5],
-                customerName=row[6],
-                warehouseAddress=row[7],
-                image_path=row[8]  # Map imagePath
-            )
-            for row in results
-        ]
-
-        # Close cursor and connection
-        await cursor.close()
-        await conn.close()
-
-        return order_summaries
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+
+            # Query to fetch required fields, including TotalPrice, CustomerName, WarehouseAddress, and ImagePath
+            query = """
+            SELECT 
+                po.orderID,  -- Include orderID
+                p.productName, 
+                p.size, 
+                p.category, 
+                pod.orderQuantity AS quantity,
+                (p.unitPrice * pod.orderQuantity) AS totalPrice,
+                c.customerName,
+                c.customerAddress AS warehouseAddress,
+                p.image_path  -- Include imagePath from the Products table
+            FROM 
+                purchaseOrderDetails pod
+            JOIN 
+                Products p ON pod.productID = p.productID
+            JOIN 
+                purchaseOrders po ON pod.orderID = po.orderID
+            JOIN 
+                Customers c ON po.customerID = c.customerID
+            WHERE
+                po.orderStatus = 'Received'  
+            """
+            await cursor.execute(query)
+            # Map rows straight to records; the query columns match OrderSummary
+            mapper, order_summaries = await rows.fetch_records(cursor, images.TRANSFORMS)
+
+            # Close cursor
+            await cursor.close()
+
+            return rows.RecordsResponse(mapper, order_summaries)
 
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching order details: {str(e)}")
-    finally:
-        if conn:
-            await conn.close()
 
 @router.post('/vms/orders/update-status')
 async def update_order_status(order_update: OrderUpdate):
     order_id = order_update.orderID
     order_status = order_update.orderStatus
-    conn = None
 
     try:
-        conn = await database.get_db_connection()
-        cursor = await conn.cursor()
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
 
-        # validate order existence in VMS
-        await cursor.execute(
-            '''select orderStatus 
-            from purchaseOrders 
-            where orderID = ?''',
-            (order_id,)
-        )
-        existing_order = await cursor.fetchone()
+            # validate order existence in VMS
+            await cursor.execute(
+                '''select orderStatus 
+                from purchaseOrders 
+                where orderID = ?''',
+                (order_id,)
+            )
+            existing_order = await cursor.fetchone()
 
-        if not existing_order:
-            raise HTTPException(status_code=404, detail="Order not found.")
-        
-        # log the current status for debugging
-        logging.info(f"Current order status: {existing_order[0]}")
-
-        # check if the status update is valid
-        if existing_order[0] == order_status:
-            return {"message": "Order status is already up-to-date."}
-        
-        # update the order status
-        await cursor.execute(
-            '''
-            update purchaseOrders
-            set orderStatus = ?, statusDate = getdate()
-            where orderID = ?''',
-            (order_status, order_id)
-        )
-        await conn.commit()
+            if not existing_order:
+                raise HTTPException(status_code=404, detail="Order not found.")
+
+            # log the current status for debugging
+            logging.info(f"Current order status: {existing_order[0]}")
+
+            # check if the status update is valid
+            if existing_order[0] == order_status:
+                return {"message": "Order status is already up-to-date."}
+
+            # update the order status
+            await cursor.execute(
+                '''
+                update purchaseOrders
+                set orderStatus = ?, statusDate = getdate()
+                where orderID = ?''',
+                (order_status, order_id)
+            )
+            await conn.commit()
 
-        logging.info(f"Order {order_id} status updated to {order_status}")
-        return {"message": f"Order {order_id} status updated to {order_status}"}
+            logging.info(f"Order {order_id} status updated to {order_status}")
+            return {"message": f"Order {order_id} status updated to {order_status}"}
     
     except Exception as e:
         logging.error(f"Error updating order status: {e}")
         raise HTTPException(status_code=500, detail="Failed to update order status.")
-    finally:
-        if conn:
-            await conn.close()
\ No newline at end of file
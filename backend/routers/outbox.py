@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from routers.auth import get_current_user
+from typing import Optional
+import database
+import outbox
+import rows
+
+# Admin view of the IMS outbox: what is queued, what failed and why
+router = APIRouter(dependencies=[Depends(get_current_user)])
+
+
+@router.get("/")
+async def outbox_summary():
+    try:
+        return await outbox.summary()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading the IMS outbox: {e}")
+
+
+@router.get("/events")
+@database.read_only
+async def list_outbox_events(
+    status: str = Query("failed", pattern="^(pending|failed|sent)$"),
+    orderID: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    try:
+        query = '''SELECT TOP (?) eventID, orderID, eventType, endpoint, status, attempts,
+                          nextAttemptAt, lockedUntil, lastError, createdAt, sentAt
+                   FROM ImsOutbox
+                   WHERE status = ?'''
+        params = [limit, status]
+        if orderID is not None:
+            query += " AND orderID = ?"
+            params.append(orderID)
+        query += " ORDER BY eventID"
+
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute(query, params)
+            mapper, records = await rows.fetch_records(cursor)
+        return rows.RecordsResponse(mapper, records)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading the IMS outbox: {e}")
+
+
+@router.post("/events/{event_id}/retry")
+async def retry_outbox_event(event_id: int):
+    try:
+        retried = await outbox.retry(event_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrying outbox event: {e}")
+    if not retried:
+        raise HTTPException(status_code=404, detail="No failed outbox event with that ID")
+    return {"message": f"Outbox event {event_id} queued for another delivery attempt"}
@@ -1,53 +1,38 @@
-from fastapi import File, UploadFile, HTTPException, APIRouter, Depends
+from fastapi import File, UploadFile, HTTPException, APIRouter, Depends, Query, Request, Response
 from pydantic import BaseModel
+import catalog
+import catalog_bulk
+import catalog_import
+import codes
 import database
-import random
-import string
+import export
+import groups
+import images
+import inventory
+import labels
+import pagination
+import rows
+import search
+import variants
 import os
-import base64
+from datetime import datetime
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from typing import Optional
 from routers.auth import get_current_user
 
 # Directory for saving uploaded images
-UPLOAD_DIRECTORY = "images_upload"
+UPLOAD_DIRECTORY = images.IMAGE_DIR
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
-# Function to generate a unique filename for images
-def generate_image_filename():
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=16)) + ".png"
-
-# Function to decode Base64 image and save to file
-def save_base64_image(base64_image: str) -> str:
+# Store an image (multipart upload or Base64 string) under its content hash
+# with its renditions (see images.py); returns the stored image description
+async def save_image(ingest, source) -> dict:
     try:
-        # Decode the Base64 string (ignore the data URI prefix if present)
-        if "," in base64_image:
-            base64_image = base64_image.split(",")[1]
-
-        # Fix padding if it's incorrect
-        missing_padding = len(base64_image) % 4
-        if missing_padding:
-            base64_image += "=" * (4 - missing_padding)
-
-        image_data = base64.b64decode(base64_image)
-        filename = generate_image_filename()
-        filepath = os.path.join(UPLOAD_DIRECTORY, filename)
-        with open(filepath, "wb") as file:
-            file.write(image_data)
-        return filepath
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid Base64 image: {str(e)}")
-
-# function to generate barcode
-def generate_barcode():
-    characters = string.ascii_uppercase + string.digits
-    barcode = ''.join(random.choices(characters, k=13))
-    return barcode
-
-# function to generate sku
-def generate_sku():
-    characters = string.ascii_uppercase + string.digits
-    sku = ''.join(random.choices(characters, k=8))
-    return sku
+        return await ingest(source)
+    except images.ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except images.InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 router = APIRouter()
 
@@ -63,10 +48,11 @@ class Product(BaseModel):
 
 # Pydantic model for adding quantities to an existing product
 class AddQuantity(BaseModel):
-    productName: str
+    productName: Optional[str] = None
     size: str
-    category: str
+    category: Optional[str] = None
     quantity: int
+    productGroupID: Optional[int] = None  # instead of productName and category
 
 class ProductVariant(BaseModel):
     productName: str
@@ -104,6 +90,36 @@ class ADDSIZE(BaseModel):
     image_path: str 
 
 
+# Bulk catalog mutations (see catalog_bulk.py)
+class BulkFilter(BaseModel):
+    productIDs: Optional[list[int]] = None
+    productGroupIDs: Optional[list[int]] = None
+    productName: Optional[str] = None
+    category: Optional[str] = None
+    size: Optional[str] = None
+    minPrice: Optional[float] = None
+    maxPrice: Optional[float] = None
+    isActive: Optional[bool] = True  # null matches active and inactive rows
+    all: bool = False  # required to match the whole catalog
+
+class BulkChanges(BaseModel):
+    unitPrice: Optional[float] = None
+    pricePercent: Optional[float] = None  # e.g. -20 for 20% off, rounded to cents
+    category: Optional[str] = None
+    productDescription: Optional[str] = None
+    isActive: Optional[bool] = None
+
+class BulkOperation(BaseModel):
+    filter: Optional[BulkFilter] = None
+    set: Optional[BulkChanges] = None
+    variantIDs: Optional[list[int]] = None  # mark these variants unavailable instead
+    expect: Optional[int] = None  # fail unless exactly this many rows are affected
+
+class BulkRequest(BaseModel):
+    operations: list[BulkOperation]
+    preview: bool = False
+
+
 # class Product(BaseModel):
 #     productName: str
 #     productDescription: str
@@ -113,196 +129,160 @@ class ADDSIZE(BaseModel):
 
 @router.post('/products')
 async def add_product(product: Product):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        # Save the Base64 image to file and get the path
-        image_path = save_base64_image(product.image)
-
-        # Check if the product already exists
-        await cursor.execute(''' 
-            SELECT productID, productName, productDescription, size, category, unitPrice
-            FROM Products
-            WHERE productName = ? AND isActive = 1
-        ''', (product.productName,))
-        existing_product = await cursor.fetchone()
-
-        if existing_product:
-            # Compare fields of existing product
-            if (existing_product[1] == product.productName and 
-                existing_product[2] == product.productDescription and
-                existing_product[3] == product.size and
-                existing_product[5] == product.category and
-                existing_product[6] == product.unitPrice 
-            ):
+    # Store the Base64 image before taking a connection; processing it can take a while
+    image_path = (await save_image(images.ingest_base64, product.image))["image_path"]
+    # reserve the variants' codes before the transaction takes any locks
+    reserved = await codes.prefetch(product.quantity)
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            # Check if the product already exists in this size (a seek on ix_Products_group_size)
+            in_group, group = groups.group_filter(None, product.productName, product.category)
+            of_size, size = groups.size_filter(product.size)
+            await cursor.execute(f''' 
+                SELECT productID
+                FROM Products
+                WHERE {in_group} AND {of_size} AND isActive = 1
+                AND productDescription = ? AND ROUND(unitPrice * 100, 0) = ?
+            ''', (*group, *size, product.productDescription, groups.cents(product.unitPrice)))
+            existing_product = await cursor.fetchone()
+
+            if existing_product:
                 return {'message': f'Product "{product.productName}" already exists. Add more quantity if needed.'}
 
-        # Insert new product into Products table
-        await cursor.execute('''
-            INSERT INTO Products (
-                productName, productDescription, size, category, 
-                unitPrice, image_path, currentStock, isActive
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, 1)
-        ''', (product.productName, product.productDescription, product.size, 
-              product.category, product.unitPrice, image_path, product.quantity))
-        await conn.commit()
-
-        # Retrieve the last inserted productID using @@IDENTITY
-        await cursor.execute('SELECT @@IDENTITY')
-        product_id_row = await cursor.fetchone()
-
-        # Debugging: Log the result of @@IDENTITY
-        print(f"@@IDENTITY result: {product_id_row}")
-
-        product_id = product_id_row[0] if product_id_row else None
-
-        if not product_id:
-            raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion.')
-
-        # Insert product variants
-        variants_data = [
-            (generate_barcode(), generate_sku(), product_id) for _ in range(product.quantity)
-        ]
-        await cursor.executemany('''
-            INSERT INTO ProductVariants (barcode, productCode, productID)
-            VALUES (?, ?, ?)
-        ''', variants_data)
-        await conn.commit()
-
-        return {'message': f'Product "{product.productName}" added with {product.quantity} variants.'}
-    
+            group_id = await groups.ensure(cursor, product.productName, product.category)
+
+            # Insert new product into Products table
+            await cursor.execute('''
+                INSERT INTO Products (
+                    productName, productDescription, size, category, 
+                    unitPrice, image_path, currentStock, isActive, updatedAt,
+                    productGroupID, sizeKey
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, 1, SYSUTCDATETIME(), ?, ?)
+            ''', (product.productName, product.productDescription, product.size, 
+                  product.category, product.unitPrice, image_path, product.quantity,
+                  group_id, groups.size_key(product.size)))
+
+            # Retrieve the last inserted productID using @@IDENTITY
+            await cursor.execute('SELECT @@IDENTITY')
+            product_id_row = await cursor.fetchone()
+
+            product_id = product_id_row[0] if product_id_row else None
+
+            if not product_id:
+                raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion.')
+
+            # Insert product variants; the product, its variants and its available count commit together
+            await variants.create_variants(cursor, product_id, product.quantity, reserved=reserved)
+            await conn.commit()
+            catalog.invalidate(product.category)
+            search.changed()
+
+            return {'message': f'Product "{product.productName}" added with {product.quantity} variants.',
+                    'productID': product_id, 'productGroupID': group_id}
+
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
+
+# Bulk import of products x sizes x quantities from a CSV or XLSX file (see
+# catalog_import.py). Rejected rows are listed with their line numbers and
+# nothing is written (422); dry_run reports what each row would change.
+@router.post('/import')
+async def import_products(file: UploadFile = File(...), dry_run: bool = False, format: Optional[str] = None):
+    try:
+        job = catalog_import.CatalogImport(file.file, format or catalog_import.format_of(file.filename), dry_run)
+        report = await job.run()
+    except catalog_import.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        await conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        await conn.close()
+    return JSONResponse(report, status_code=422 if report["rejected"] and not dry_run else 200)
 
-# Get all Women's products
-@router.get("/products/Womens-Leather-Shoes")
-async def get_womens_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
+# Reprice, recategorize, redescribe, deactivate or reactivate many products
+# (and mark many variants unavailable) in one transaction, one set-based
+# statement per operation; preview reports the changes and rolls them back
+@router.post('/bulk')
+async def bulk_update_products(request: BulkRequest):
     try:
-        await cursor.execute(
-            '''SELECT p.productName, p.productDescription, p.category,
-                p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
-            FROM products AS p
-            LEFT JOIN ProductVariants AS pv
-            ON p.productID = pv.productID
-            WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'Women''s Leather Shoes'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
-            '''
-        )
-        
-        products = await cursor.fetchall()
-        # Map column names to row values
-        # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+        return await catalog_bulk.apply(request.operations, request.preview)
+    except catalog_bulk.BulkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except catalog_bulk.BulkConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+# Storefront listing of one category, served from the in-memory snapshot
+# (see catalog.py). `category` is a category name or one of the URL slugs in
+# catalog.CATEGORY_SLUGS, anything else is a 404; clients holding the current
+# ETag get a 304.
+@router.get("/category/{category}")
+async def get_category_products(category: str, request: Request):
+    listed = catalog.listed(category)
+    if listed is None:
+        raise HTTPException(status_code=404, detail=f"Unknown category: {category}")
+    try:
+        snapshot = await catalog.get(listed)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": snapshot.etag}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+# Full variant inventory as NDJSON or CSV, streamed in constant memory (see
+# export.py). X-Export-Watermark is the updatedSince for the next incremental pull.
+@router.get("/export")
+async def export_variants(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    category: Optional[str] = None,
+    available: Optional[bool] = None,
+    updatedSince: Optional[datetime] = None,
+):
+    job = export.Export(format, category, available, updatedSince, compress=gzip)
+    headers = {
+        "Content-Disposition": f'attachment; filename="{job.filename}"',
+        "X-Export-Watermark": job.watermark.isoformat(),
+    }
+    return StreamingResponse(job.chunks(), media_type=job.media_type, headers=headers)
+
+# Ranked product search over name, description, category and size, answered
+# from the in-process index (see search.py)
+@router.get("/search")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=search.SEARCH_LIMIT_MAX),
+    category: Optional[str] = None,
+):
+    try:
+        return search.search(q, limit, catalog.resolve(category) if category else None)
+    except search.SearchIndexNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+# Get all Women's products
+@router.get("/products/Womens-Leather-Shoes")
+async def get_womens_products(request: Request):
+    return await get_category_products("Women's Leather Shoes", request)
 
 # get all Mens products
 @router.get("/products/mens-Leather-Shoes")
-async def get_mens_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute(
-            '''SELECT p.productName, p.productDescription, p.category,
-                p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
-            FROM products AS p
-            LEFT JOIN ProductVariants AS pv
-            ON p.productID = pv.productID
-            WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'Men''s Leather Shoes'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
-            '''
-        )
-        
-        products = await cursor.fetchall()
-        # Map column names to row values
-        # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+async def get_mens_products(request: Request):
+    return await get_category_products("Men's Leather Shoes", request)
 
 # get all girls products
 @router.get("/products/girls-Leather-Shoes")
-async def get_girls_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute(
-            '''SELECT p.productName, p.productDescription, p.category,
-                p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
-            FROM products AS p
-            LEFT JOIN ProductVariants AS pv
-            ON p.productID = pv.productID
-            WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'Girl''s Leather Shoes'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
-            '''
-        )
-        
-        products = await cursor.fetchall()
-        # Map column names to row values
-        # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+async def get_girls_products(request: Request):
+    return await get_category_products("Girl's Leather Shoes", request)
 
 # get all boys products
 @router.get("/products/boys-Leather-Shoes")
-async def get_boys_products():
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        await cursor.execute(
-            '''SELECT p.productName, p.productDescription, p.category,
-                p.size, p.unitPrice, CAST(p.image_path AS varchar(max)),
-                COUNT(pv.variantID) AS 'available quantity', p.currentStock
-            FROM products AS p
-            LEFT JOIN ProductVariants AS pv
-            ON p.productID = pv.productID
-            WHERE p.isActive = 1 AND pv.isAvailable = 1  AND p.category = 'Boy''s Leather Shoes'
-            GROUP BY p.productName, p.productDescription, p.category, p.size, p.unitPrice, p.currentStock, CAST(p.image_path AS varchar(max))
-            '''
-        )
-        
-        products = await cursor.fetchall()
-        # Map column names to row values
-        # Ensure the image path uses forward slashes
-        return [
-            {
-                **dict(zip([column[0] for column in cursor.description], row)),
-                'image_path': row[5].replace("\\", "/") if row[5] else "placeholder.png"
-            }
-            for row in products
-        ]
-    finally:
-        await conn.close()
+async def get_boys_products(request: Request):
+    return await get_category_products("Boy's Leather Shoes", request)
 
+# sizes and size variants stay on the primary: the edit form re-reads them
+# right after adding or soft-deleting a size
 @router.get('/products/sizes')
 async def get_size(
     productName: str, 
@@ -310,170 +290,169 @@ async def get_size(
     category: str, 
     productDescription: Optional[str] = None
 ):
-    conn = await database.get_db_connection()
-    try:
-        async with conn.cursor() as cursor:
-            # SQL query to fetch sizes
-            await cursor.execute(''' 
-                SELECT size, currentStock 
-                FROM Products 
-                WHERE productName = ? 
-                AND unitPrice = ? 
-                AND category = ?
-                AND (productDescription = ? OR ? IS NULL)
-                AND currentStock >= 1  
-                AND isActive = 1
-
-            ''', (productName, unitPrice, category, productDescription, productDescription))
-            
-            products = await cursor.fetchall()
-
-            if not products:
-                raise HTTPException(status_code=404, detail="Product sizes not found")
-
-            # Map the query results to the expected format
-            size_list = [{"size": product[0], "currentStock": product[1]} for product in products]
-            return {"size": size_list}  
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
+    async with database.connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                # SQL query to fetch sizes: the group's rows from ix_Products_group_size
+                in_group, group = groups.group_filter(None, productName, category)
+                await cursor.execute(f''' 
+                    SELECT size, currentStock, productGroupID
+                    FROM Products 
+                    WHERE {in_group}
+                    AND isActive = 1
+                    AND ROUND(unitPrice * 100, 0) = ?
+                    AND (productDescription = ? OR ? IS NULL)
+                    AND currentStock >= 1  
+                ''', (*group, groups.cents(unitPrice), productDescription, productDescription))
+
+                products = await cursor.fetchall()
+
+                if not products:
+                    raise HTTPException(status_code=404, detail="Product sizes not found")
+
+                # Map the query results to the expected format
+                size_list = [{"size": product[0], "currentStock": product[1]} for product in products]
+                # rows not backfilled yet have no group
+                return {"size": size_list, "productGroupID": next((p[2] for p in products if p[2] is not None), None)}
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.get('/products/size_variants', response_model=list[ProductVariantResponse])
 async def get_size_variants(productName: str, unitPrice: float, category: str, productDescription: Optional[str] = None):
-    conn = await database.get_db_connection()
-    #cursor = await conn.cursor()
+    async with database.connection() as conn:
+        #cursor = await conn.cursor()
 
-    try:
-     async with conn.cursor() as cursor:
+        try:
+         async with conn.cursor() as cursor:
 
-        await cursor.execute(
-            '''SELECT p.size, pv.productCode, pv.barcode
-                FROM
-                    Products AS p
-                INNER JOIN
-                    ProductVariants AS pv
-                ON
-                    p.productID = pv.productID
-                WHERE
-                    p.isActive = 1
-                    AND pv.isAvailable = 1
-                    AND p.productName = ?
-                    AND (p.productDescription = ? OR ? IS NULL)
-                    AND p.unitPrice = ?
-                    AND p.category = ?;  
-            ''', (productName, productDescription, productDescription, unitPrice, category))
-        variants = await cursor.fetchall()
-
-        if variants:
-            variant_list = [
-                {
-                    "size": variant[0],
-                    "productCode": variant[1],
-                    "barcode": variant[2]
-                }
-                for variant in variants
-            ]
-            return variant_list
-        else:
-            raise HTTPException(status_code=404, detail="Product not found.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:    
-        await conn.close()
+            in_group, group = groups.group_filter(None, productName, category, alias="p.")
+            await cursor.execute(
+                f'''SELECT p.size, pv.productCode, pv.barcode
+                    FROM
+                        Products AS p
+                    INNER JOIN
+                        ProductVariants AS pv
+                    ON
+                        p.productID = pv.productID
+                    WHERE
+                        {in_group}
+                        AND p.isActive = 1
+                        AND pv.isAvailable = 1
+                        AND (p.productDescription = ? OR ? IS NULL)
+                        AND ROUND(p.unitPrice * 100, 0) = ?;  
+                ''', (*group, productDescription, productDescription, groups.cents(unitPrice)))
+            variants = await cursor.fetchall()
+
+            if variants:
+                variant_list = [
+                    {
+                        "size": variant[0],
+                        "productCode": variant[1],
+                        "barcode": variant[2]
+                    }
+                    for variant in variants
+                ]
+                return variant_list
+            else:
+                raise HTTPException(status_code=404, detail="Product not found.")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 #add size
 @router.post('/products_AddSize')
 async def add_product(product: ADDSIZE):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        # Step 1: Retrieve the existing image_path based on product name and description
-        await cursor.execute('''SELECT image_path 
-                                FROM Products 
-                                WHERE productName = ? 
-                                      AND productDescription = ? 
-                                      AND isActive = 1''',
-                             (product.productName, product.productDescription))
-
-        existing_product = await cursor.fetchone()
-        
-        if existing_product:
-            image_path = existing_product[0]  # Use the existing image path
-        else:
-            raise HTTPException(status_code=404, detail="Original product not found. Cannot add new size.")
-
-        # Step 2: Check if the same product (name, description, and size) already exists
-        await cursor.execute('''SELECT 1
-                                FROM Products
-                                WHERE productName = ? 
-                                      AND productDescription = ? 
-                                      AND size = ? 
-                                      AND isActive = 1''',
-                             (product.productName, product.productDescription, product.size))
-
-        existing_size = await cursor.fetchone()
-
-        if existing_size:
-            raise HTTPException(status_code=400, 
-                                detail=f"A product with name '{product.productName}', description '{product.productDescription}', "
-                                       f"and size '{product.size}' already exists and is active.")
-
-        # Step 3: Insert the new product size, keeping the existing image_path
-        await cursor.execute('''INSERT INTO Products (
-                                    productName, productDescription, size, category,  
-                                    unitPrice, currentStock, image_path)
-                                VALUES (?, ?, ?, ?, ?, ?, ?);''',
-                             (product.productName,
-                              product.productDescription,
-                              product.size,
-                              product.category,
-                              float(product.unitPrice),  
-                              product.quantity,  # Using 'quantity' for 'currentStock'
-                              image_path))  # Reusing the existing image path
-
-        await conn.commit()
-
-        # Step 4: Retrieve the last inserted productID using SQL Server's TOP 1 with ORDER BY
-        await cursor.execute('''SELECT TOP 1 productID 
-                                FROM Products 
-                                ORDER BY productID DESC''')
-        product_id_row = await cursor.fetchone()
-        product_id = product_id_row[0] if product_id_row else None
-
-        if not product_id:
-            raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion')
-
-        # Step 5: Insert multiple variants into the productVariants table based on 'quantity'
-        variants_data = [
-            (generate_barcode(), generate_sku(), product_id)
-            for _ in range(product.quantity)  # Creating variants based on quantity
-        ]
-        
-        await cursor.executemany('''INSERT INTO ProductVariants (barcode, productCode, productID)
-                                    VALUES (?, ?, ?);''', variants_data)
-        await conn.commit()
+    # reserve the variants' codes before the transaction takes any locks
+    reserved = await codes.prefetch(product.quantity)
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            # Step 1: Retrieve the existing image_path and group from the product's other sizes
+            in_group, group = groups.group_filter(None, product.productName, product.category)
+            await cursor.execute(f'''SELECT TOP 1 image_path, productGroupID
+                                    FROM Products 
+                                    WHERE {in_group}
+                                          AND isActive = 1
+                                          AND productDescription = ?''',
+                                 (*group, product.productDescription))
+
+            existing_product = await cursor.fetchone()
+
+            if existing_product:
+                image_path, group_id = existing_product  # Use the existing image path
+            else:
+                raise HTTPException(status_code=404, detail="Original product not found. Cannot add new size.")
+            if group_id is None:
+                # the other sizes are not backfilled yet
+                group_id = await groups.ensure(cursor, product.productName, product.category)
+
+            # Step 2: Check if the same product (name, description, and size) already exists
+            in_group, group = groups.group_filter(group_id)
+            of_size, size = groups.size_filter(product.size)
+            await cursor.execute(f'''SELECT 1
+                                    FROM Products
+                                    WHERE {in_group} 
+                                          AND {of_size} 
+                                          AND isActive = 1
+                                          AND productDescription = ?''',
+                                 (*group, *size, product.productDescription))
+
+            existing_size = await cursor.fetchone()
+
+            if existing_size:
+                raise HTTPException(status_code=400, 
+                                    detail=f"A product with name '{product.productName}', description '{product.productDescription}', "
+                                           f"and size '{product.size}' already exists and is active.")
+
+            # Step 3: Insert the new product size, keeping the existing image_path
+            await cursor.execute('''INSERT INTO Products (
+                                        productName, productDescription, size, category,  
+                                        unitPrice, currentStock, image_path, updatedAt,
+                                        productGroupID, sizeKey)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, SYSUTCDATETIME(), ?, ?);''',
+                                 (product.productName,
+                                  product.productDescription,
+                                  product.size,
+                                  product.category,
+                                  float(product.unitPrice),  
+                                  product.quantity,  # Using 'quantity' for 'currentStock'
+                                  image_path,  # Reusing the existing image path
+                                  group_id,
+                                  groups.size_key(product.size)))
+
+            # Step 4: Retrieve the last inserted productID using SQL Server's TOP 1 with ORDER BY
+            await cursor.execute('''SELECT TOP 1 productID 
+                                    FROM Products 
+                                    ORDER BY productID DESC''')
+            product_id_row = await cursor.fetchone()
+            product_id = product_id_row[0] if product_id_row else None
+
+            if not product_id:
+                raise HTTPException(status_code=500, detail='Failed to retrieve productID after insertion')
+
+            # Step 5: Insert multiple variants into the productVariants table based on 'quantity'
+            await variants.create_variants(cursor, product_id, product.quantity, reserved=reserved)
+            await conn.commit()
+            catalog.invalidate(product.category)
+            search.changed()
+
+            # Step 6: Return product size, quantity, and image_path in response
+            return {
+                "productID": product_id,
+                "productGroupID": group_id,
+                "productName": product.productName,
+                "productDescription": product.productDescription,
+                "size": product.size,
+                "quantity": product.quantity,
+                "category": product.category,
+                "unitPrice": product.unitPrice,
+                "image_path": image_path  # Include the existing image path in the response
+            }
 
-        # Step 6: Return product size, quantity, and image_path in response
-        return {
-            "productID": product_id,
-            "productName": product.productName,
-            "productDescription": product.productDescription,
-            "size": product.size,
-            "quantity": product.quantity,
-            "category": product.category,
-            "unitPrice": product.unitPrice,
-            "image_path": image_path  # Include the existing image path in the response
-        }
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
 
-    except Exception as e:
-        await conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    finally:
-        await conn.close()  
-        
 #delete a size
 @router.patch('/products/sizes/soft-delete')
 async def soft_delete_size(
@@ -482,137 +461,198 @@ async def soft_delete_size(
     category: str, 
     size: str
 ):
-    conn = await database.get_db_connection()
-    try:
-        async with conn.cursor() as cursor:
-            # Check if the size exists and is currently active
-            await cursor.execute('''
-                SELECT size 
-                FROM Products 
-                WHERE productName = ? 
-                AND unitPrice = ? 
-                AND category = ? 
-                AND size = ? 
-                AND isActive = 1
-            ''', (productName, unitPrice, category, size))
-            
-            product = await cursor.fetchone()
-            
-            if not product:
-                raise HTTPException(status_code=404, detail="Product size not found or already inactive")
-            
-            # Perform the soft delete by setting isActive to 0
-            await cursor.execute('''
-                UPDATE Products 
-                SET isActive = 0 
-                WHERE productName = ? 
-                AND unitPrice = ? 
-                AND category = ? 
-                AND size = ?
-            ''', (productName, unitPrice, category, size))
-            
-            await conn.commit()
-            return {"detail": "Product size soft deleted successfully"}
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
-
-
+    async with database.connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                # Check if the size exists and is currently active
+                in_group, group = groups.group_filter(None, productName, category)
+                of_size, size_params = groups.size_filter(size)
+                await cursor.execute(f'''
+                    SELECT productGroupID 
+                    FROM Products 
+                    WHERE {in_group}
+                    AND {of_size} 
+                    AND isActive = 1
+                    AND ROUND(unitPrice * 100, 0) = ? 
+                ''', (*group, *size_params, groups.cents(unitPrice)))
+
+                product = await cursor.fetchone()
+
+                if not product:
+                    raise HTTPException(status_code=404, detail="Product size not found or already inactive")
+
+                # Perform the soft delete by setting isActive to 0
+                await cursor.execute(f'''
+                    UPDATE Products 
+                    SET isActive = 0, updatedAt = SYSUTCDATETIME()
+                    WHERE {in_group} 
+                    AND {of_size} 
+                    AND isActive = 1
+                    AND ROUND(unitPrice * 100, 0) = ?
+                ''', (*group, *size_params, groups.cents(unitPrice)))
+
+                await conn.commit()
+                catalog.invalidate(category)
+                search.changed()
+                return {"detail": "Product size soft deleted successfully"}
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 # add quantities to an existing products
 @router.post('/products/add-quantity')
 async def add_product_quantity(product: AddQuantity):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
+    # reserve the variants' codes before the transaction takes any locks
+    reserved = await codes.prefetch(product.quantity)
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+
+        try:
+            if product.productGroupID is None and (product.productName is None or product.category is None):
+                raise HTTPException(status_code=400, detail='productGroupID or productName and category are required.')
+            in_group, group = groups.group_filter(product.productGroupID, product.productName, product.category)
+            of_size, size = groups.size_filter(product.size)
+            await cursor.execute(
+                f''' select top 1 productID, productName, category
+                from Products
+                where {in_group} and {of_size} and 
+                isActive = 1''',
+                *group, *size
+            )
+            product_row = await cursor.fetchone()
+
+            if not product_row:
+                raise HTTPException(status_code=404, detail='Product not found.')
+
+            product_id, product_name, category = product_row
+
+            # new variants are both available and in stock
+            await variants.create_variants(cursor, product_id, product.quantity, add_stock=True, reserved=reserved)
+            await conn.commit()
+            catalog.invalidate(category)
+            return{'message': f'{product.quantity} quantities of {product_name} added successfully.'}
+        except HTTPException:
+            raise
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
 
-    try:
-        await cursor.execute(
-            ''' select productID
-            from Products
-            where productName = ? and size = ? and category = ? and 
-            isActive = 1''',
-            product.productName, product.size, product.category
-        )
-        product_row = await cursor.fetchone()
-
-        if not product_row:
-            raise HTTPException(status_code=404, detail='Product not found.')
-
-        product_id = product_row[0]
-
-        variants_data= [(
-                    generate_barcode(),
-                    generate_sku(),
-                    product_id )
-                 for _ in range(product.quantity)
-                 ]
-        await cursor.executemany(
-                    '''insert into ProductVariants (barcode, productCode, productID)
-                    values (?, ?, ?)''',
-                    variants_data
-                )
-        await conn.commit()
-        return{'message': f'{product.quantity} quantities of {product.productName} added successfully.'}
-    except Exception as e:
-        await conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
-    
 # get all productss 
 @router.get("/products")
-async def get_products():
-    conn = await database.get_db_connection()
-    try: 
+@database.read_only
+async def get_products(
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX),
+    after: Optional[str] = Query(None, alias="cursor"),
+    stream: bool = False,
+):
+    # paged (limit/cursor) or streamed listing: one row per product in productID order
+    if limit or after or stream:
+        query = '''select top (?) productID, productName, productDescription,
+            size, color, unitPrice, availableQuantity as 'available quantity'
+            from Products
+            where isActive = 1 and availableQuantity > 0 and productID > ?
+            order by productID'''
+        last_product = pagination.decode_cursor(after, 1)[0] if after else 0
+        if stream:
+            return pagination.stream_records(query, (limit or pagination.ALL_ROWS, last_product))
+        limit = limit or pagination.PAGE_SIZE_DEFAULT
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute(query, (limit + 1, last_product))
+            return await pagination.fetch_page(cursor, limit, ("productID",))
+
+    async with database.connection() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute('''
-select p.productName, p.productDescription,
-p.size, p.color, p.unitPrice, 
-count(pv.variantID) as 'available quantity'
-from products as p
-left join ProductVariants as pv
-on p.productID = pv.productID
-where p.isActive = 1 and pv.isAvailable =1
-group by p.productName, p.productDescription, p.size, p.color, p.unitPrice
+select productName, productDescription,
+size, color, unitPrice, 
+sum(availableQuantity) as 'available quantity'
+from products
+where isActive = 1 and availableQuantity > 0
+group by productName, productDescription, size, color, unitPrice
 ''')
-            products = await cursor.fetchall()
-            # map column names to row values
-            return [dict(zip([column[0] for column in cursor.description], row)) for row in products]
-    finally: 
-        await conn.close()
+            # map rows to records of this query shape
+            mapper, products = await rows.fetch_records(cursor)
+            return rows.RecordsResponse(mapper, products)
 
 # get one product
 @router.get('/products/{product_id}')
+@database.read_only
 async def get_product(product_id: int):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
         await cursor.execute('''select p.productName, p.productDescription,
             p.size, p.color, p.unitPrice,
-            p.size, p.color, p.unitPrice, 
             p.minStockLevel, p.maxStockLevel,
-            count(pv.variantID) as 'available quantity'
+            p.availableQuantity as 'available quantity',
+            p.productGroupID
             from products as p
-            left join ProductVariants as pv
-            on p.productID = pv.productID
-            where p.isActive = 1 and pv.isAvailable =1
-            and p.productID = ?
-            group by p.productName, p.productDescription, p.size, p.color, p.unitPrice, p.minStockLevel, p.maxStockLevel''', product_id)
-        #group by p.productName, p.productDescription, p.size, p.color, p.unitPrice, ''', product_id)
-        product = await cursor.fetchone()
+            where p.isActive = 1 and p.availableQuantity > 0
+            and p.productID = ?''', product_id)
+        mapper, product = await rows.fetch_record(cursor)
         if not product:
             raise HTTPException(status_code=404, detail='product not found')
-        return dict(zip([column[0] for column in cursor.description], product))
-    finally:
-        await conn.close()
+        return rows.RecordResponse(mapper, product)
+
+# get a product group (see groups.py) and its active sizes
+@router.get('/groups/{group_id}')
+@database.read_only
+async def get_product_group(group_id: int):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''SELECT productGroupID, productName, category FROM ProductGroups WHERE productGroupID = ?''',
+            (group_id,)
+        )
+        group = await cursor.fetchone()
+        if not group:
+            raise HTTPException(status_code=404, detail='product group not found')
+        in_group, params = groups.group_filter(group_id)
+        await cursor.execute(
+            f'''SELECT productID, productDescription, size, color, unitPrice,
+                   currentStock, availableQuantity AS 'available quantity'
+               FROM Products
+               WHERE {in_group} AND isActive = 1
+               ORDER BY sizeKey, productID''',
+            params
+        )
+        _, sizes = await rows.fetch_records(cursor)
+        return {
+            "productGroupID": group[0],
+            "productName": group[1],
+            "category": group[2],
+            "sizes": [size.to_dict() for size in sizes],
+        }
 
 # get all product variants 
 @router.get("/product/variants")
-async def get_product_variants():
-    conn = await database.get_db_connection()
-    try: 
+@database.read_only
+async def get_product_variants(
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX),
+    after: Optional[str] = Query(None, alias="cursor"),
+    stream: bool = False,
+):
+    # paged (limit/cursor) or streamed listing in (productID, variantID) order
+    if limit or after or stream:
+        query = '''select top (?) p.productID, pv.variantID, p.productName, pv.barcode, pv.productCode,
+            p.productDescription, p.size, p.color, p.unitPrice,
+            p.minStockLevel, p.maxStockLevel
+            from Products as p
+            join ProductVariants as pv
+            on p.productID = pv.productID
+            where p.isActive = 1 and pv.isAvailable = 1
+            and (p.productID > ? or (p.productID = ? and pv.variantID > ?))
+            order by p.productID, pv.variantID'''
+        last_product, last_variant = pagination.decode_cursor(after, 2) if after else (0, 0)
+        if stream:
+            return pagination.stream_records(query, (limit or pagination.ALL_ROWS, last_product, last_product, last_variant))
+        limit = limit or pagination.PAGE_SIZE_DEFAULT
+        async with database.connection() as conn:
+            cursor = await conn.cursor()
+            await cursor.execute(query, (limit + 1, last_product, last_product, last_variant))
+            return await pagination.fetch_page(cursor, limit, ("productID", "variantID"))
+
+    async with database.connection() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute('''
 select p.productName, pv.barcode, pv.productCode, 
@@ -622,11 +662,48 @@ from Products as p
 full outer join ProductVariants as pv
 on p.productID = pv.productID
 where p.isActive = 1 and pv.isAvailable = 1;''')
-            products = await cursor.fetchall()
-            # map column names to row values
-            return [dict(zip([column[0] for column in cursor.description], row)) for row in products]
-    finally: 
-        await conn.close()
+            # map rows to records of this query shape
+            mapper, products = await rows.fetch_records(cursor)
+            return rows.RecordsResponse(mapper, products)
+
+# Printable barcode label of one variant, rendered once and served from the
+# label cache (see labels.py)
+@router.get("/variants/{barcode}/label.{fmt}")
+@database.read_only
+async def get_variant_label(barcode: str, fmt: str):
+    if fmt not in labels.LABEL_FORMATS:
+        raise HTTPException(status_code=404, detail="Labels are available as .png or .svg")
+    if not labels.valid_code(barcode):
+        raise HTTPException(status_code=404, detail="variant not found")
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute("SELECT 1 FROM ProductVariants WHERE barcode = ?", (barcode,))
+        if await cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="variant not found")
+    try:
+        path = await labels.label(barcode, fmt)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(path, media_type=labels.LABEL_FORMATS[fmt],
+                        headers={"Cache-Control": "public, max-age=86400"})
+
+# Label sheet of every available variant of a product: all pages as PDF, or
+# one page (`page`) as PNG
+@router.get("/products/{product_id}/labels.{fmt}")
+@database.read_only
+async def get_product_labels(product_id: int, fmt: str, page: Optional[int] = Query(None, ge=1)):
+    if fmt not in labels.SHEET_FORMATS:
+        raise HTTPException(status_code=404, detail="Label sheets are available as .pdf or .png")
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''SELECT TOP (?) barcode FROM ProductVariants
+               WHERE productID = ? AND isAvailable = 1
+               ORDER BY variantID''',
+            (labels.LABEL_SHEET_MAX + 1, product_id)
+        )
+        codes = [row[0] for row in await cursor.fetchall()]
+    return await labels.sheet_response(codes, fmt, page, f"product-{product_id}-labels")
 
 # # get one product variant
 # @router.get('/products/variant/{variant_id}', response_model=ProductVariant)
@@ -664,85 +741,131 @@ where p.isActive = 1 and pv.isAvailable = 1;''')
 #         await conn.close()
 
 
-@router.put('/products')
-async def update_products(productUpdate: Product, image_path: str):
-    conn = await database.get_db_connection()
-    try:
-        async with conn.cursor() as cursor:
-            # Update all products with the same productName, productDescription, unitPrice, and category
+# Upload a product image as multipart form data; the returned image_path can
+# be used with products_AddSize and PUT /products
+@router.post('/images')
+async def upload_image(image: UploadFile = File(...)):
+    return await save_image(images.ingest_upload, image)
+
+# Upload a new image for a product and all of its sizes
+@router.put('/products/{product_id}/image')
+async def replace_product_image(product_id: int, image: UploadFile = File(...)):
+    stored = await save_image(images.ingest_upload, image)
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        try:
             await cursor.execute(
-                '''
-                UPDATE Products
-                SET productName = ?, productDescription = ?, category = ?, 
-                    unitPrice = ?, image_path = ?
-                WHERE productName = ? AND productDescription = ? AND unitPrice = ? AND category = ?
-                ''',
-                product.productName,
-                product.productDescription,
-                product.category,
-                product.unitPrice,
-                image_path,  # Update the image path
-                product.productName,
-                product.productDescription,
-                product.unitPrice,
-                product.category
+                '''SELECT productName, productDescription, category, productGroupID
+                   FROM Products WHERE productID = ? AND isActive = 1''',
+                (product_id,)
             )
-            await conn.commit()
+            product = await cursor.fetchone()
+            if not product:
+                raise HTTPException(status_code=404, detail='product not found')
 
-            return {'message': 'Products updated successfully!'}
+            # sizes of a product share its image (see products_AddSize)
+            in_group, group = groups.group_filter(product[3], product[0], product[2])
+            await cursor.execute(
+                f'''UPDATE Products
+                   SET image_path = ?, updatedAt = SYSUTCDATETIME()
+                   WHERE {in_group} AND productDescription = ? AND isActive = 1''',
+                (stored["image_path"], *group, product[1])
+            )
+            updated = cursor.rowcount
+            await conn.commit()
+            catalog.invalidate(product[2])
+            search.changed()
+            return dict(stored, updatedProducts=updated)
+        except HTTPException:
+            raise
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
 
-    except Exception as e:
-        await conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+@router.put('/products')
+async def update_products(productUpdate: Product, image_path: str):
+    async with database.connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                # Update all sizes of the group with the same productDescription and unitPrice
+                # (and give rows that are not backfilled yet their group)
+                group_id = await groups.ensure(cursor, productUpdate.productName, productUpdate.category)
+                in_group, group = groups.group_filter(None, productUpdate.productName, productUpdate.category)
+                await cursor.execute(
+                    f'''
+                    UPDATE Products
+                    SET productName = ?, productDescription = ?, category = ?, 
+                        unitPrice = ?, image_path = ?, productGroupID = ?, updatedAt = SYSUTCDATETIME()
+                    WHERE {in_group} AND productDescription = ? AND ROUND(unitPrice * 100, 0) = ?
+                    ''',
+                    productUpdate.productName,
+                    productUpdate.productDescription,
+                    productUpdate.category,
+                    productUpdate.unitPrice,
+                    image_path,  # Update the image path
+                    group_id,
+                    *group,
+                    productUpdate.productDescription,
+                    groups.cents(productUpdate.unitPrice)
+                )
+                await conn.commit()
+                catalog.invalidate(productUpdate.category)
+                search.changed()
 
-    finally:
-        await conn.close()
+                return {'message': 'Products updated successfully!'}
 
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete('/products/{product_id}')
 async def delete_product(product_id: int):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        # Check if the product exists and is active
-        await cursor.execute('''SELECT productID FROM Products WHERE productID = ? AND isActive = 1''', (product_id,))
-        product = await cursor.fetchone()
-
-        if not product:
-            raise HTTPException(status_code=404, detail='Product not found or already deleted.')
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            # Check if the product exists and is active
+            await cursor.execute('''SELECT productID, category FROM Products WHERE productID = ? AND isActive = 1''', (product_id,))
+            product = await cursor.fetchone()
 
-        # Mark the product as inactive
-        await cursor.execute('''UPDATE Products SET isActive = 0 WHERE productID = ?''', (product_id,))
-        await conn.commit()
+            if not product:
+                raise HTTPException(status_code=404, detail='Product not found or already deleted.')
 
-        return {'message': f'Product with ID {product_id} has been deleted (marked as inactive).'}
-    except Exception as e:
-        await conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close()
+            # Mark the product as inactive
+            await cursor.execute('''UPDATE Products SET isActive = 0, updatedAt = SYSUTCDATETIME() WHERE productID = ?''', (product_id,))
+            await conn.commit()
+            catalog.invalidate(product[1])
+            search.changed()
 
+            return {'message': f'Product with ID {product_id} has been deleted (marked as inactive).'}
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
 
 # delete a product variant
 @router.delete('/products/variant/{variant_id}')
 async def delete_product_variant(variant_id: int):
-    conn = await database.get_db_connection()
-    cursor = await conn.cursor()
-    try:
-        # Check if the variant exists and is available
-        await cursor.execute('''SELECT variantID FROM ProductVariants WHERE variantID = ? AND isAvailable = 1''', (variant_id,))
-        variant = await cursor.fetchone()
-
-        if not variant:
-            raise HTTPException(status_code=404, detail='Product variant not found or already deleted.')
-
-        # Mark the variant as unavailable
-        await cursor.execute('''UPDATE ProductVariants SET isAvailable = 0 WHERE variantID = ?''', (variant_id,))
-        await conn.commit()
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        try:
+            # Check if the variant exists and is available
+            await cursor.execute('''SELECT pv.variantID, p.category, pv.productID
+                                    FROM ProductVariants pv
+                                    JOIN Products p ON p.productID = pv.productID
+                                    WHERE pv.variantID = ? AND pv.isAvailable = 1''', (variant_id,))
+            variant = await cursor.fetchone()
+
+            if not variant:
+                raise HTTPException(status_code=404, detail='Product variant not found or already deleted.')
+
+            # Mark the variant as unavailable
+            await cursor.execute('''UPDATE ProductVariants SET isAvailable = 0, updatedAt = SYSUTCDATETIME()
+                                    WHERE variantID = ? AND isAvailable = 1''', (variant_id,))
+            if cursor.rowcount:
+                await inventory.adjust_available(cursor, variant[2], -1)
+            await conn.commit()
+            catalog.invalidate(variant[1])
 
-        return {'message': f'Product variant with ID {variant_id} has been deleted (marked as unavailable).'}
-    except Exception as e:
-        await conn.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await conn.close
\ No newline at end of file
+            return {'message': f'Product variant with ID {variant_id} has been deleted (marked as unavailable).'}
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from routers.auth import get_current_user
 from pydantic import BaseModel
-import aioodbc
 import database as database
 from datetime import datetime
 
@@ -24,7 +23,7 @@ class Vendor(BaseModel):
 
 # Create a Vendor
 @router.post("/")
-async def create_vendor(vendor: Vendor, db=Depends(database.get_db_connection)):
+async def create_vendor(vendor: Vendor, db=Depends(database.get_db)):
     """
     Add a new vendor to the database.
     """
@@ -50,7 +49,7 @@ async def create_vendor(vendor: Vendor, db=Depends(database.get_db_connection)):
 
 # List All Active Vendors
 @router.get("/")
-async def list_vendors(db=Depends(database.get_db_connection)):
+async def list_vendors(db=Depends(database.get_read_db)):
     """
     Retrieve all active vendors (exclude soft-deleted).
     """
@@ -87,7 +86,7 @@ async def list_vendors(db=Depends(database.get_db_connection)):
 
 # Get Vendor by ID
 @router.get("/{vendor_id}")
-async def get_vendor(vendor_id: int, include_inactive: bool = False, db=Depends(database.get_db_connection)):
+async def get_vendor(vendor_id: int, include_inactive: bool = False, db=Depends(database.get_read_db)):
     """
     Retrieve details of a specific vendor by ID.
     Optionally include soft-deleted vendors by setting `include_inactive` to True.
@@ -129,7 +128,7 @@ async def get_vendor(vendor_id: int, include_inactive: bool = False, db=Depends(
 
 # Update a Vendor
 @router.put("/{vendor_id}")
-async def update_vendor(vendor_id: int, vendor: Vendor, db=Depends(database.get_db_connection)):
+async def update_vendor(vendor_id: int, vendor: Vendor, db=Depends(database.get_db)):
     """
     Update an existing vendor by ID.
     """
@@ -159,7 +158,7 @@ async def update_vendor(vendor_id: int, vendor: Vendor, db=Depends(database.get_
 
 # Soft Delete a Vendor
 @router.delete("/{vendor_id}")
-async def delete_vendor(vendor_id: int, db=Depends(database.get_db_connection)):
+async def delete_vendor(vendor_id: int, db=Depends(database.get_db)):
     """
     Soft delete a vendor by setting isActive to False (0).
     """
@@ -187,7 +186,7 @@ async def delete_vendor(vendor_id: int, db=Depends(database.get_db_connection)):
 
 # Reactivate a Soft-Deleted Vendor
 @router.put("/{vendor_id}/reactivate")
-async def reactivate_vendor(vendor_id: int, db=Depends(database.get_db_connection)):
+async def reactivate_vendor(vendor_id: int, db=Depends(database.get_db)):
     """
     Reactivate a soft-deleted vendor by setting isActive to True (1).
     """
@@ -0,0 +1,195 @@
+import json
+import keyword
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+from json.encoder import encode_basestring
+from fastapi.responses import Response
+
+# Compiled row mappers
+#
+# A mapper is generated once per query shape (the column names in
+# cursor.description plus any per-column transforms) and cached. It turns raw
+# driver rows into __slots__ records and encodes a list of records straight to
+# JSON bytes, so list endpoints skip per-row dicts, pydantic models and
+# FastAPI's jsonable_encoder pass.
+
+_mappers = {}
+
+
+def _encode_str(value):
+    return encode_basestring(value)
+
+
+def _encode_int(value):
+    return int.__repr__(value)
+
+
+def _encode_float(value):
+    return float.__repr__(value)
+
+
+def _encode_bool(value):
+    return "true" if value else "false"
+
+
+def _encode_decimal(value):
+    return float.__repr__(float(value))
+
+
+def _encode_temporal(value):
+    return '"' + value.isoformat() + '"'
+
+
+def _encode_any(value):
+    # value types are only known at runtime (e.g. SQLite reports no type_code)
+    if value is None:
+        return "null"
+    cls = type(value)
+    if cls is str:
+        return encode_basestring(value)
+    if cls is bool:
+        return "true" if value else "false"
+    if cls is int:
+        return int.__repr__(value)
+    if cls is float:
+        return float.__repr__(value)
+    if cls is Decimal:
+        return float.__repr__(float(value))
+    if cls in (datetime, date, time):
+        return '"' + value.isoformat() + '"'
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+_ENCODERS = {
+    str: _encode_str,
+    int: _encode_int,
+    float: _encode_float,
+    bool: _encode_bool,
+    Decimal: _encode_decimal,
+    datetime: _encode_temporal,
+    date: _encode_temporal,
+    time: _encode_temporal,
+}
+
+
+def _attr_names(columns):
+    """Turn column labels into unique Python identifiers for __slots__."""
+    names = []
+    for index, column in enumerate(columns):
+        name = re.sub(r"\W", "_", column or "")
+        if not name or name[0].isdigit() or keyword.iskeyword(name) or name.startswith("_") or name in names:
+            name = f"c{index}_{name}".rstrip("_")
+        names.append(name)
+    return names
+
+
+class RowMapper:
+    """Maps rows of one query shape to slots records and encodes them as JSON."""
+
+    def __init__(self, columns, type_codes=None, transforms=None):
+        self.columns = tuple(columns)
+        # the encoder bakes every column in as a key: a repeated one would be a duplicate JSON key
+        repeated = sorted({column for column in self.columns if self.columns.count(column) > 1})
+        if repeated:
+            raise ValueError(f"Query selects {', '.join(repeated)} more than once; label each column uniquely")
+        self.attrs = tuple(_attr_names(self.columns))
+        transforms = transforms or {}
+        type_codes = type_codes or (None,) * len(self.columns)
+
+        namespace = {"__slots__": self.attrs, "_fields": self.columns}
+        args = ", ".join(self.attrs)
+        body = "".join(f"\n    self.{a} = {a}" for a in self.attrs) or "\n    pass"
+        exec(f"def __init__(self, {args}):{body}", {}, namespace)
+        namespace["to_dict"] = lambda record: {c: getattr(record, a) for c, a in zip(self.columns, self.attrs)}
+        namespace["__repr__"] = lambda record: f"Record({record.to_dict()!r})"
+        self.record_class = type("Record", (), namespace)
+
+        env = {"_Record": self.record_class, "_null": "null"}
+        # from_rows: unpack each driver row once, apply transforms in place
+        values = []
+        for index, attr in enumerate(self.attrs):
+            transform = transforms.get(self.columns[index])
+            if transform:
+                env[f"_t{index}"] = transform
+                values.append(f"_t{index}({attr})")
+            else:
+                values.append(attr)
+        unpack = f"({args},)" if len(self.attrs) == 1 else args
+        source = f"def from_rows(rows):\n    return [_Record({', '.join(values)}) for {unpack} in rows]\n"
+
+        # encode: one string concatenation per record with keys baked in
+        pieces = []
+        for index, (column, attr) in enumerate(zip(self.columns, self.attrs)):
+            encoder = _ENCODERS.get(type_codes[index]) if not transforms.get(column) else None
+            env[f"_e{index}"] = encoder or _encode_any
+            key = ("," if index else "{") + json.dumps(column, ensure_ascii=False) + ":"
+            if encoder:
+                pieces.append(f"{key!r} + (_null if r.{attr} is None else _e{index}(r.{attr}))")
+            else:
+                pieces.append(f"{key!r} + _e{index}(r.{attr})")
+        record_json = " + ".join(pieces) + " + '}'" if pieces else "'{}'"
+        source += (
+            "def encode(records):\n"
+            f"    return ('[' + ','.join([{record_json} for r in records]) + ']').encode('utf-8')\n"
+            "def encode_lines(records):\n"
+            f"    return ''.join([{record_json} + '\\n' for r in records]).encode('utf-8')\n"
+        )
+        exec(source, env)
+        self.from_rows = env["from_rows"]
+        self.encode = env["encode"]
+        # NDJSON: one record per line
+        self.encode_lines = env["encode_lines"]
+
+    def from_row(self, row):
+        return self.from_rows((row,))[0]
+
+
+def mapper_for(description, transforms=None):
+    """Return the cached mapper for a cursor.description shape."""
+    columns = tuple(column[0] for column in description)
+    type_codes = tuple(column[1] for column in description)
+    key = (columns, type_codes, tuple(sorted(transforms.items())) if transforms else None)
+    mapper = _mappers.get(key)
+    if mapper is None:
+        mapper = _mappers[key] = RowMapper(columns, type_codes, transforms)
+    return mapper
+
+
+async def fetch_records(cursor, transforms=None):
+    """fetchall() mapped to records; returns (mapper, records)."""
+    rows = await cursor.fetchall()
+    mapper = mapper_for(cursor.description, transforms)
+    return mapper, mapper.from_rows(rows)
+
+
+async def fetch_record(cursor, transforms=None):
+    row = await cursor.fetchone()
+    if row is None:
+        return None, None
+    mapper = mapper_for(cursor.description, transforms)
+    return mapper, mapper.from_row(row)
+
+
+class RecordsResponse(Response):
+    """JSON response for mapped records, encoded by the mapper of their shape.
+
+    Returning it from a route bypasses response_model validation, so routes
+    can keep response_model purely for the OpenAPI schema.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, mapper, records, status_code=200, headers=None):
+        self.mapper = mapper
+        super().__init__(content=records, status_code=status_code, headers=headers)
+
+    def render(self, content):
+        return self.mapper.encode(content)
+
+
+class RecordResponse(RecordsResponse):
+    """Single-record variant of RecordsResponse."""
+
+    def render(self, content):
+        return self.mapper.encode((content,))[1:-1]
@@ -0,0 +1,297 @@
+import asyncio
+import bisect
+import collections
+import heapq
+import logging
+import operator
+import os
+import re
+import time
+import unicodedata
+from datetime import timedelta
+import database
+import images
+import metrics
+
+# In-process product search
+#
+# Active products are indexed in memory by productName, productDescription,
+# category and size: an inverted index from normalised tokens to the
+# products containing them (weighted by field), a sorted vocabulary for
+# prefix matches and a trigram index over the vocabulary for typo-tolerant
+# matches. Queries never touch SQL. A product matches when every query term
+# matches one of its tokens exactly, as a prefix, or fuzzily; products are
+# ranked by the summed field weight times match quality.
+#
+# The index is loaded once at startup and then kept current from
+# Products.updatedAt: product writes call changed(), which makes the sync
+# task re-read the rows updated since the last sync straight away, and the
+# task also syncs every SEARCH_SYNC_INTERVAL seconds to pick up writes made
+# by other worker processes.
+
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "true").lower() == "true"
+SEARCH_SYNC_INTERVAL = float(os.getenv("SEARCH_SYNC_INTERVAL", 30))  # seconds between syncs without local writes
+SEARCH_SYNC_OVERLAP = float(os.getenv("SEARCH_SYNC_OVERLAP", 60))  # re-read rows this many seconds before the watermark, for late commits
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", 0.4))  # trigram similarity for a fuzzy match
+SEARCH_LIMIT_MAX = 100
+
+FIELD_WEIGHTS = {"productName": 3.0, "size": 2.0, "category": 1.5, "productDescription": 1.0}
+EXACT, PREFIX, FUZZY = 1.0, 0.6, 0.4  # match quality multipliers
+
+LOAD_QUERY = '''SELECT productID, productName, productDescription, category, size, unitPrice,
+        CAST(image_path AS varchar(max)) AS image_path, isActive, updatedAt, productGroupID
+    FROM Products'''
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+class SearchIndexNotReady(Exception):
+    pass
+
+
+class _Index:
+    def __init__(self):
+        self.docs = {}  # productID -> (record, {token: weight})
+        self.postings = collections.defaultdict(dict)  # token -> {productID: weight}
+        self.trigrams = collections.defaultdict(set)  # trigram -> tokens
+        self.vocabulary = []  # sorted tokens, for prefix lookups
+        self.vocabulary_dirty = False
+
+    def remove(self, product_id):
+        entry = self.docs.pop(product_id, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            posting = self.postings[token]
+            posting.pop(product_id, None)
+            if not posting:
+                del self.postings[token]
+                for trigram in _trigrams(token):
+                    self.trigrams[trigram].discard(token)
+                self.vocabulary_dirty = True
+
+    def add(self, product_id, record):
+        self.remove(product_id)
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(record[field]):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        for token, weight in weights.items():
+            if token not in self.postings:
+                for trigram in _trigrams(token):
+                    self.trigrams[trigram].add(token)
+                self.vocabulary_dirty = True
+            self.postings[token][product_id] = weight
+        self.docs[product_id] = (record, weights)
+
+    def prefixed(self, term):
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + "\uffff")
+        return self.vocabulary[start:end]
+
+    def similar(self, term):
+        grams = _trigrams(term)
+        shared = collections.Counter()
+        for trigram in grams:
+            shared.update(self.trigrams.get(trigram, ()))
+        matches = []
+        for token, count in shared.items():
+            similarity = count / (len(grams) + len(_trigrams(token)) - count)
+            if similarity >= SEARCH_FUZZY_THRESHOLD:
+                matches.append((token, similarity))
+        return matches
+
+    def matches(self, term):
+        """Tokens a query term matches, with their match quality."""
+        found = {token: PREFIX for token in self.prefixed(term)}
+        if term in self.postings:
+            found[term] = EXACT
+        elif len(term) >= 4:
+            for token, similarity in self.similar(term):
+                found.setdefault(token, FUZZY * similarity)
+        return found
+
+
+_index = _Index()
+_ready = False
+_watermark = None
+_changed = None
+_task = None
+
+
+def normalize(text):
+    # case- and accent-insensitive: "Women's Café" -> "women's cafe"
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _record(row):
+    return {
+        "productID": row[0],
+        "productGroupID": row[9],
+        "productName": row[1],
+        "productDescription": row[2],
+        "category": row[3],
+        "size": row[4],
+        "unitPrice": float(row[5]) if row[5] is not None else None,
+        "image_path": images.image_url(row[6]),
+    }
+
+
+async def _load(since=None):
+    global _watermark
+    query, params = LOAD_QUERY, ()
+    if since is not None:
+        query, params = LOAD_QUERY + " WHERE updatedAt >= ?", (since,)
+    else:
+        query += " WHERE isActive = 1"
+    # primary: a replica may not have the write that triggered the sync yet
+    async with database.connection("write") as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(query, params)
+        rows = await cursor.fetchall()
+    for row in rows:
+        if row[7]:
+            _index.add(row[0], _record(row))
+        else:
+            _index.remove(row[0])
+        if _watermark is None or row[8] > _watermark:
+            _watermark = row[8]
+    metrics.SEARCH_INDEX_PRODUCTS.set(len(_index.docs))
+    return len(rows)
+
+
+async def build():
+    """Load every active product into a fresh index (startup task)."""
+    global _index, _ready, _watermark
+    if not SEARCH_ENABLED:
+        return
+    started = time.perf_counter()
+    _index, _watermark = _Index(), None
+    await _load()
+    _index.prefixed("")  # sort the vocabulary now rather than on the first query
+    _ready = True
+    logging.info(f"Search index built: {len(_index.docs)} products, {len(_index.postings)} tokens "
+                 f"in {time.perf_counter() - started:.2f}s")
+
+
+async def sync():
+    """Apply product rows updated since the last sync; returns how many were read."""
+    if not _ready:
+        return 0
+    since = _watermark - timedelta(seconds=SEARCH_SYNC_OVERLAP) if _watermark else None
+    return await _load(since)
+
+
+def changed():
+    """Called by routes after committing product changes; the sync task picks them up."""
+    if _changed is not None:
+        _changed.set()
+
+
+def search(query, limit=20, category=None):
+    """Ranked products matching every term of `query`."""
+    if not _ready:
+        raise SearchIndexNotReady("Search index is still loading")
+    started = time.perf_counter()
+    postings = _index.postings
+    # per term: (posting, match quality) of every token it matches
+    terms = [[(postings[token], quality) for token, quality in _index.matches(term).items()]
+             for term in dict.fromkeys(tokenize(query))]
+    # the narrowest term picks the candidates; the others only filter and add to them
+    terms.sort(key=lambda matched: sum(len(posting) for posting, _ in matched))
+
+    scores = {}
+    if terms and len(terms[0]) == 1:
+        posting, quality = terms[0][0]
+        scores = {product_id: weight * quality for product_id, weight in posting.items()}
+    else:
+        for posting, quality in terms[0] if terms else ():
+            for product_id, weight in posting.items():
+                if weight * quality > scores.get(product_id, 0.0):
+                    scores[product_id] = weight * quality
+    for matched in terms[1:]:
+        if len(matched) == 1:
+            # the usual case, a term matching one token: intersect the key sets
+            posting, quality = matched[0]
+            scores = {product_id: scores[product_id] + posting[product_id] * quality
+                      for product_id in scores.keys() & posting.keys()}
+        else:
+            narrowed = {}
+            for product_id, score in scores.items():
+                best = 0.0
+                for posting, quality in matched:
+                    weight = posting.get(product_id)
+                    if weight is not None and weight * quality > best:
+                        best = weight * quality
+                if best:
+                    narrowed[product_id] = score + best
+            scores = narrowed
+        if not scores:
+            break
+
+    docs = _index.docs
+    if category is not None:
+        scores = {product_id: score for product_id, score in scores.items()
+                  if docs[product_id][0]["category"] == category}
+    top = heapq.nlargest(limit, scores.items(), key=operator.itemgetter(1))
+    top.sort(key=lambda item: (-item[1], docs[item[0]][0]["productName"] or "", docs[item[0]][0]["size"] or ""))
+    items = [dict(docs[product_id][0], score=round(score, 3)) for product_id, score in top]
+    metrics.SEARCH_SECONDS.observe(time.perf_counter() - started)
+    return {"query": query, "total": len(scores), "items": items}
+
+
+def stats():
+    return {
+        "enabled": SEARCH_ENABLED,
+        "ready": _ready,
+        "products": len(_index.docs),
+        "tokens": len(_index.postings),
+        "watermark": _watermark.isoformat() if _watermark else None,
+    }
+
+
+async def _run():
+    while True:
+        # not wait_for(): on 3.11 it swallows a cancel that arrives as the event is set
+        try:
+            async with asyncio.timeout(SEARCH_SYNC_INTERVAL):
+                await _changed.wait()
+        except TimeoutError:
+            pass
+        _changed.clear()
+        try:
+            await sync()
+        except Exception as e:
+            logging.error(f"Search index sync failed: {e}")
+
+
+def start():
+    global _changed, _task
+    if SEARCH_ENABLED and _task is None:
+        _changed = asyncio.Event()
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _changed, _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+        _changed = None
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import time
+
+# Application bootstrap
+#
+# Work that depends on other services (the Azure firewall webhook, opening
+# database connections, seeding the default user) is registered here as named
+# tasks. In the default "background" mode they run after the app starts
+# serving, each under a timeout, so /health answers on a cold start without
+# waiting on external round trips; /health/ready reports every task and
+# answers 503 until the required ones have finished. STARTUP_MODE=blocking
+# awaits them all before serving, as the app used to.
+#
+# Run `python startup.py` for an import-time report against the cold-start budget.
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")  # "background" or "blocking"
+STARTUP_TASK_TIMEOUT = float(os.getenv("STARTUP_TASK_TIMEOUT", 30))  # seconds per bootstrap task
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 1.5))  # seconds from first import to serving
+
+# first import of this module, i.e. the start of `import main`
+_started = time.perf_counter()
+_marks = {}
+_tasks = {}
+
+
+class BootstrapTask:
+    __slots__ = ("name", "fn", "timeout", "required", "after", "state", "error", "started_at", "finished_at", "task")
+
+    def __init__(self, name, fn, timeout, required, after):
+        self.name = name
+        self.fn = fn
+        self.timeout = timeout
+        self.required = required
+        self.after = after
+        self.state = "pending"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def status(self):
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.perf_counter()) - self.started_at, 3)
+        return {
+            "state": self.state,
+            "required": self.required,
+            "seconds": duration,
+            "error": self.error,
+        }
+
+
+def register(name, fn, timeout=None, required=True, after=()):
+    """Register a bootstrap coroutine function; `after` names tasks it must wait for."""
+    _tasks[name] = BootstrapTask(name, fn, timeout or STARTUP_TASK_TIMEOUT, required, tuple(after))
+
+
+def mark(name):
+    """Record the time since startup began under `name` (for /health/ready)."""
+    _marks[name] = round(time.perf_counter() - _started, 3)
+    return _marks[name]
+
+
+async def _run(task):
+    for name in task.after:
+        dependency = _tasks[name]
+        if dependency.task is not None:
+            await asyncio.wait([dependency.task])
+        if dependency.state != "done":
+            task.state = "skipped"
+            task.error = f"'{name}' did not complete"
+            logging.warning(f"Bootstrap task '{task.name}' skipped: {task.error}")
+            return
+    task.state = "running"
+    task.started_at = time.perf_counter()
+    try:
+        await asyncio.wait_for(task.fn(), task.timeout)
+        task.state = "done"
+    except asyncio.TimeoutError:
+        task.state = "timeout"
+        task.error = f"timed out after {task.timeout}s"
+        logging.warning(f"Bootstrap task '{task.name}' {task.error}")
+    except Exception as e:
+        task.state = "failed"
+        task.error = str(e) or type(e).__name__
+        logging.error(f"Bootstrap task '{task.name}' failed: {task.error}")
+    finally:
+        task.finished_at = time.perf_counter()
+    if task.state == "done":
+        logging.info(f"Bootstrap task '{task.name}' finished in {task.finished_at - task.started_at:.3f}s")
+    if is_ready() and "ready" not in _marks:
+        mark("ready")
+
+
+async def start():
+    """Start every registered task; in blocking mode wait for them all."""
+    _marks.pop("ready", None)
+    for task in _tasks.values():
+        if task.task is None:
+            task.task = asyncio.create_task(_run(task))
+    if STARTUP_MODE == "blocking":
+        await asyncio.gather(*(task.task for task in _tasks.values()))
+    elapsed = mark("serving")
+    if elapsed > STARTUP_BUDGET:
+        logging.warning(f"Cold start took {elapsed:.3f}s, over the {STARTUP_BUDGET}s budget (STARTUP_BUDGET)")
+
+
+async def stop():
+    pending = [task.task for task in _tasks.values() if task.task is not None and not task.task.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def is_ready():
+    return all(task.state == "done" for task in _tasks.values() if task.required)
+
+
+def readiness():
+    return {
+        "ready": is_ready(),
+        "mode": STARTUP_MODE,
+        "budget_seconds": STARTUP_BUDGET,
+        "timings": dict(_marks),
+        "tasks": {name: task.status() for name, task in _tasks.items()},
+    }
+
+
+def import_report(module="main", top=25):
+    """Import `module` in a fresh interpreter with -X importtime; returns (total_seconds, rows).
+
+    rows are (cumulative_seconds, self_seconds, module name), slowest first.
+    """
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, name.rstrip()[1:]))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total = next((row[0] for row in rows if row[2] == module), 0.0)
+    return total, sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    import sys
+
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+    total, rows = import_report(module)
+    print(f"{'cumulative':>11} {'self':>9}  module")
+    for cumulative, self_time, name in rows:
+        print(f"{cumulative * 1000:>9.1f}ms {self_time * 1000:>7.1f}ms  {name}")
+    print(f"\nimport {module}: {total:.3f}s (budget {STARTUP_BUDGET}s)")
+    sys.exit(1 if total > STARTUP_BUDGET else 0)
@@ -0,0 +1,53 @@
+# Tests run against the SQLite stand-in (backends/sqlite.py), seeded into a
+# scratch file per test that asks for `db`. Run from backend/:
+#   python -m pytest -q tests
+import os
+import sys
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("DB_KEEPALIVE_INTERVAL", "0")
+os.environ.setdefault("OUTBOX_ENABLED", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import backends.seed as seed  # noqa: E402
+import backends.sqlite as sqlite_backend  # noqa: E402
+import codes  # noqa: E402
+import database  # noqa: E402
+import groups  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(tmp_path, monkeypatch):
+    """A seeded scratch database behind the pool: 100 products (sizes 35-45 of 10 groups), 5 units each."""
+    monkeypatch.setattr(sqlite_backend, "SQLITE_PATH", str(tmp_path / "vms.db"))
+    seed.seed(sqlite_backend.SQLITE_PATH, variants=500, units_per_size=5, orders=4, lines_per_order=2)
+    monkeypatch.setattr(groups, "_backfilled", False)
+    codes.reset()
+    await database.init_pool()
+    try:
+        yield database
+    finally:
+        await database.close_pool()
+        codes.reset()
+
+
+async def fetch(sql, *params):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(sql, *params)
+        return await cursor.fetchall()
+
+
+async def execute(sql, *params):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(sql, *params)
+        await conn.commit()
+        return cursor.rowcount
@@ -0,0 +1,47 @@
+import pytest
+import catalog_bulk
+from conftest import fetch
+from routers.products import BulkOperation
+
+pytestmark = pytest.mark.anyio
+
+
+def _reprice(product_ids, price, expect=None):
+    return BulkOperation(filter={"productIDs": product_ids}, set={"unitPrice": price}, expect=expect)
+
+
+async def _prices(product_ids):
+    marks = ", ".join("?" * len(product_ids))
+    return [row[0] for row in await fetch(
+        f"SELECT unitPrice FROM Products WHERE productID IN ({marks}) ORDER BY productID", product_ids)]
+
+
+async def test_expect_met_commits(db):
+    report = await catalog_bulk.apply([_reprice([1, 2, 3], 10.0, expect=3)])
+    assert report["committed"] and report["affected"] == 3
+    assert await _prices([1, 2, 3]) == [10.0, 10.0, 10.0]
+
+
+async def test_expect_missed_rolls_back_every_operation(db):
+    before = await _prices([1, 2, 3, 4])
+    with pytest.raises(catalog_bulk.BulkConflict, match="operation 1 affects 2 rows, not the expected 3"):
+        await catalog_bulk.apply([_reprice([1, 2], 10.0, expect=2), _reprice([3, 4], 20.0, expect=3)])
+    assert await _prices([1, 2, 3, 4]) == before
+
+
+async def test_preview_rolls_back(db):
+    before = await _prices([5])
+    report = await catalog_bulk.apply([_reprice([5], 99.0, expect=1)], preview=True)
+    assert not report["committed"] and report["affected"] == 1
+    assert report["operations"][0]["sample"]
+    assert await _prices([5]) == before
+
+
+async def test_variant_expect_counts_only_available_variants(db):
+    variant_ids = [row[0] for row in await fetch(
+        "SELECT TOP (3) variantID FROM ProductVariants WHERE isAvailable = 1 ORDER BY variantID")]
+    report = await catalog_bulk.apply([BulkOperation(variantIDs=variant_ids, expect=3)])
+    assert report["affected"] == 3
+    # already unavailable: a repeat of the same operation changes nothing
+    with pytest.raises(catalog_bulk.BulkConflict):
+        await catalog_bulk.apply([BulkOperation(variantIDs=variant_ids, expect=3)])
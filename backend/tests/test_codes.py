@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+import pytest
+import backends.sqlite as sqlite_backend
+import codes
+from conftest import fetch
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("payload, check", [
+    ("400638133393", "1"),
+    ("590123412345", "7"),
+    ("200000000000", "8"),
+    ("000000000000", "0"),
+])
+def test_ean13_check_digit(payload, check):
+    assert codes.ean13(payload) == payload + check
+    assert codes.is_valid_ean13(payload + check)
+
+
+@pytest.mark.parametrize("code", ["4006381333932", "400638133393", "40063813339311", "40063813339A1", ""])
+def test_is_valid_ean13_rejects(code):
+    assert not codes.is_valid_ean13(code)
+
+
+def test_format_barcode():
+    barcode = codes.format_barcode(42)
+    assert barcode.startswith(codes.BARCODE_PREFIX)
+    assert barcode[:12].endswith("42")
+    assert codes.is_valid_ean13(barcode)
+    with pytest.raises(codes.SequenceExhaustedError):
+        codes.format_barcode(10 ** (12 - len(codes.BARCODE_PREFIX)))
+
+
+def test_format_sku_is_a_bijection():
+    skus = [codes.format_sku(serial) for serial in range(50000)]
+    assert len(set(skus)) == len(skus)
+    assert all(len(sku) == codes.SKU_LENGTH and set(sku) <= set(codes.SKU_ALPHABET) for sku in skus)
+    # scrambled: consecutive serials do not share a prefix
+    assert skus[0][:4] != skus[1][:4]
+    with pytest.raises(codes.SequenceExhaustedError):
+        codes.format_sku(36 ** codes.SKU_LENGTH)
+
+
+async def test_reserve_nothing(db):
+    before = sqlite_backend.round_trips()
+    assert await codes.reserve("barcode", 0) == []
+    assert await codes.reserve("barcode", -1) == []
+    assert sqlite_backend.round_trips() == before
+
+
+async def test_reserve_hands_out_one_block(db, monkeypatch):
+    monkeypatch.setattr(codes, "CODE_BLOCK_SIZE", 10)
+    first = await codes.reserve("barcode", 4)
+    before = sqlite_backend.round_trips()
+    second = await codes.reserve("barcode", 4)
+    # served from the block reserved by the first call
+    assert sqlite_backend.round_trips() == before
+    assert list(itertools.chain(*first, *second)) == list(range(1, 9))
+    (next_value,), = await fetch("SELECT nextValue FROM CodeSequences WHERE name = 'barcode'")
+    assert next_value == 15
+
+
+async def test_reserve_spans_blocks(db, monkeypatch):
+    monkeypatch.setattr(codes, "CODE_BLOCK_SIZE", 10)
+    await codes.reserve("sku", 8)  # reserves 1-18: the request plus a block
+    ranges = await codes.reserve("sku", 25)
+    # the rest of that, then a new reservation
+    assert ranges == [range(9, 19), range(19, 34)]
+    (next_value,), = await fetch("SELECT nextValue FROM CodeSequences WHERE name = 'sku'")
+    assert next_value == 44
+
+
+async def test_concurrent_reservations_do_not_overlap(db, monkeypatch):
+    monkeypatch.setattr(codes, "CODE_BLOCK_SIZE", 7)
+    results = await asyncio.gather(*(codes.reserve("barcode", count) for count in (3, 11, 1, 20, 5) * 4))
+    serials = [serial for ranges in results for serial in itertools.chain(*ranges)]
+    assert len(serials) == len(set(serials)) == 4 * (3 + 11 + 1 + 20 + 5)
+
+
+async def test_prefetched_codes_need_no_round_trip(db):
+    reserved = await codes.prefetch(3)
+    before = sqlite_backend.round_trips()
+    barcodes = list(await codes.barcodes(3, reserved))
+    skus = list(await codes.skus(3, reserved))
+    assert sqlite_backend.round_trips() == before
+    assert len(set(barcodes)) == len(set(skus)) == 3
+    assert all(codes.is_valid_ean13(barcode) for barcode in barcodes)
+
+
+async def test_short_prefetch_reserves_the_rest(db):
+    reserved = await codes.prefetch(2)
+    barcodes = list(await codes.barcodes(5, reserved))
+    assert len(set(barcodes)) == 5
+    # the prefetched ones come first
+    assert [codes.format_barcode(serial) for serial in (1, 2)] == barcodes[:2]
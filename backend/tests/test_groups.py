@@ -0,0 +1,106 @@
+import pytest
+import groups
+from conftest import execute, fetch
+
+pytestmark = pytest.mark.anyio
+
+
+def test_normalize():
+    assert groups.normalize("  Classic\tOXFORD  0 ") == "classic oxford 0"
+    # composed accents, compatibility forms
+    assert groups.normalize("Cafe\u0301") == groups.normalize("Caf\u00e9")
+    assert groups.normalize("ﬁne") == "fine"
+    assert groups.normalize(None) == ""
+
+
+def test_group_key():
+    assert groups.group_key("Classic Oxford", "Men's Leather Shoes") == \
+        groups.group_key(" classic  OXFORD", "men's leather shoes")
+    assert groups.group_key("Classic Oxford", "Men's Leather Shoes") != \
+        groups.group_key("Classic Oxford", "Women's Leather Shoes")
+    assert groups.group_key("a b", "c") != groups.group_key("a", "b c")
+
+
+def test_size_key():
+    assert groups.size_key(" 42 ") == "42"
+    assert groups.size_key("EU 42") == groups.size_key("eu  42")
+    assert groups.size_key(None) is None
+
+
+async def _group():
+    (group_id, name, category), = await fetch(
+        "SELECT productGroupID, productName, category FROM ProductGroups WHERE productGroupID = 1")
+    product_ids = [row[0] for row in await fetch(
+        "SELECT productID FROM Products WHERE productGroupID = ? ORDER BY productID", (group_id,))]
+    return group_id, name, category, product_ids
+
+
+async def _matching(where, params):
+    return [row[0] for row in await fetch(f"SELECT productID FROM Products WHERE {where} ORDER BY productID", params)]
+
+
+async def _drop_keys(product_ids):
+    # rows as written before the columns existed
+    marks = ", ".join("?" * len(product_ids))
+    await execute(f"UPDATE Products SET productGroupID = NULL, sizeKey = NULL WHERE productID IN ({marks})",
+                  product_ids)
+
+
+async def test_group_filter_matches_rows_without_keys_before_the_backfill(db):
+    group_id, name, category, product_ids = await _group()
+    await _drop_keys(product_ids[::2])
+
+    assert await _matching(*groups.group_filter(group_id)) == product_ids
+    assert await _matching(*groups.group_filter(name=name, category=category)) == product_ids
+    # keyed rows match on the normalised key, rows without keys only on the name as stored
+    assert await _matching(*groups.group_filter(name=name.upper(), category=category)) == product_ids[1::2]
+
+
+async def test_group_filter_after_the_backfill(db):
+    group_id, name, category, product_ids = await _group()
+    await _drop_keys(product_ids[::2])
+    assert await groups.backfill() == len(product_ids[::2])
+    assert groups._backfilled
+
+    where, params = groups.group_filter(group_id, alias="p.")
+    assert (where, params) == ("p.productGroupID = ?", (group_id,))
+    assert await _matching(*groups.group_filter(group_id)) == product_ids
+    where, params = groups.group_filter(name=name.upper(), category=category)
+    assert params == (groups.group_key(name, category),)
+    assert await _matching(where, params) == product_ids
+
+
+async def test_size_filter_before_and_after_the_backfill(db):
+    group_id, _, _, product_ids = await _group()
+    await _drop_keys(product_ids)
+    in_group, group_params = groups.group_filter(group_id)
+    where, params = groups.size_filter("36")
+    assert len(await _matching(f"{in_group} AND {where}", group_params + params)) == 1
+
+    await groups.backfill()
+    in_group, group_params = groups.group_filter(group_id)
+    where, params = groups.size_filter(" 36 ")
+    assert (where, params) == ("sizeKey = ?", ("36",))
+    assert len(await _matching(f"{in_group} AND {where}", group_params + params)) == 1
+
+
+async def test_backfill_touches_updated_at(db):
+    _, _, _, product_ids = await _group()
+    await execute("UPDATE Products SET updatedAt = '2000-01-01 00:00:00'")
+    await _drop_keys(product_ids)
+    await groups.backfill()
+    stale = await fetch("SELECT productID FROM Products WHERE updatedAt = '2000-01-01 00:00:00' ORDER BY productID")
+    # only the rows it keyed moved, so the search sync picks exactly those up
+    assert len(stale) == (await fetch("SELECT COUNT(*) FROM Products"))[0][0] - len(product_ids)
+    assert not set(product_ids) & {row[0] for row in stale}
+
+
+async def test_complete_runs_the_backfill_once(db):
+    _, _, _, product_ids = await _group()
+    await _drop_keys(product_ids)
+    await groups.complete()
+    assert (await fetch("SELECT COUNT(*) FROM Products WHERE productGroupID IS NULL OR sizeKey IS NULL"))[0][0] == 0
+    # finished in this process: later rows without keys are left to the next startup
+    await _drop_keys(product_ids[:1])
+    await groups.complete()
+    assert (await fetch("SELECT COUNT(*) FROM Products WHERE productGroupID IS NULL"))[0][0] == 1
@@ -0,0 +1,55 @@
+import pytest
+import database
+import outbox
+from conftest import execute
+
+pytestmark = pytest.mark.anyio
+
+
+async def _enqueue(*order_ids):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        for order_id in order_ids:
+            await outbox.enqueue(cursor, order_id, "order.status", f"/orders/{order_id}", {"orderID": order_id})
+        await conn.commit()
+
+
+async def _claimed():
+    events = await outbox._claim()
+    # released again, so the next claim sees every row as due
+    await execute("UPDATE ImsOutbox SET lockedUntil = NULL, claimToken = NULL")
+    return [(event[0], event[1]) for event in events]
+
+
+async def test_only_the_oldest_unsent_event_of_an_order_is_claimed(db):
+    await _enqueue(1, 1, 2, 1, 2)
+    assert await _claimed() == [(1, 1), (3, 2)]
+
+    await execute("UPDATE ImsOutbox SET status = 'sent' WHERE eventID = 1")
+    assert await _claimed() == [(2, 1), (3, 2)]
+
+    await execute("UPDATE ImsOutbox SET status = 'sent' WHERE eventID IN (2, 3)")
+    assert await _claimed() == [(4, 1), (5, 2)]
+
+
+async def test_a_failed_event_holds_back_its_order(db):
+    await _enqueue(1, 1, 2)
+    await execute("UPDATE ImsOutbox SET status = 'failed' WHERE eventID = 1")
+    assert await _claimed() == [(3, 2)]
+
+    assert await outbox.retry(1)
+    assert not await outbox.retry(1)
+    assert await _claimed() == [(1, 1), (3, 2)]
+
+
+async def test_an_event_waiting_for_its_retry_holds_back_its_order(db):
+    await _enqueue(1, 1)
+    await execute("UPDATE ImsOutbox SET nextAttemptAt = '2999-01-01 00:00:00' WHERE eventID = 1")
+    assert await _claimed() == []
+
+
+async def test_a_claimed_batch_is_leased(db):
+    await _enqueue(1, 2)
+    assert len(await outbox._claim()) == 2
+    # another worker finds the rows locked until the lease runs out
+    assert await outbox._claim() == []
@@ -0,0 +1,64 @@
+import json
+import pytest
+from fastapi import HTTPException
+import database
+import pagination
+from conftest import fetch
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("keys", [(1,), (0,), (2 ** 40,), (7, 3), (12, 0, 99)])
+def test_cursor_round_trip(keys):
+    cursor = pagination.encode_cursor(*keys)
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor, len(keys)) == keys
+
+
+@pytest.mark.parametrize("cursor, size", [
+    ("", 1),
+    ("not a cursor!", 1),
+    (pagination.encode_cursor(1, 2), 1),
+    (pagination.encode_cursor(1), 2),
+    ("bm9wZQ", 1),  # "nope"
+])
+def test_bad_cursor_is_a_400(cursor, size):
+    with pytest.raises(HTTPException) as raised:
+        pagination.decode_cursor(cursor, size)
+    assert raised.value.status_code == 400
+
+
+async def _page(limit, after):
+    async with database.connection() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute(
+            '''SELECT TOP (?) productID, productName, size
+               FROM Products
+               WHERE productID > ?
+               ORDER BY productID''',
+            (limit + 1, after)
+        )
+        response = await pagination.fetch_page(cursor, limit, ["productID"])
+    return json.loads(response.body)
+
+
+async def test_pages_cover_every_row_once(db):
+    expected = [row[0] for row in await fetch("SELECT productID FROM Products ORDER BY productID")]
+    seen, after, pages = [], 0, 0
+    while True:
+        page = await _page(30, after)
+        pages += 1
+        seen.extend(item["productID"] for item in page["items"])
+        if page["nextCursor"] is None:
+            break
+        after, = pagination.decode_cursor(page["nextCursor"], 1)
+        assert after == seen[-1]
+    assert seen == expected
+    assert pages == -(-len(expected) // 30)
+
+
+async def test_exact_last_page_has_no_cursor(db):
+    count = len(await fetch("SELECT productID FROM Products"))
+    page = await _page(count, 0)
+    assert len(page["items"]) == count
+    assert page["nextCursor"] is None
@@ -0,0 +1,46 @@
+import pytest
+from backends.sqlite import _move_top, translate
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT TOP (?) a FROM t WHERE b = ?", ("SELECT a FROM t WHERE b = ? LIMIT ?", 0)),
+    ("SELECT TOP 5 a FROM t", ("SELECT a FROM t LIMIT 5", None)),
+    ("SELECT TOP (10) a FROM t;", ("SELECT a FROM t LIMIT 10", None)),
+    ("select distinct top (?) a, b from t", ("select distinct a, b from t LIMIT ?", 0)),
+    ("  SELECT TOP (?) a FROM t", ("  SELECT a FROM t LIMIT ?", 0)),
+    # only a leading TOP is rewritten
+    ("SELECT a FROM t WHERE x IN (SELECT TOP 1 b FROM u)", ("SELECT a FROM t WHERE x IN (SELECT TOP 1 b FROM u)", None)),
+])
+def test_top(sql, expected):
+    assert translate(sql) == expected
+
+
+def test_top_parameter_moves_last():
+    sql, top_param = translate("SELECT TOP (?) a FROM t WHERE b = ? AND c = ?")
+    assert _move_top([10, "b", "c"], top_param) == ["b", "c", 10]
+    assert _move_top([1, 2], None) == [1, 2]
+
+
+def test_output_becomes_returning():
+    sql, _ = translate("INSERT INTO t (a, b) OUTPUT inserted.id, inserted.a VALUES (?, ?)")
+    assert sql == "INSERT INTO t (a, b) VALUES (?, ?) RETURNING id, a"
+    sql, _ = translate("UPDATE s SET v = v + ? OUTPUT inserted.v WHERE name = ?")
+    assert sql == "UPDATE s SET v = v + ? WHERE name = ? RETURNING v"
+
+
+def test_output_deleted_is_refused():
+    with pytest.raises(NotImplementedError):
+        translate("DELETE FROM t OUTPUT deleted.id WHERE a = ?")
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("UPDATE t SET at = SYSUTCDATETIME()", "UPDATE t SET at = CURRENT_TIMESTAMP"),
+    ("SELECT GETDATE(), getutcdate()", "SELECT CURRENT_TIMESTAMP, CURRENT_TIMESTAMP"),
+    ("SELECT ISNULL(a, 0), LEN(b) FROM t", "SELECT IFNULL(a, 0), LENGTH(b) FROM t"),
+    ("SELECT CAST(a AS NVARCHAR(MAX)) FROM t", "SELECT CAST(a AS TEXT) FROM t"),
+    ("SELECT SCOPE_IDENTITY()", "SELECT last_insert_rowid()"),
+    # names that merely contain a keyword stay as they are
+    ("SELECT lengthCm, isnullable FROM t", "SELECT lengthCm, isnullable FROM t"),
+])
+def test_rewrites(sql, expected):
+    assert translate(sql)[0] == expected
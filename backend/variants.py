@@ -0,0 +1,90 @@
+import functools
+import logging
+import os
+import time
+import codes
+import inventory
+import metrics
+
+# Bulk variant creation
+#
+# Adding stock creates one ProductVariants row per unit. Rows are inserted
+# with multi-row INSERT ... VALUES statements of VARIANT_INSERT_BATCH rows,
+# one round trip per batch instead of one per unit (which is what
+# executemany costs over pyodbc without fast_executemany), and the product's
+# available count is raised once for the whole batch. Everything runs in the
+# caller's transaction, so the variants appear all at once or not at all.
+# Barcodes and SKUs come from the block allocator in codes.py; callers pass
+# the codes they prefetched before opening the transaction as `reserved`.
+
+VARIANT_INSERT_BATCH = int(os.getenv("VARIANT_INSERT_BATCH", 500))  # rows per INSERT; 3 parameters a row, SQL Server allows 2100
+VARIANT_PROGRESS_EVERY = int(os.getenv("VARIANT_PROGRESS_EVERY", 10000))  # log progress of large creations every this many rows
+
+
+@functools.lru_cache(maxsize=8)
+def _insert_sql(rows):
+    # full batches reuse one statement text, so the server reuses its plan
+    return ("INSERT INTO ProductVariants (barcode, productCode, productID, updatedAt) VALUES "
+            + ", ".join(["(?, ?, ?, SYSUTCDATETIME())"] * rows))
+
+
+async def create_variants(cursor, product_id, quantity, add_stock=False, progress=None, reserved=None):
+    """Insert `quantity` new available variants of a product; returns how many were created.
+
+    The product's availableQuantity is raised to match (and currentStock too
+    with add_stock). progress(done, total) is called after every batch.
+    `reserved` is the codes.prefetch() result to draw the codes from.
+    """
+    started = time.perf_counter()
+    report_at = VARIANT_PROGRESS_EVERY
+    barcodes = await codes.barcodes(quantity, reserved)
+    skus = await codes.skus(quantity, reserved)
+    done = 0
+    while done < quantity:
+        size = min(VARIANT_INSERT_BATCH, quantity - done)
+        params = []
+        for _ in range(size):
+            params += (next(barcodes), next(skus), product_id)
+        await cursor.execute(_insert_sql(size), params)
+        done += size
+        if progress is not None:
+            progress(done, quantity)
+        if done >= report_at and done < quantity:
+            logging.info(f"Creating variants of product {product_id}: {done}/{quantity}")
+            report_at += VARIANT_PROGRESS_EVERY
+    if quantity > 0:
+        await inventory.adjust_available(cursor, product_id, quantity, stock_delta=quantity if add_stock else 0)
+    metrics.VARIANTS_CREATED.inc(quantity)
+    if quantity >= VARIANT_PROGRESS_EVERY:
+        elapsed = time.perf_counter() - started
+        logging.info(f"Created {quantity} variants of product {product_id} in {elapsed:.2f}s "
+                     f"({quantity / elapsed:.0f} rows/s)")
+    return quantity
+
+
+async def create_many(cursor, quantities, add_stock=False, reserved=None):
+    """create_variants() for many products: `quantities` maps productID to quantity.
+
+    Variants of different products share the INSERT batches, and the
+    availability counts are raised with inventory.adjust_available_many().
+    Returns how many variants were created.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    total = sum(quantities.values())
+    if not total:
+        return 0
+    barcodes = await codes.barcodes(total, reserved)
+    skus = await codes.skus(total, reserved)
+    params, size = [], 0
+    for product_id, quantity in quantities.items():
+        for _ in range(quantity):
+            params += (next(barcodes), next(skus), product_id)
+            size += 1
+            if size == VARIANT_INSERT_BATCH:
+                await cursor.execute(_insert_sql(size), params)
+                params, size = [], 0
+    if size:
+        await cursor.execute(_insert_sql(size), params)
+    await inventory.adjust_available_many(cursor, quantities, add_stock)
+    metrics.VARIANTS_CREATED.inc(total)
+    return total
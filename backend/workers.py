@@ -0,0 +1,41 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+
+# Process pool for CPU-bound work
+#
+# Image work (barcode labels, product image renditions) would block the event
+# loop for tens of milliseconds per item, so it runs in a shared pool of
+# WORKER_PROCESSES processes, started on first use and shut down with the
+# app. Functions passed to run() must be importable module-level functions.
+# WORKER_PROCESSES=0 runs them in a thread instead (e.g. where the platform
+# does not allow extra processes).
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", min(4, os.cpu_count() or 1)))
+
+_pool = None
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent has database and event loop threads running
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def run(fn, *args):
+    """Run fn(*args) in the worker pool and return its result."""
+    if WORKER_PROCESSES <= 0:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool(), fn, *args)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None